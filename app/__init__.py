@@ -1,21 +1,24 @@
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
 from flask_jwt_extended import JWTManager
-from flask_bcrypt import Bcrypt
 from config import config
+from .util.database import SQLAlchemy
+from .util.revocation import RevokedTokens
+from .util.hashing import PasswordHasher
+from .util.metrics import RequestMetrics
 
 db = SQLAlchemy()
 ma = Marshmallow()
-bcrypt = Bcrypt()
+hasher = PasswordHasher()
 jwt = JWTManager()
+revoked_tokens = RevokedTokens()
+request_metrics = RequestMetrics()
 
 
 @jwt.token_in_blacklist_loader
 def check_if_token_in_blacklist(decrypted_token):
     jti = decrypted_token['jti']
-    from .auth.model.blacklist_token import BlacklistToken
-    return BlacklistToken.is_jti_blacklisted(jti)
+    return revoked_tokens.is_revoked(jti)
 
 
 def create_app(config_name):
@@ -23,10 +26,13 @@ def create_app(config_name):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
 
+    # First, so that the timing covers the other before_request functions
+    request_metrics.init_app(app)
     db.init_app(app)
     ma.init_app(app)
-    bcrypt.init_app(app)
+    hasher.init_app(app)
     jwt.init_app(app)
+    revoked_tokens.init_app(app)
 
     from .main import main as main_bp
     app.register_blueprint(main_bp)
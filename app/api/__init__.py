@@ -1,8 +1,16 @@
 from flask import Blueprint
 from flask_cors import CORS
 from flask_restful import Api
-from .resources.books import BookListResource, BookResource
-from .resources.authors import AuthorListResource, AuthorResource
+from .resources.books import (
+    BookListResource,
+    BookResource,
+    BookIsbnResource,
+    BookExportResource,
+    BookBulkResource,
+    AuthorBookListResource,
+)
+from .resources.authors import AuthorListResource, AuthorResource, AuthorExportResource, BookAuthorListResource
+from .resources.batch import BatchResource
 
 api_bp = Blueprint('api', __name__)
 api = Api(api_bp)
@@ -11,5 +19,12 @@ cors = CORS(api_bp, resources={r"/api/*": {"origins": "*"}})
 
 api.add_resource(AuthorListResource, '/authors/')
 api.add_resource(AuthorResource, '/authors/<int:id>')
+api.add_resource(AuthorExportResource, '/authors/export')
+api.add_resource(AuthorBookListResource, '/authors/<int:id>/books/')
 api.add_resource(BookListResource, '/books/')
 api.add_resource(BookResource, '/books/<int:id>')
+api.add_resource(BookExportResource, '/books/export')
+api.add_resource(BookBulkResource, '/books/bulk')
+api.add_resource(BookIsbnResource, '/books/isbn/<int:isbn>')
+api.add_resource(BookAuthorListResource, '/books/<int:id>/authors/')
+api.add_resource(BatchResource, '/batch')
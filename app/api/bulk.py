@@ -0,0 +1,108 @@
+import json
+from flask import request, url_for
+from .model.book import Book, BookSchema, book_author
+from .model.author import Author
+from app.util import status
+from app import db
+
+book_schema = BookSchema()
+
+
+class BulkPayloadError(ValueError):
+    """Raised when the body of a bulk request can not be parsed"""
+
+
+def read_items():
+    """Reads the items of a bulk request from a JSON array or an NDJSON body"""
+    if request.mimetype == 'application/x-ndjson':
+        items = []
+        for number, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                raise BulkPayloadError('Line {} is not a valid JSON'.format(number))
+        return items
+
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        raise BulkPayloadError('Request body must be a JSON array or NDJSON')
+
+    return items
+
+
+def _failed(index, errors):
+    return {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': errors}
+
+
+def _created(index, book_id):
+    return {
+        'index': index,
+        'status': status.HTTP_201_CREATED,
+        'id': book_id,
+        'url': url_for('api.bookresource', id=book_id, _external=True),
+    }
+
+
+def import_books(items):
+    """Validates and inserts a list of books, returns a result per item.
+
+    Whatever the number of items, the import costs a fixed number of
+    statements: one validation pass, set-based lookups of the ISBNs and
+    of the authors, and executemany INSERTs for the authors, the books
+    and the links between them. The caller commits.
+    """
+    results = [None] * len(items)
+
+    books = {}
+    for index, item in enumerate(items):
+        if isinstance(item, dict):
+            books[index] = item
+        else:
+            results[index] = _failed(index, {'_schema': ['Invalid input type.']})
+
+    indexes = sorted(books)
+    validate_errors = book_schema.validate([books[index] for index in indexes], many=True)
+    for position, index in enumerate(indexes):
+        if validate_errors.get(position):
+            results[index] = _failed(index, validate_errors[position])
+            del books[index]
+
+    # ISBNs taken by existing books or by the previous items of the payload
+    existing_isbns = Book.find_ids({int(book['isbn']) for book in books.values()})
+    seen_isbns = set()
+    for index in sorted(books):
+        isbn = int(books[index]['isbn'])
+        if isbn in existing_isbns or isbn in seen_isbns:
+            results[index] = _failed(index, {'error': 'A book with the same ISBN already exists'})
+            del books[index]
+        seen_isbns.add(isbn)
+
+    if not books:
+        return results
+
+    names = {(author['firstname'], author['lastname'])
+             for book in books.values() for author in book.get('authors', [])}
+    author_ids = Author.resolve_ids(names)
+
+    rows = [{
+        'title': book['title'],
+        'isbn': int(book['isbn']),
+        'year': book.get('year'),
+    } for book in books.values()]
+    db.session.execute(Book.__table__.insert(), rows)
+
+    book_ids = Book.find_ids(row['isbn'] for row in rows)
+
+    links = []
+    for index, book in books.items():
+        book_id = book_ids[int(book['isbn'])]
+        book_authors = {author_ids[(author['firstname'], author['lastname'])] for author in book.get('authors', [])}
+        links.extend({'book_id': book_id, 'author_id': author_id} for author_id in book_authors)
+        results[index] = _created(index, book_id)
+
+    if links:
+        db.session.execute(book_author.insert(), links)
+
+    return results
@@ -0,0 +1,87 @@
+from functools import wraps
+from flask import Response, current_app, g, request
+from flask_restful.representations.json import output_json
+from flask_restful.utils import unpack
+from werkzeug.http import unquote_etag
+from .model.table_version import TableVersion
+from .etag import is_not_modified
+from app.util import status
+from app.util.cache import SizedLRUCache
+
+# Rough per entry cost of the key, the headers and the bookkeeping
+ENTRY_OVERHEAD = 512
+
+
+def get_response_cache():
+    cache = current_app.extensions.get('response_cache')
+    if cache is None:
+        cache = SizedLRUCache(current_app.config['API_CACHE_MAX_BYTES'])
+        current_app.extensions['response_cache'] = cache
+
+    return cache
+
+
+def get_table_versions(*tables):
+    """TableVersion.get_versions, read once per request"""
+    versions = getattr(g, 'table_versions', None)
+    if versions is None:
+        versions = g.table_versions = {}
+
+    missing = [table for table in tables if table not in versions]
+    if missing:
+        versions.update(zip(missing, TableVersion.get_versions(*missing)))
+
+    return tuple(versions[table] for table in tables)
+
+
+def cache_key(url_root, endpoint, view_args, query_string, versions):
+    """The key of the cached response, also built by app/asgi.py.
+
+    The bodies hold external URLs, built from the scheme and the Host of
+    the request: the root URL is part of the key.
+    """
+    return url_root, endpoint, tuple(sorted(view_args.items())), query_string, versions
+
+
+def cached_response(*tables):
+    """Caches the serialized 200 responses of a GET handler.
+
+    Entries are keyed by the request and the current versions of `tables`.
+    Every write bumps the versions of the tables it changes, so the entries
+    made before it are never hit again and age out of the LRU.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not current_app.config['API_CACHE_MAX_BYTES']:
+                return func(*args, **kwargs)
+
+            cache = get_response_cache()
+            key = cache_key(request.url_root, request.endpoint, kwargs, request.query_string,
+                            get_table_versions(*tables))
+
+            entry = cache.get(key)
+            if entry is not None:
+                body, headers = entry
+                etag, _ = unquote_etag(headers.get('ETag'))
+                if etag and is_not_modified(etag):
+                    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': headers['ETag']})
+                return Response(body, headers=headers)
+
+            resp = func(*args, **kwargs)
+            if isinstance(resp, Response):
+                return resp
+
+            data, code, headers = unpack(resp)
+            resp = output_json(data, code, headers)
+            if code == status.HTTP_200_OK:
+                headers = {name: value for name, value in resp.headers.items() if name != 'Content-Length'}
+                body = resp.get_data()
+                cache.set(key, (body, headers), len(body) + ENTRY_OVERHEAD)
+
+            return resp
+
+        # Read by the ASGI mode to serve the entries without the handler
+        wrapper.cached_tables = tables
+        return wrapper
+    return decorator
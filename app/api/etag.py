@@ -0,0 +1,23 @@
+import hashlib
+from flask import Response, request
+from werkzeug.http import quote_etag
+from app.util import status
+
+
+def make_etag(*parts):
+    """Hashes the parts of a representation version into an entity tag"""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def is_not_modified(etag):
+    # If-None-Match always uses the weak comparison (RFC 7232, 3.2)
+    return request.if_none_match.contains_weak(etag)
+
+
+def etag_headers(etag, weak=False):
+    return {'ETag': quote_etag(etag, weak)}
+
+
+def not_modified(etag, weak=False):
+    """Makes an empty 304 response, the serialization of the resource is skipped"""
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag, weak))
@@ -0,0 +1,57 @@
+import json
+from flask import Response, current_app, stream_with_context
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+def iter_batches(query, column):
+    """Yields the rows of the query in batches of API_EXPORT_BATCH_SIZE.
+
+    Every batch is a separate keyset query (`column > last ORDER BY column
+    LIMIT n`), so only one batch is held in memory at a time and the
+    relationships of a whole batch are loaded together.
+    """
+    batch_size = current_app.config['API_EXPORT_BATCH_SIZE']
+    last = None
+
+    while True:
+        batch_query = query if last is None else query.filter(column > last)
+        batch = batch_query.order_by(column).limit(batch_size).all()
+
+        if batch:
+            last = getattr(batch[-1], column.key)
+            yield batch
+
+        if len(batch) < batch_size:
+            return
+
+
+def _generate_ndjson(batches, serializer):
+    for batch in batches:
+        items = serializer.dump(batch)
+        yield ''.join(json.dumps(item) + '\n' for item in items)
+
+
+def _generate_json(batches, serializer):
+    yield '['
+    separator = ''
+    for batch in batches:
+        items = serializer.dump(batch)
+        yield separator + ','.join(json.dumps(item) for item in items)
+        separator = ','
+    yield ']\n'
+
+
+def stream_export(query, column, serializer, export_format):
+    """Makes a chunked response serializing the rows of the query one batch at a time"""
+    if export_format == 'json':
+        generate = _generate_json
+    else:
+        generate = _generate_ndjson
+
+    body = generate(iter_batches(query, column), serializer)
+
+    return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[export_format])
@@ -0,0 +1,94 @@
+import re
+from flask import current_app, request
+from marshmallow import fields
+
+_nested_param = re.compile(r'^fields\[(.*)\]$')
+
+
+class FieldsetError(ValueError):
+    """Raised when the requested fields or relationships are not the ones of the resource"""
+
+
+def _dump_fields(schema):
+    return [name for name, field in schema.fields.items() if not field.load_only]
+
+
+def _nested_fields(schema):
+    return {name: field for name, field in schema.fields.items() if isinstance(field, fields.Nested)}
+
+
+def _split(value, schema, param):
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    if not names:
+        raise FieldsetError("'{}' must list at least one field".format(param))
+
+    available = _dump_fields(schema)
+    for name in names:
+        if name not in available:
+            raise FieldsetError("Unknown field '{}'".format(name))
+
+    return names
+
+
+def parse_fields(schema):
+    """Reads the fields requested with `fields=title,isbn` and with
+    `fields[<relationship>]=lastname` for the nested resources.
+
+    Returns the `only` argument of the schema, None when every field is requested.
+    """
+    nested = _nested_fields(schema)
+
+    only = None
+    if 'fields' in request.args:
+        only = _split(request.args['fields'], schema, 'fields')
+
+    for param, value in request.args.items():
+        match = _nested_param.match(param)
+        if match is None:
+            continue
+
+        name = match.group(1)
+        if name not in nested:
+            raise FieldsetError("Unable to select the fields of '{}'".format(name))
+
+        nested_names = _split(value, nested[name].schema, param)
+        if only is None:
+            only = _dump_fields(schema)
+        if name in only:
+            only.extend('{}.{}'.format(name, nested_name) for nested_name in nested_names)
+
+    return tuple(sorted(only)) if only is not None else None
+
+
+def parse_embed(schema):
+    """Reads the relationships to embed from `embed=books` (`embed=none` for none of them).
+
+    Returns None when every relationship is embedded, the default.
+    """
+    if 'embed' not in request.args:
+        return None
+
+    names = [name.strip() for name in request.args['embed'].split(',') if name.strip()]
+    if names == ['none']:
+        return frozenset()
+
+    nested = _nested_fields(schema)
+    for name in names:
+        if name not in nested:
+            raise FieldsetError("Unable to embed '{}'".format(name))
+
+    return frozenset(names)
+
+
+def select_serializer(serializer):
+    """The serializer of the representation requested with `fields` and `embed`.
+
+    Only the requested fields are selected and serialized. The relationships
+    that are not embedded are serialized as lists of ids, at most
+    API_EMBED_LIMIT related records are returned per record in both cases,
+    the `<relationship>_url` field links to all of them.
+    """
+    only = parse_fields(serializer.schema)
+    embed = parse_embed(serializer.schema)
+
+    return serializer.select(only, embed, current_app.config['API_EMBED_LIMIT'])
@@ -0,0 +1,30 @@
+from flask import request
+
+
+class FilterError(ValueError):
+    """Raised when the filter arguments of a request are invalid"""
+
+
+def get_int_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+
+    try:
+        return int(value)
+    except ValueError:
+        raise FilterError("'{}' must be an integer".format(name))
+
+
+def apply_filters(query, filters):
+    """Filters the query by the integer request arguments named in `filters`.
+
+    `filters` maps the argument names to functions making the criterion
+    from the value. Only the arguments of the allowlist are applied.
+    """
+    for name, criterion in filters.items():
+        value = get_int_arg(name)
+        if value is not None:
+            query = query.filter(criterion(value))
+
+    return query
@@ -1,13 +1,37 @@
 from marshmallow import fields
+from sqlalchemy import tuple_
 from app import db, ma
+from app.util.chunks import chunked
+from app.util.upsert import upsert, excluded
+from ..etag import make_etag
+
+# (firstname, lastname) pairs per IN clause, two bound parameters each
+NAMES_CHUNK_SIZE = 400
 
 
 class Author(db.Model):
     __tablename__ = 'authors'
+    __table_args__ = (
+        # The conflict target of the author upserts
+        db.Index('ix_authors_lastname_firstname', 'lastname', 'firstname', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     lastname = db.Column(db.String(40), nullable=False)
     firstname = db.Column(db.String(20), nullable=False)
+    # Bumped by every update of the author. The UPDATEs check the version they
+    # replace, a concurrent update of the same version fails with StaleDataError
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version, 'version_id_generator': False}
+
+    @staticmethod
+    def make_etag(author, books):
+        """Changes whenever the representation of the author (including its books) changes.
+
+        Takes Author and Book instances as well as rows with `id` and `version` columns.
+        """
+        return make_etag('author', author.id, author.version,
+                         sorted((book.id, book.version) for book in books))
 
     @classmethod
     def is_unique(cls, id, firstname, lastname):
@@ -20,10 +44,58 @@ class Author(db.Model):
         else:
             return False
 
+    @classmethod
+    def find_ids(cls, names):
+        """Returns a dict mapping (firstname, lastname) pairs to author ids"""
+        ids = {}
+        for chunk in chunked(names, NAMES_CHUNK_SIZE):
+            query = db.session.query(cls.id, cls.firstname, cls.lastname).filter(
+                tuple_(cls.firstname, cls.lastname).in_(chunk)
+            )
+            for author_id, firstname, lastname in query:
+                ids[(firstname, lastname)] = author_id
+
+        return ids
+
+    @classmethod
+    def resolve_ids(cls, names):
+        """Same as find_ids, but the missing authors are created first
+        with a single executemany INSERT.
+
+        An author created meanwhile by another request makes the INSERT
+        raise IntegrityError, the caller can run its transaction again.
+        """
+        names = set(names)
+        ids = cls.find_ids(names)
+
+        missing = names.difference(ids)
+        if missing:
+            rows = [{'firstname': firstname, 'lastname': lastname} for firstname, lastname in missing]
+            db.session.execute(cls.__table__.insert(), rows)
+            ids.update(cls.find_ids(missing))
+
+        return ids
+
+    @classmethod
+    def get_or_create(cls, firstname, lastname):
+        """Returns the id and the version of the author, created when missing,
+        with a single INSERT ... ON CONFLICT"""
+        table = cls.__table__
+        statement = upsert(
+            table, ('firstname', 'lastname'), ('lastname', 'firstname'),
+            # A no-op update, so that the existing row is returned
+            set_={'lastname': excluded(table).c.lastname},
+            returning=(table.c.id, table.c.version),
+        )
+        return db.session.execute(statement, {'firstname': firstname, 'lastname': lastname}).first()
+
 
 class AuthorSchema(ma.ModelSchema):
-    books = fields.Nested('BookSchema', many=True, exclude=('authors',))
+    books = fields.Nested('BookSchema', many=True, exclude=('authors', 'authors_url'))
     url = ma.URLFor('api.authorresource', id='<id>', _external=True)
+    # All the books, the embedded ones are capped by API_EMBED_LIMIT
+    books_url = ma.URLFor('api.authorbooklistresource', id='<id>', _external=True)
 
     class Meta:
         model = Author
+        exclude = ('version',)
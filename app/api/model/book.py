@@ -1,11 +1,18 @@
 from marshmallow import fields
 from app import db, ma
+from app.util.chunks import chunked
+from app.util.upsert import upsert, excluded
+from ..etag import make_etag
 from .author import AuthorSchema
 
+ISBN_CHUNK_SIZE = 500
+
 
 book_author = db.Table('book_author',
                        db.Column('author_id', db.Integer, db.ForeignKey('authors.id'), primary_key=True),
                        db.Column('book_id', db.Integer, db.ForeignKey('books.id'), primary_key=True),
+                       # The primary key only serves the lookups by author
+                       db.Index('ix_book_author_book_id', 'book_id'),
                        )
 
 
@@ -13,11 +20,27 @@ class Book(db.Model):
     __tablename__ = 'books'
 
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(255), nullable=False)
+    title = db.Column(db.String(255), nullable=False, index=True)
     isbn = db.Column(db.BigInteger, unique=True, nullable=False)
-    year = db.Column(db.Integer)
-    authors = db.relationship('Author', secondary=book_author, lazy='subquery',
-                              backref=db.backref('books', lazy=True))
+    year = db.Column(db.Integer, index=True)
+    # Bumped by every update of the book. The UPDATEs check the version they
+    # replace, a concurrent update of the same version fails with StaleDataError
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version, 'version_id_generator': False}
+    # Both sides load lazily by default, every resource picks
+    # the eager loading strategy that fits its query.
+    # Both are ordered by id, like the rows of the compiled serializers
+    authors = db.relationship('Author', secondary=book_author, lazy='select', order_by='Author.id',
+                              backref=db.backref('books', lazy='select', order_by='Book.id'))
+
+    @staticmethod
+    def make_etag(book, authors):
+        """Changes whenever the representation of the book (including its authors) changes.
+
+        Takes Book and Author instances as well as rows with `id` and `version` columns.
+        """
+        return make_etag('book', book.id, book.version,
+                         sorted((author.id, author.version) for author in authors))
 
     @classmethod
     def is_unique(cls, id, isbn):
@@ -30,10 +53,42 @@ class Book(db.Model):
         else:
             return False
 
+    @classmethod
+    def find_ids(cls, isbns):
+        """Returns a dict mapping ISBNs to the ids of the existing books"""
+        ids = {}
+        for chunk in chunked(isbns, ISBN_CHUNK_SIZE):
+            query = db.session.query(cls.id, cls.isbn).filter(cls.isbn.in_(chunk))
+            for book_id, isbn in query:
+                ids[isbn] = book_id
+
+        return ids
+
+    @classmethod
+    def upsert(cls, isbn, title, year):
+        """Creates the book with this ISBN or updates it, with a single INSERT ... ON CONFLICT.
+
+        Returns its id and its version, 1 for a created book.
+        """
+        table = cls.__table__
+        statement = upsert(
+            table, ('isbn', 'title', 'year'), ('isbn',),
+            set_={
+                'title': excluded(table).c.title,
+                'year': excluded(table).c.year,
+                'version': table.c.version + 1,
+            },
+            returning=(table.c.id, table.c.version),
+        )
+        return db.session.execute(statement, {'isbn': isbn, 'title': title, 'year': year}).first()
+
 
 class BookSchema(ma.ModelSchema):
-    authors = fields.Nested(AuthorSchema, many=True, exclude=('books',))
+    authors = fields.Nested(AuthorSchema, many=True, exclude=('books', 'books_url'))
     url = ma.URLFor('api.bookresource', id='<id>', _external=True)
+    # All the authors, the embedded ones are capped by API_EMBED_LIMIT
+    authors_url = ma.URLFor('api.bookauthorlistresource', id='<id>', _external=True)
 
     class Meta:
         model = Book
+        exclude = ('version',)
@@ -0,0 +1,112 @@
+import re
+from sqlalchemy import DDL, event, func, literal_column, select, table, column
+from app import db
+from .book import Book, book_author
+from .author import Author
+
+# Weights of the title and of the author names in the bm25 rank
+TITLE_WEIGHT = 2.0
+AUTHORS_WEIGHT = 1.0
+
+books_fts = table('books_fts', column('rowid'), column('title'), column('authors'))
+
+create_books_fts = DDL(
+    "CREATE VIRTUAL TABLE books_fts USING fts5(title, authors, tokenize = 'unicode61 remove_diacritics 2')"
+)
+drop_books_fts = DDL('DROP TABLE IF EXISTS books_fts')
+
+# The index is an SQLite FTS5 virtual table, created and dropped with the books
+event.listen(Book.__table__, 'after_create', create_books_fts.execute_if(dialect='sqlite'))
+event.listen(Book.__table__, 'before_drop', drop_books_fts.execute_if(dialect='sqlite'))
+
+_word = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchError(ValueError):
+    """Raised when a search can not be run"""
+
+
+class BookSearch:
+    """Full-text index of the titles and of the author names of the books.
+
+    The rows of the index are updated with the books, in the same transaction,
+    by the handlers writing books and authors. On other databases than
+    SQLite the index does not exist and the updates are skipped.
+    """
+
+    @staticmethod
+    def is_available():
+        return db.engine.dialect.name == 'sqlite'
+
+    @classmethod
+    def _reindex(cls, book_ids):
+        if not cls.is_available():
+            return
+
+        db.session.flush()
+        db.session.execute(books_fts.delete().where(books_fts.c.rowid.in_(book_ids)))
+
+        names = func.group_concat(Author.firstname + ' ' + Author.lastname, ' ')
+        rows = select([Book.id, Book.title, names]) \
+            .select_from(Book.__table__.outerjoin(book_author).outerjoin(Author.__table__)) \
+            .where(Book.id.in_(book_ids)) \
+            .group_by(Book.id)
+        db.session.execute(books_fts.insert().from_select(['rowid', 'title', 'authors'], rows))
+
+    @classmethod
+    def index(cls, book_ids):
+        """Updates the index rows of the books, the missing books are removed"""
+        cls._reindex(list(book_ids))
+
+    @classmethod
+    def index_range(cls, first_id, last_id):
+        """Updates the index rows of the books with ids between first_id and last_id"""
+        cls._reindex(select([Book.id]).where(Book.id.between(first_id, last_id)))
+
+    @classmethod
+    def index_author(cls, author_id):
+        """Updates the index rows of the books of an author"""
+        cls._reindex(select([book_author.c.book_id]).where(book_author.c.author_id == author_id))
+
+    @classmethod
+    def remove(cls, book_ids):
+        if cls.is_available():
+            db.session.execute(books_fts.delete().where(books_fts.c.rowid.in_(list(book_ids))))
+
+    @classmethod
+    def rebuild(cls):
+        """Indexes all the books again, returns their number"""
+        if not cls.is_available():
+            raise SearchError('Full-text search requires SQLite')
+
+        db.session.execute(books_fts.delete())
+        cls._reindex(select([Book.id]))
+        return db.session.query(func.count(Book.id)).scalar()
+
+    @staticmethod
+    def match_expression(terms):
+        """Makes an FTS5 query matching all the words of `terms`, the last one as a prefix"""
+        words = _word.findall(terms)
+        if not words:
+            raise SearchError("'q' must contain at least one word")
+
+        phrases = ['"{}"'.format(word) for word in words]
+        phrases[-1] += '*'
+        return ' '.join(phrases)
+
+    @classmethod
+    def search(cls, query, terms):
+        """Restricts a query of books to the ones matching `terms`.
+
+        Returns the query and the bm25 rank of its rows, lower is better.
+        """
+        if not cls.is_available():
+            raise SearchError('Full-text search requires SQLite')
+
+        fts = literal_column('books_fts')
+        rank = func.bm25(fts, TITLE_WEIGHT, AUTHORS_WEIGHT).label('rank')
+
+        query = query.join(books_fts, books_fts.c.rowid == Book.id) \
+            .filter(fts.op('MATCH')(cls.match_expression(terms)))
+
+        return query, rank
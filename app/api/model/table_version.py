@@ -0,0 +1,30 @@
+from sqlalchemy import event
+from app import db
+
+# Tables whose collections are versioned as a whole
+VERSIONED_TABLES = ('authors', 'books', 'users')
+
+
+class TableVersion(db.Model):
+    """Counter bumped by every write to a table, used to version list representations"""
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def get_versions(cls, *names):
+        """Returns the versions of the tables in the order of `names`"""
+        versions = dict(db.session.query(cls.name, cls.version).filter(cls.name.in_(names)))
+        return tuple(versions.get(name, 0) for name in names)
+
+    @classmethod
+    def bump(cls, *names):
+        """Increments the versions of the tables in the current transaction"""
+        cls.query.filter(cls.name.in_(names)) \
+            .update({cls.version: cls.version + 1}, synchronize_session=False)
+
+
+@event.listens_for(TableVersion.__table__, 'after_create')
+def insert_table_versions(target, connection, **kwargs):
+    connection.execute(target.insert(), [{'name': name, 'version': 0} for name in VERSIONED_TABLES])
@@ -0,0 +1,55 @@
+from flask import current_app, request
+from app.util.chunks import chunked
+from app.util.serializer import IDS_CHUNK_SIZE
+
+
+class MultiGetError(ValueError):
+    """Raised when the ids of a multi-get request are invalid"""
+
+
+# The list arguments which do not apply to a multi-get
+LIST_ARGS = ('sort', 'limit', 'cursor')
+
+
+def parse_ids(exclusive=LIST_ARGS):
+    """Reads `ids=1,2,3`, at most API_MAX_PAGE_SIZE of them.
+
+    The arguments named in `exclusive` (sort, pagination, filters) would
+    be ignored, they are rejected.
+    """
+    conflicting = [name for name in exclusive if name in request.args]
+    if conflicting:
+        raise MultiGetError("'ids' can not be combined with {}".format(
+            ', '.join("'{}'".format(name) for name in conflicting)))
+
+    try:
+        ids = [int(value) for value in request.args['ids'].split(',') if value.strip()]
+    except ValueError:
+        raise MultiGetError("'ids' must be a comma separated list of integers")
+
+    if not ids:
+        raise MultiGetError("'ids' must list at least one id")
+
+    max_ids = current_app.config['API_MAX_PAGE_SIZE']
+    if len(ids) > max_ids:
+        raise MultiGetError("'ids' can list at most {} ids".format(max_ids))
+
+    return ids
+
+
+def not_found(id):
+    return {'id': id, 'error': 'Not found'}
+
+
+def dump_by_ids(serializer, column, ids):
+    """Serializes the rows of the ids in the order of `ids`.
+
+    The rows are selected with chunked IN queries and their relationships
+    are loaded once for all of them. The missing ids get a not found marker.
+    """
+    rows = []
+    for chunk in chunked(sorted(set(ids)), IDS_CHUNK_SIZE):
+        rows.extend(serializer.query().filter(column.in_(chunk)))
+
+    found = {getattr(row, column.key): item for row, item in zip(rows, serializer.dump(rows))}
+    return [found[id] if id in found else not_found(id) for id in ids]
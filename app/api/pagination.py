@@ -0,0 +1,215 @@
+import base64
+import json
+from flask import current_app, request
+from sqlalchemy import and_, or_, case, false
+from werkzeug.urls import url_encode
+
+
+# The databases sorting NULL before every value, as the order of the pages expects
+NULLS_FIRST_DIALECTS = ('sqlite', 'mysql')
+
+
+class PaginationError(ValueError):
+    """Raised when the pagination arguments of a request are invalid"""
+
+
+def encode_cursor(sort, values):
+    """Packs the sort order and the keys of the last row into an opaque token"""
+    raw = json.dumps([sort, values], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    padding = '=' * (-len(cursor) % 4)
+    try:
+        cursor_sort, values = json.loads(base64.urlsafe_b64decode(cursor + padding).decode())
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+    if cursor_sort != sort or not isinstance(values, list):
+        raise PaginationError('Cursor does not match the sort order')
+
+    return values
+
+
+def parse_sort(sort, columns):
+    """Parses `sort=-isbn,title` into a list of (name, column, descending).
+
+    Only the columns from the `columns` allowlist may be used. The primary key
+    is always appended as the last key, so the order is total and a page
+    boundary can be described by the keys of a single row.
+    """
+    order = []
+    for name in sort.split(','):
+        name = name.strip()
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+
+        if name not in columns:
+            raise PaginationError("Unable to sort by '{}'".format(name))
+        if name in (key for key, _, _ in order):
+            raise PaginationError("Duplicate sort field '{}'".format(name))
+
+        order.append((name, columns[name], descending))
+
+    if 'id' not in (key for key, _, _ in order):
+        order.append(('id', columns['id'], False))
+
+    return order
+
+
+def get_limit():
+    limit = request.args.get('limit', current_app.config['API_DEFAULT_PAGE_SIZE'])
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise PaginationError("'limit' must be an integer")
+
+    if limit < 1:
+        raise PaginationError("'limit' must be a positive integer")
+
+    return min(limit, current_app.config['API_MAX_PAGE_SIZE'])
+
+
+def is_nullable(column):
+    return getattr(getattr(column, 'expression', column), 'nullable', False)
+
+
+def order_by_clauses(column, descending, dialect):
+    """NULLs come first in ascending order and last in descending order,
+    as SQLite and MySQL sort them, whatever the database"""
+    order = column.desc() if descending else column.asc()
+    if not is_nullable(column) or dialect in NULLS_FIRST_DIALECTS:
+        return [order]
+
+    if dialect == 'postgresql':
+        return [order.nullslast() if descending else order.nullsfirst()]
+
+    # NULLS FIRST / LAST is not portable, `column IS NULL` sorts them anywhere
+    is_null = case([(column.is_(None), 1)], else_=0)
+    return [is_null.asc() if descending else is_null.desc(), order]
+
+
+def _equals(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+def _after(column, value, descending):
+    if value is None:
+        # Only the non NULL values follow NULL in ascending order, nothing in descending order
+        return false() if descending else column.isnot(None)
+
+    if not descending:
+        return column > value
+
+    if is_nullable(column):
+        return or_(column < value, column.is_(None))
+    return column < value
+
+
+def _at_or_after(column, value, descending):
+    if value is None:
+        # Everything follows NULL in ascending order, only NULL in descending order
+        return None if not descending else column.is_(None)
+
+    # `a <= 1 OR a IS NULL` is not a range of the index, the NULL rows
+    # following a descending cursor are left to the caller, see trails_nulls
+    return column <= value if descending else column >= value
+
+
+def trails_nulls(order, values):
+    """Whether the NULL rows of the first key follow the cursor but are left
+    out by keyset_filter: they come last in descending order"""
+    _, column, descending = order[0]
+    return descending and values[0] is not None and is_nullable(column)
+
+
+def keyset_filter(order, values):
+    """Builds the WHERE clause selecting the rows after the given keys.
+
+    (a, b, id) > (1, 2, 3) is expanded into
+    a >= 1 AND (a > 1 OR (a = 1 AND b > 2) OR (a = 1 AND b = 2 AND id > 3))
+    so that every key can have its own direction. The redundant bound on
+    the first key lets the database start the index scan at the cursor,
+    without it the time of a page grows with its depth. NULL keys are
+    placed as in order_by_clauses, except the NULL rows of the first key
+    when trails_nulls(order, values).
+    """
+    if len(values) != len(order):
+        raise PaginationError('Invalid cursor')
+
+    clauses = []
+    for i, (_, column, descending) in enumerate(order):
+        equals = [_equals(order[j][1], values[j]) for j in range(i)]
+        clauses.append(and_(*equals, _after(column, values[i], descending)))
+
+    _, first_column, first_descending = order[0]
+    bound = _at_or_after(first_column, values[0], first_descending)
+    if bound is None:
+        return or_(*clauses)
+    return and_(bound, or_(*clauses))
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def headers(self):
+        if self.next_cursor is None:
+            return {}
+
+        args = request.args.copy()
+        args['cursor'] = self.next_cursor
+        next_url = '{}?{}'.format(request.base_url, url_encode(args))
+
+        return {
+            'Link': '<{}>; rel="next"'.format(next_url),
+            'X-Next-Cursor': self.next_cursor,
+        }
+
+
+def paginate(query, columns, default_sort='id'):
+    """Returns a page of the query according to the `sort`, `limit` and `cursor`
+    request arguments.
+
+    Pages are selected by the keys of the last row of the previous page
+    instead of OFFSET, so every page costs the same index range scan
+    no matter how deep the client is.
+
+    The query selects columns, the sort columns it misses are added
+    after them to read the keys of the last row.
+    """
+    sort = request.args.get('sort', default_sort)
+    order = parse_sort(sort, columns)
+    limit = get_limit()
+
+    selected = {description['name'] for description in query.column_descriptions}
+    missing = [column for name, column, _ in order if name not in selected]
+    if missing:
+        query = query.add_columns(*missing)
+
+    dialect = query.session.get_bind().dialect.name
+    query = query.order_by(*[clause for _, column, descending in order
+                             for clause in order_by_clauses(column, descending, dialect)])
+
+    cursor = request.args.get('cursor')
+    values = decode_cursor(cursor, sort) if cursor else None
+
+    # Fetch one extra row to find out whether there is a next page
+    if values is None:
+        items = query.limit(limit + 1).all()
+    else:
+        items = query.filter(keyset_filter(order, values)).limit(limit + 1).all()
+        if len(items) <= limit and trails_nulls(order, values):
+            nulls = query.filter(order[0][1].is_(None))
+            items += nulls.limit(limit + 1 - len(items)).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(sort, [getattr(last, name) for name, _, _ in order])
+
+    return KeysetPage(items, next_cursor)
@@ -2,50 +2,71 @@ from flask import request
 from flask_restful import Resource
 from flask_jwt_extended import jwt_required
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
 from ..model.author import Author, AuthorSchema
+from ..model.book import Book, book_author
+from ..pagination import paginate, PaginationError
+from ..fieldsets import select_serializer, FieldsetError
+from ..multiget import parse_ids, dump_by_ids, MultiGetError
+from ..export import stream_export, EXPORT_FORMATS
+from ..writes import create_author, update_author, delete_author, dump_written, WriteError
+from ..etag import make_etag, is_not_modified, not_modified, etag_headers
+from ..cache import cached_response, get_table_versions
 from app.util import status
+from app.util.database import replica_reads
+from app.util.serializer import CompiledSerializer
 from app import db
 
 author_schema = AuthorSchema()
 
+# GET responses are serialized from rows, the books of a page of authors
+# are loaded with one SELECT ... IN. The versions are selected for the ETags
+author_serializer = CompiledSerializer(author_schema, extra_columns=('version',))
 
-class AuthorResource(Resource):
-    def get(self, id):
-        author = Author.query.get_or_404(id)
-        result = author_schema.dump(author).data
-        return result
+# Columns an author list can be sorted (and so paginated) by,
+# all of them are indexed
+AUTHOR_SORT_COLUMNS = {
+    'id': Author.id,
+    'lastname': Author.lastname,
+}
 
-    @jwt_required
-    def patch(self, id):
-        author = Author.query.get_or_404(id)
-        author_dict = request.get_json()
 
-        if not author_dict:
-            response = {'message': 'No input data provided'}
+class AuthorResource(Resource):
+    @replica_reads
+    @cached_response('authors', 'books')
+    def get(self, id):
+        try:
+            serializer = select_serializer(author_serializer)
+        except FieldsetError as e:
+            response = {'error': str(e)}
             return response, status.HTTP_400_BAD_REQUEST
 
-        author_firstname = author_dict.get('firstname', author.firstname)
-        author_lastname = author_dict.get('lastname', author.lastname)
-
-        if Author.is_unique(id=0, firstname=author_firstname, lastname=author_lastname):
-            author.firstname = author_firstname or author.firstname
-            author.lastname = author_lastname or author.lastname
-        else:
-            response = {'error': 'An author with the same name already exists'}
-            return response, status.HTTP_400_BAD_REQUEST
+        author = serializer.query().filter(Author.id == id).first_or_404()
+        related = serializer.load_related([author])
 
-        dumped_author, dump_errors = author_schema.dump(author)
+        etag = Author.make_etag(author, serializer.related_rows(related, 'books', author.id))
+        if is_not_modified(etag):
+            return not_modified(etag)
 
-        if dump_errors:
-            return dump_errors, status.HTTP_400_BAD_REQUEST
+        result = serializer.serialize([author], related)[0]
+        return result, status.HTTP_200_OK, etag_headers(etag)
 
-        validate_errors = author_schema.validate(dumped_author)
-        if validate_errors:
-            return validate_errors, status.HTTP_400_BAD_REQUEST
+    @jwt_required
+    def patch(self, id):
+        # The response is serialized from the updated author, loaded with its books
+        author = Author.query.options(joinedload(Author.books)).get_or_404(id)
 
         try:
+            update_author(author, request.get_json())
+            result, related = dump_written(author_schema, author)
+            etag = Author.make_etag(author, related['books'])
             db.session.commit()
-            return self.get(id)
+
+            return result, status.HTTP_200_OK, etag_headers(etag)
+
+        except WriteError as e:
+            db.session.rollback()
+            return e.response, e.status_code
 
         except SQLAlchemyError as e:
             db.session.rollback()
@@ -58,7 +79,7 @@ class AuthorResource(Resource):
         author = Author.query.get_or_404(id)
 
         try:
-            db.session.delete(author)
+            delete_author(author)
             db.session.commit()
 
             response = {}
@@ -73,46 +94,90 @@ class AuthorResource(Resource):
 
 
 class AuthorListResource(Resource):
+    @replica_reads
+    @cached_response('authors', 'books')
     def get(self):
-        authors = Author.query.all()
-        results = author_schema.dump(authors, many=True).data
-        return results
+        # Authors embed their books, so a write to either table changes the list
+        etag = make_etag('authors', get_table_versions('authors', 'books'), request.query_string)
+        if is_not_modified(etag):
+            return not_modified(etag, weak=True)
+
+        try:
+            serializer = select_serializer(author_serializer)
+            if 'ids' in request.args:
+                results = dump_by_ids(serializer, Author.id, parse_ids())
+                return results, status.HTTP_200_OK, etag_headers(etag, weak=True)
+
+            page = paginate(serializer.query(), AUTHOR_SORT_COLUMNS)
+        except (FieldsetError, MultiGetError, PaginationError) as e:
+            response = {'error': str(e)}
+            return response, status.HTTP_400_BAD_REQUEST
+
+        results = serializer.dump(page.items)
+        headers = dict(page.headers, **etag_headers(etag, weak=True))
+        return results, status.HTTP_200_OK, headers
 
     @jwt_required
     def post(self):
-        request_dict = request.get_json()
+        try:
+            author = create_author(request.get_json())
+            result, related = dump_written(author_schema, author)
+            etag = Author.make_etag(author, related['books'])
+            db.session.commit()
 
-        if not request_dict:
-            response = {'message': 'No input data provided'}
-            return response, status.HTTP_400_BAD_REQUEST
+            return result, status.HTTP_201_CREATED, etag_headers(etag)
 
-        validate_errors = author_schema.validate(request_dict)
-        if validate_errors:
-            return validate_errors, status.HTTP_400_BAD_REQUEST
+        except WriteError as e:
+            db.session.rollback()
+            return e.response, e.status_code
 
-        author_firstname = request_dict['firstname']
-        author_lastname = request_dict['lastname']
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            response = {"error": str(e)}
 
-        if not Author.is_unique(id=0, firstname=author_firstname, lastname=author_lastname):
-            response = {'error': 'An author with the same name already exists'}
             return response, status.HTTP_400_BAD_REQUEST
 
+
+class BookAuthorListResource(Resource):
+    """All the authors of a book, the book only embeds the first ones"""
+
+    @replica_reads
+    @cached_response('authors', 'books')
+    def get(self, id):
+        db.session.query(Book.id).filter(Book.id == id).first_or_404()
+
+        etag = make_etag('book authors', id, get_table_versions('authors', 'books'), request.query_string)
+        if is_not_modified(etag):
+            return not_modified(etag, weak=True)
+
         try:
-            author = Author(
-                firstname=author_firstname,
-                lastname=author_lastname,
-            )
+            serializer = select_serializer(author_serializer)
+            query = serializer.query() \
+                .join(book_author, book_author.c.author_id == Author.id) \
+                .filter(book_author.c.book_id == id)
+            page = paginate(query, AUTHOR_SORT_COLUMNS)
+        except (FieldsetError, PaginationError) as e:
+            response = {'error': str(e)}
+            return response, status.HTTP_400_BAD_REQUEST
 
-            db.session.add(author)
-            db.session.commit()
+        results = serializer.dump(page.items)
+        headers = dict(page.headers, **etag_headers(etag, weak=True))
+        return results, status.HTTP_200_OK, headers
 
-            query = Author.query.get(author.id)
-            result = author_schema.dump(query).data
 
-            return result, status.HTTP_201_CREATED
+class AuthorExportResource(Resource):
+    @replica_reads
+    def get(self):
+        export_format = request.args.get('format', 'ndjson')
 
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            response = {"error": str(e)}
+        if export_format not in EXPORT_FORMATS:
+            response = {'error': "'format' must be one of: {}".format(', '.join(sorted(EXPORT_FORMATS)))}
+            return response, status.HTTP_400_BAD_REQUEST
 
+        try:
+            serializer = select_serializer(author_serializer)
+        except FieldsetError as e:
+            response = {'error': str(e)}
             return response, status.HTTP_400_BAD_REQUEST
+
+        return stream_export(serializer.query(), Author.id, serializer, export_format)
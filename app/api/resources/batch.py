@@ -0,0 +1,121 @@
+from flask import request, current_app, url_for
+from flask_restful import Resource
+from flask_jwt_extended import jwt_required
+from sqlalchemy.exc import SQLAlchemyError
+from ..model.book import Book
+from ..model.author import Author
+from ..writes import (
+    create_book,
+    update_book,
+    delete_book,
+    create_author,
+    update_author,
+    delete_author,
+    WriteError,
+)
+from app.util import status
+from app import db
+
+# resource: (model, endpoint, create, update, delete)
+BATCH_RESOURCES = {
+    'books': (Book, 'api.bookresource', create_book, update_book, delete_book),
+    'authors': (Author, 'api.authorresource', create_author, update_author, delete_author),
+}
+
+BATCH_METHODS = ('create', 'patch', 'delete')
+
+
+def run_operation(operation):
+    """Runs a single operation of a batch, returns its result"""
+    if not isinstance(operation, dict):
+        raise WriteError({'error': 'Operation must be a JSON object'})
+
+    method = operation.get('method')
+    if method not in BATCH_METHODS:
+        raise WriteError({'error': "'method' must be one of: {}".format(', '.join(BATCH_METHODS))})
+
+    resource = operation.get('resource')
+    if resource not in BATCH_RESOURCES:
+        raise WriteError({'error': "'resource' must be one of: {}".format(', '.join(sorted(BATCH_RESOURCES)))})
+
+    model, endpoint, create, update, delete = BATCH_RESOURCES[resource]
+
+    if method == 'create':
+        instance = create(operation.get('data'))
+        return {
+            'status': status.HTTP_201_CREATED,
+            'id': instance.id,
+            'url': url_for(endpoint, id=instance.id, _external=True),
+        }
+
+    id = operation.get('id')
+    # JSON true and false are ints in Python
+    if not isinstance(id, int) or isinstance(id, bool):
+        raise WriteError({'error': "'id' must be an integer"})
+
+    instance = model.query.get(id)
+    if instance is None:
+        raise WriteError({'error': 'Not found'}, status.HTTP_404_NOT_FOUND)
+
+    if method == 'patch':
+        update(instance, operation.get('data'))
+        return {
+            'status': status.HTTP_200_OK,
+            'id': id,
+            'url': url_for(endpoint, id=id, _external=True),
+        }
+
+    delete(instance)
+    return {'status': status.HTTP_204_NO_CONTENT, 'id': id}
+
+
+class BatchResource(Resource):
+    @jwt_required
+    def post(self):
+        """Runs a list of writes in a single transaction.
+
+        The operations run in order and are committed together. The first
+        failing operation rolls the whole batch back, the results then end
+        with its error.
+        """
+        operations = request.get_json(silent=True)
+
+        if not operations:
+            response = {'message': 'No input data provided'}
+            return response, status.HTTP_400_BAD_REQUEST
+
+        if not isinstance(operations, list):
+            response = {'error': 'Request body must be a JSON array of operations'}
+            return response, status.HTTP_400_BAD_REQUEST
+
+        max_operations = current_app.config['API_BATCH_MAX_OPERATIONS']
+        if len(operations) > max_operations:
+            response = {'error': 'A batch can contain at most {} operations'.format(max_operations)}
+            return response, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+        results = []
+        try:
+            for index, operation in enumerate(operations):
+                try:
+                    result = run_operation(operation)
+                except WriteError as e:
+                    db.session.rollback()
+                    results.append({'index': index, 'status': e.status_code, 'errors': e.response})
+                    response = {
+                        'error': 'Operation {} failed, no operation was applied'.format(index),
+                        'results': results,
+                    }
+                    return response, status.HTTP_400_BAD_REQUEST
+
+                results.append(dict(result, index=index))
+
+            db.session.commit()
+
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            response = {"error": str(e)}
+
+            return response, status.HTTP_400_BAD_REQUEST
+
+        response = {'results': results}
+        return response, status.HTTP_200_OK
@@ -1,84 +1,92 @@
-from flask import request
+from flask import request, current_app
 from flask_restful import Resource
 from flask_jwt_extended import jwt_required
-from sqlalchemy.exc import SQLAlchemyError
-from ..model.book import Book, BookSchema
-from ..model.author import Author, AuthorSchema
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import joinedload
+from ..model.book import Book, BookSchema, book_author
+from ..model.author import Author
+from ..model.table_version import TableVersion
+from ..model.book_search import BookSearch, SearchError
+from ..pagination import paginate, PaginationError
+from ..filters import apply_filters, FilterError
+from ..fieldsets import select_serializer, FieldsetError
+from ..multiget import LIST_ARGS, parse_ids, dump_by_ids, MultiGetError
+from ..export import stream_export, EXPORT_FORMATS
+from ..bulk import read_items, import_books, BulkPayloadError
+from ..writes import create_book, update_book, put_book, delete_book, dump_written, WriteError
+from ..etag import make_etag, is_not_modified, not_modified, etag_headers
+from ..cache import cached_response, get_table_versions
 from app.util import status
+from app.util.database import replica_reads
+from app.util.serializer import CompiledSerializer
+from app.util.upsert import UpsertNotSupported
 from app import db
 
 book_schema = BookSchema()
-author_schema = AuthorSchema()
+
+# A bulk import losing a race on an author or an ISBN runs again, this many times in all
+BULK_IMPORT_ATTEMPTS = 2
+
+# GET responses are serialized from rows, the authors of a page of books
+# are loaded with one SELECT ... IN. The versions are selected for the ETags
+book_serializer = CompiledSerializer(book_schema, extra_columns=('version',))
+
+# Columns a book list can be sorted (and so paginated) by,
+# all of them are indexed
+BOOK_SORT_COLUMNS = {
+    'id': Book.id,
+    'isbn': Book.isbn,
+    'title': Book.title,
+    'year': Book.year,
+}
+
+# Arguments a book list can be filtered by
+BOOK_FILTERS = {
+    'year_min': lambda year: Book.year >= year,
+    'year_max': lambda year: Book.year <= year,
+    'isbn': lambda isbn: Book.isbn == isbn,
+    'author_id': lambda author_id: Book.id.in_(
+        db.session.query(book_author.c.book_id).filter(book_author.c.author_id == author_id)
+    ),
+}
 
 
 class BookResource(Resource):
+    @replica_reads
+    @cached_response('authors', 'books')
     def get(self, id):
-        book = Book.query.get_or_404(id)
-        result = book_schema.dump(book).data
-        return result
-
-    @jwt_required
-    def patch(self, id):
-        book = Book.query.get_or_404(id)
-        book_dict = request.get_json()
-
-        if not book_dict:
-            response = {'message': 'No input data provided'}
+        try:
+            serializer = select_serializer(book_serializer)
+        except FieldsetError as e:
+            response = {'error': str(e)}
             return response, status.HTTP_400_BAD_REQUEST
 
-        if 'title' in book_dict:
-            book.title = book_dict['title']
-
-        if 'year' in book_dict:
-            book.year = book_dict['year']
-
-        if 'isbn' in book_dict:
-            book_isbn = book_dict['isbn']
-
-            if Book.is_unique(id=0, isbn=book_isbn):
-                book.isbn = book_isbn
-            else:
-                response = {'error': 'A book with the same ISBN already exists'}
-                return response, status.HTTP_400_BAD_REQUEST
-
-        if 'authors' in book_dict:
-            book_authors = book_dict['authors']
-
-            if not isinstance(book_authors, list):
-                response = {'error': "'authors' field must be an array"}
-                return response, status.HTTP_400_BAD_REQUEST
-
-            authors = []
-            for author_dict in book_authors:
-                validate_errors = author_schema.validate(author_dict)
-                if validate_errors:
-                    return validate_errors, status.HTTP_400_BAD_REQUEST
-
-                author_firstname = author_dict['firstname']
-                author_lastname = author_dict['lastname']
-                author = Author.query.filter_by(firstname=author_firstname, lastname=author_lastname).first()
-
-                if author is None:
-                    # Create a new Author
-                    author = Author(firstname=author_firstname, lastname=author_lastname)
-                    db.session.add(author)
-                    db.session.commit()
-
-                authors.append(author)
-            book.authors = authors
+        book = serializer.query().filter(Book.id == id).first_or_404()
+        related = serializer.load_related([book])
 
-        dumped_book, dump_errors = book_schema.dump(book)
+        etag = Book.make_etag(book, serializer.related_rows(related, 'authors', book.id))
+        if is_not_modified(etag):
+            return not_modified(etag)
 
-        if dump_errors:
-            return dump_errors, status.HTTP_400_BAD_REQUEST
+        result = serializer.serialize([book], related)[0]
+        return result, status.HTTP_200_OK, etag_headers(etag)
 
-        validate_errors = book_schema.validate(dumped_book)
-        if validate_errors:
-            return validate_errors, status.HTTP_400_BAD_REQUEST
+    @jwt_required
+    def patch(self, id):
+        # The response is serialized from the updated book, loaded with its authors
+        book = Book.query.options(joinedload(Book.authors)).get_or_404(id)
 
         try:
+            update_book(book, request.get_json())
+            result, related = dump_written(book_schema, book)
+            etag = Book.make_etag(book, related['authors'])
             db.session.commit()
-            return self.get(id)
+
+            return result, status.HTTP_200_OK, etag_headers(etag)
+
+        except WriteError as e:
+            db.session.rollback()
+            return e.response, e.status_code
 
         except SQLAlchemyError as e:
             db.session.rollback()
@@ -90,7 +98,7 @@ class BookResource(Resource):
     def delete(self, id):
         book = Book.query.get_or_404(id)
         try:
-            db.session.delete(book)
+            delete_book(book)
             db.session.commit()
 
             response = {}
@@ -104,63 +112,183 @@ class BookResource(Resource):
             return response, status.HTTP_401_UNAUTHORIZED
 
 
-class BookListResource(Resource):
-    def get(self):
-        books = Book.query.all()
-        result = book_schema.dump(books, many=True).data
-        return result
+class BookIsbnResource(Resource):
+    """A book addressed by its ISBN, written whether it exists or not"""
 
     @jwt_required
-    def post(self):
-        request_dict = request.get_json()
+    def put(self, isbn):
+        try:
+            book, created = put_book(isbn, request.get_json())
+            result, related = dump_written(book_schema, book)
+            etag = Book.make_etag(book, related['authors'])
+            db.session.commit()
+
+        except WriteError as e:
+            db.session.rollback()
+            return e.response, e.status_code
+
+        except UpsertNotSupported as e:
+            db.session.rollback()
+            response = {'error': str(e)}
+            return response, status.HTTP_501_NOT_IMPLEMENTED
+
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            response = {"error": str(e)}
 
-        if not request_dict:
-            response = {'message': 'No input data provided'}
             return response, status.HTTP_400_BAD_REQUEST
 
-        validate_errors = book_schema.validate(request_dict)
-        if validate_errors:
-            return validate_errors, status.HTTP_400_BAD_REQUEST
+        status_code = status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        return result, status_code, etag_headers(etag)
+
+
+class BookListResource(Resource):
+    @replica_reads
+    @cached_response('authors', 'books')
+    def get(self):
+        # Books embed their authors, so a write to either table changes the list
+        etag = make_etag('books', get_table_versions('books', 'authors'), request.query_string)
+        if is_not_modified(etag):
+            return not_modified(etag, weak=True)
+
+        try:
+            serializer = select_serializer(book_serializer)
+            if 'ids' in request.args:
+                result = dump_by_ids(serializer, Book.id, parse_ids(LIST_ARGS + ('q',) + tuple(BOOK_FILTERS)))
+                return result, status.HTTP_200_OK, etag_headers(etag, weak=True)
 
-        book_isbn = request_dict['isbn']
+            query = apply_filters(serializer.query(), BOOK_FILTERS)
 
-        if not Book.is_unique(id=0, isbn=book_isbn):
-            response = {'error': 'A book with the same ISBN already exists'}
+            if 'q' in request.args:
+                # Matches ranked by relevance by default
+                query, rank = BookSearch.search(query, request.args['q'])
+                page = paginate(query, dict(BOOK_SORT_COLUMNS, rank=rank), default_sort='rank')
+            else:
+                page = paginate(query, BOOK_SORT_COLUMNS)
+        except (FieldsetError, FilterError, MultiGetError, PaginationError, SearchError) as e:
+            response = {'error': str(e)}
             return response, status.HTTP_400_BAD_REQUEST
 
+        result = serializer.dump(page.items)
+        headers = dict(page.headers, **etag_headers(etag, weak=True))
+        return result, status.HTTP_200_OK, headers
+
+    @jwt_required
+    def post(self):
         try:
-            authors = []
-            for author_dict in request_dict['authors']:
-                author_firstname = author_dict['firstname']
-                author_lastname = author_dict['lastname']
-                author = Author.query.filter_by(firstname=author_firstname, lastname=author_lastname).first()
-
-                if author is None:
-                    # Create a new Author
-                    author = Author(firstname=author_firstname, lastname=author_lastname)
-                    db.session.add(author)
-
-                authors.append(author)
-
-            # Now that we are sure we have all authors
-            # create a new Book
-            book = Book(
-                title=request_dict['title'],
-                isbn=book_isbn,
-                year=request_dict['year'],
-            )
-            book.authors = authors
-
-            db.session.add(book)
+            book = create_book(request.get_json())
+            result, related = dump_written(book_schema, book)
+            etag = Book.make_etag(book, related['authors'])
             db.session.commit()
 
-            query = Book.query.get(book.id)
-            result = book_schema.dump(query).data
+            return result, status.HTTP_201_CREATED, etag_headers(etag)
 
-            return result, status.HTTP_201_CREATED
+        except WriteError as e:
+            db.session.rollback()
+            return e.response, e.status_code
 
         except SQLAlchemyError as e:
             db.session.rollback()
             response = {"error": str(e)}
 
             return response, status.HTTP_400_BAD_REQUEST
+
+
+class AuthorBookListResource(Resource):
+    """All the books of an author, the author only embeds the first ones"""
+
+    @replica_reads
+    @cached_response('authors', 'books')
+    def get(self, id):
+        db.session.query(Author.id).filter(Author.id == id).first_or_404()
+
+        etag = make_etag('author books', id, get_table_versions('books', 'authors'), request.query_string)
+        if is_not_modified(etag):
+            return not_modified(etag, weak=True)
+
+        try:
+            serializer = select_serializer(book_serializer)
+            query = serializer.query() \
+                .join(book_author, book_author.c.book_id == Book.id) \
+                .filter(book_author.c.author_id == id)
+            page = paginate(apply_filters(query, BOOK_FILTERS), BOOK_SORT_COLUMNS)
+        except (FieldsetError, FilterError, PaginationError) as e:
+            response = {'error': str(e)}
+            return response, status.HTTP_400_BAD_REQUEST
+
+        result = serializer.dump(page.items)
+        headers = dict(page.headers, **etag_headers(etag, weak=True))
+        return result, status.HTTP_200_OK, headers
+
+
+class BookExportResource(Resource):
+    @replica_reads
+    def get(self):
+        export_format = request.args.get('format', 'ndjson')
+
+        if export_format not in EXPORT_FORMATS:
+            response = {'error': "'format' must be one of: {}".format(', '.join(sorted(EXPORT_FORMATS)))}
+            return response, status.HTTP_400_BAD_REQUEST
+
+        try:
+            serializer = select_serializer(book_serializer)
+        except FieldsetError as e:
+            response = {'error': str(e)}
+            return response, status.HTTP_400_BAD_REQUEST
+
+        return stream_export(serializer.query(), Book.id, serializer, export_format)
+
+
+class BookBulkResource(Resource):
+    @jwt_required
+    def post(self):
+        try:
+            items = read_items()
+        except BulkPayloadError as e:
+            response = {'error': str(e)}
+            return response, status.HTTP_400_BAD_REQUEST
+
+        if not items:
+            response = {'message': 'No input data provided'}
+            return response, status.HTTP_400_BAD_REQUEST
+
+        max_items = current_app.config['API_BULK_MAX_ITEMS']
+        if len(items) > max_items:
+            response = {'error': 'A bulk request can contain at most {} books'.format(max_items)}
+            return response, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+        for attempt in range(BULK_IMPORT_ATTEMPTS):
+            try:
+                results = import_books(items)
+                TableVersion.bump('books', 'authors')
+                BookSearch.index(result['id'] for result in results if result['status'] == status.HTTP_201_CREATED)
+                db.session.commit()
+                break
+
+            except IntegrityError as e:
+                # An author or an ISBN inserted meanwhile by another request,
+                # the next attempt finds it
+                db.session.rollback()
+                if attempt + 1 == BULK_IMPORT_ATTEMPTS:
+                    response = {"error": str(e)}
+                    return response, status.HTTP_400_BAD_REQUEST
+
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                response = {"error": str(e)}
+
+                return response, status.HTTP_400_BAD_REQUEST
+
+        created = sum(1 for result in results if result['status'] == status.HTTP_201_CREATED)
+        response = {
+            'created': created,
+            'failed': len(results) - created,
+            'results': results,
+        }
+
+        if created == len(results):
+            return response, status.HTTP_201_CREATED
+        elif created == 0:
+            return response, status.HTTP_400_BAD_REQUEST
+        else:
+            return response, status.HTTP_207_MULTI_STATUS
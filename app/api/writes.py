@@ -0,0 +1,286 @@
+from contextlib import contextmanager
+from flask import current_app
+from marshmallow import fields
+from sqlalchemy import tuple_
+from sqlalchemy.orm.exc import StaleDataError
+from .model.book import Book, BookSchema, book_author
+from .model.author import Author, AuthorSchema
+from .model.table_version import TableVersion
+from .model.book_search import BookSearch
+from app.util import status
+from app.util.upsert import upsert
+from app import db
+
+book_schema = BookSchema()
+author_schema = AuthorSchema()
+
+
+class WriteError(Exception):
+    """Raised when a write is rejected, carries the error response"""
+
+    def __init__(self, response, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(response)
+        self.response = response
+        self.status_code = status_code
+
+
+def _require_data(data):
+    if not data:
+        raise WriteError({'message': 'No input data provided'})
+
+    if not isinstance(data, dict):
+        raise WriteError({'error': 'Input data must be a JSON object'})
+
+
+@contextmanager
+def _versioned_update(instance):
+    """Increments the version of the instance for the writes of the block.
+
+    Incremented in Python, so the new version is known without a refresh.
+    The UPDATE only applies to the version that was read: if a concurrent
+    write replaced it the writes are rejected, two representations never
+    get the same version.
+    """
+    instance.version += 1
+    try:
+        yield
+        db.session.flush()
+    except StaleDataError:
+        name = type(instance).__name__.lower()
+        raise WriteError({'error': 'The {} was modified concurrently, try again'.format(name)},
+                         status.HTTP_409_CONFLICT)
+
+
+def _get_or_add_authors(author_dicts):
+    """Finds the authors by name with a single SELECT, the missing ones are added"""
+    names = []
+    for author_dict in author_dicts:
+        name = (author_dict['firstname'], author_dict['lastname'])
+        if name not in names:
+            names.append(name)
+
+    if not names:
+        return []
+
+    authors = {
+        (author.firstname, author.lastname): author
+        for author in Author.query.filter(tuple_(Author.firstname, Author.lastname).in_(names))
+    }
+
+    for firstname, lastname in names:
+        if (firstname, lastname) not in authors:
+            # Create a new Author
+            author = Author(firstname=firstname, lastname=lastname)
+            db.session.add(author)
+            authors[(firstname, lastname)] = author
+
+    return [authors[name] for name in names]
+
+
+def dump_written(schema, instance):
+    """Serializes an instance of the session the way the GETs serialize its row,
+    with at most API_EMBED_LIMIT records per nested relationship.
+
+    Returns the representation and the embedded records by relationship.
+    """
+    limit = current_app.config['API_EMBED_LIMIT']
+    nested = {name: field for name, field in schema.fields.items() if isinstance(field, fields.Nested)}
+
+    result = type(schema)(exclude=tuple(nested)).dump(instance).data if nested else schema.dump(instance).data
+    related = {}
+    for name, field in nested.items():
+        related[name] = getattr(instance, field.attribute or name)[:limit]
+        result[name] = field.schema.dump(related[name], many=True).data
+
+    return result, related
+
+
+# The helpers below change the session and flush it, the caller commits
+# (or rolls back), so that several writes can share a transaction.
+# The changed objects are up to date after them, the responses are
+# serialized from them without querying them again.
+
+def create_book(book_dict):
+    _require_data(book_dict)
+
+    validate_errors = book_schema.validate(book_dict)
+    if validate_errors:
+        raise WriteError(validate_errors)
+
+    book_isbn = book_dict['isbn']
+
+    if not Book.is_unique(id=0, isbn=book_isbn):
+        raise WriteError({'error': 'A book with the same ISBN already exists'})
+
+    authors = _get_or_add_authors(book_dict.get('authors', []))
+
+    # Now that we are sure we have all authors
+    # create a new Book
+    book = Book(
+        title=book_dict['title'],
+        isbn=book_isbn,
+        year=book_dict.get('year'),
+    )
+    book.authors = authors
+
+    db.session.add(book)
+    TableVersion.bump('books', 'authors')
+    db.session.flush()
+    BookSearch.index([book.id])
+
+    return book
+
+
+def update_book(book, book_dict):
+    """Applies the fields of `book_dict` to the book, only these fields are validated"""
+    _require_data(book_dict)
+
+    book_fields = {name: value for name, value in book_dict.items() if name != 'authors'}
+    validate_errors = book_schema.validate(book_fields, partial=True)
+    if validate_errors:
+        raise WriteError(validate_errors)
+
+    if 'authors' in book_dict:
+        if not isinstance(book_dict['authors'], list):
+            raise WriteError({'error': "'authors' field must be an array"})
+
+        for author_dict in book_dict['authors']:
+            validate_errors = author_schema.validate(author_dict)
+            if validate_errors:
+                raise WriteError(validate_errors)
+
+    with _versioned_update(book):
+        if 'isbn' in book_dict:
+            book_isbn = book_dict['isbn']
+
+            if not Book.is_unique(id=0, isbn=book_isbn):
+                raise WriteError({'error': 'A book with the same ISBN already exists'})
+            book.isbn = book_isbn
+
+        if 'title' in book_dict:
+            book.title = book_dict['title']
+
+        if 'year' in book_dict:
+            book.year = book_dict['year']
+
+        if 'authors' in book_dict:
+            book.authors = _get_or_add_authors(book_dict['authors'])
+
+        TableVersion.bump('books', 'authors')
+
+    BookSearch.index([book.id])
+
+
+def put_book(isbn, book_dict):
+    """Creates or replaces the book with this ISBN, returns it and whether it was created.
+
+    The book and each of its authors are written with one INSERT ... ON CONFLICT,
+    without looking them up first. The returned book is not part of the
+    session, it only serves the response.
+    """
+    _require_data(book_dict)
+
+    validate_errors = book_schema.validate(dict(book_dict, isbn=book_dict.get('isbn', isbn)))
+    if validate_errors:
+        raise WriteError(validate_errors)
+
+    if int(book_dict.get('isbn', isbn)) != isbn:
+        raise WriteError({'error': "'isbn' does not match the ISBN of the URL"})
+
+    authors = []
+    names = []
+    for author_dict in book_dict.get('authors', []):
+        name = (author_dict['firstname'], author_dict['lastname'])
+        if name not in names:
+            row = Author.get_or_create(*name)
+            authors.append(Author(id=row.id, firstname=name[0], lastname=name[1], version=row.version))
+            names.append(name)
+
+    year = book_dict.get('year')
+    year = int(year) if year is not None else None
+
+    row = Book.upsert(isbn, book_dict['title'], year)
+    created = row.version == 1
+
+    author_ids = [author.id for author in authors]
+    if not created:
+        stale_links = book_author.delete().where(book_author.c.book_id == row.id)
+        if author_ids:
+            stale_links = stale_links.where(book_author.c.author_id.notin_(author_ids))
+        db.session.execute(stale_links)
+
+    if author_ids:
+        links = upsert(book_author, ('book_id', 'author_id'), ('author_id', 'book_id'))
+        db.session.execute(links, [{'book_id': row.id, 'author_id': author_id} for author_id in author_ids])
+
+    TableVersion.bump('books', 'authors')
+    BookSearch.index([row.id])
+
+    book = Book(id=row.id, isbn=isbn, title=book_dict['title'], year=year, version=row.version)
+    book.authors = sorted(authors, key=lambda author: author.id)
+
+    return book, created
+
+
+def delete_book(book):
+    book_id = book.id
+    db.session.delete(book)
+    TableVersion.bump('books')
+    db.session.flush()
+    BookSearch.remove([book_id])
+
+
+def create_author(author_dict):
+    _require_data(author_dict)
+
+    validate_errors = author_schema.validate(author_dict)
+    if validate_errors:
+        raise WriteError(validate_errors)
+
+    author_firstname = author_dict['firstname']
+    author_lastname = author_dict['lastname']
+
+    if not Author.is_unique(id=0, firstname=author_firstname, lastname=author_lastname):
+        raise WriteError({'error': 'An author with the same name already exists'})
+
+    author = Author(
+        firstname=author_firstname,
+        lastname=author_lastname,
+    )
+
+    db.session.add(author)
+    TableVersion.bump('authors')
+    db.session.flush()
+
+    return author
+
+
+def update_author(author, author_dict):
+    """Applies the fields of `author_dict` to the author, only these fields are validated"""
+    _require_data(author_dict)
+
+    validate_errors = author_schema.validate(author_dict, partial=True)
+    if validate_errors:
+        raise WriteError(validate_errors)
+
+    author_firstname = author_dict.get('firstname') or author.firstname
+    author_lastname = author_dict.get('lastname') or author.lastname
+
+    if not Author.is_unique(id=0, firstname=author_firstname, lastname=author_lastname):
+        raise WriteError({'error': 'An author with the same name already exists'})
+
+    with _versioned_update(author):
+        author.firstname = author_firstname
+        author.lastname = author_lastname
+        TableVersion.bump('authors')
+    BookSearch.index_author(author.id)
+
+
+def delete_author(author):
+    # The books keep their index rows, without the name of the author
+    book_ids = [book.id for book in author.books]
+
+    db.session.delete(author)
+    TableVersion.bump('authors')
+    db.session.flush()
+    BookSearch.index(book_ids)
@@ -0,0 +1,184 @@
+import asyncio
+import copy
+import os
+import time
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from sqlalchemy.engine.url import make_url
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_etags, unquote_etag
+from werkzeug.wsgi import get_current_url
+from .api.cache import cache_key
+from .util import status
+from .util.metrics import metrics_headers
+
+VERSIONS_SQL = 'SELECT name, version FROM table_versions'
+
+
+class AsyncVersions:
+    """Reads the table versions with an async driver, aiosqlite or asyncpg.
+
+    The driver is imported and connected on first use.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self._connection = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def for_app(cls, app):
+        """None when the database has no supported async driver"""
+        url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        if url.drivername == 'sqlite' and url.database not in (None, '', ':memory:'):
+            # Relative to the application, like Flask-SQLAlchemy
+            url.database = os.path.join(app.root_path, url.database)
+            return cls(url)
+        if url.get_backend_name() == 'postgresql':
+            return cls(url)
+        return None
+
+    async def _connect(self):
+        if self.url.drivername == 'sqlite':
+            import aiosqlite
+            return await aiosqlite.connect(self.url.database)
+
+        import asyncpg
+        url = copy.copy(self.url)
+        url.drivername = 'postgresql'
+        return await asyncpg.create_pool(str(url))
+
+    async def get(self, tables):
+        """The versions of the tables in the order of `tables`, like TableVersion.get_versions"""
+        if self._connection is None:
+            async with self._lock:
+                if self._connection is None:
+                    self._connection = await self._connect()
+
+        if self.url.drivername == 'sqlite':
+            async with self._connection.execute(VERSIONS_SQL) as cursor:
+                versions = dict(await cursor.fetchall())
+        else:
+            versions = dict(await self._connection.fetch(VERSIONS_SQL))
+
+        return tuple(versions.get(table, 0) for table in tables)
+
+    async def close(self):
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+
+class CatalogApp:
+    """ASGI application serving the Flask application.
+
+    The GET requests of the cached handlers are answered on the event loop
+    when the response cache has their entry: the table versions of the key
+    are read with an async driver, no thread is used. Every other request,
+    cache misses included, runs the Flask application in a pool of
+    ASGI_WSGI_THREADS threads, which fills the cache. Either way the threads
+    are only held while a handler runs, not while slow clients send the
+    request or read the response.
+
+    The responses served from the cache skip the request hooks of the Flask
+    application: the requests with an Origin header go to the application
+    for their CORS headers, the REQUEST_METRICS headers are added here.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi = WSGIMiddleware(self.wsgi_app, workers=app.config['ASGI_WSGI_THREADS'])
+        self.versions = AsyncVersions.for_app(app)
+
+    def wsgi_app(self, environ, start_response):
+        # a2wsgi 1.4 passes the port of the ASGI scope as an int
+        environ['SERVER_PORT'] = str(environ['SERVER_PORT'])
+        return self.app(environ, start_response)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            response = await self.cached_response(scope)
+            if response is not None:
+                return await self.send_response(send, *response)
+
+        return await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def close(self):
+        if self.versions is not None:
+            await self.versions.close()
+
+    def cached_tables(self, endpoint):
+        view_class = getattr(self.app.view_functions.get(endpoint), 'view_class', None)
+        return getattr(getattr(view_class, 'get', None), 'cached_tables', None)
+
+    async def cached_response(self, scope):
+        """The status, headers and body of the cached response, None on a miss"""
+        cache = self.app.extensions.get('response_cache')
+        if self.versions is None or cache is None or not self.app.config['API_CACHE_MAX_BYTES']:
+            return None
+
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        if 'origin' in headers:
+            # The CORS headers are added by the Flask application
+            return None
+
+        started_at = time.perf_counter()
+
+        # The WSGI environment of a2wsgi: the URL is matched and the root URL
+        # of the key is built as the Flask application does it
+        environ = build_environ(scope, None)
+        environ['SERVER_PORT'] = str(environ['SERVER_PORT'])
+        try:
+            urls = self.app.url_map.bind_to_environ(environ, server_name=self.app.config['SERVER_NAME'])
+            endpoint, view_args = urls.match(method='GET')
+        except HTTPException:
+            return None
+
+        tables = self.cached_tables(endpoint)
+        if tables is None:
+            return None
+
+        url_root = get_current_url(environ, root_only=True)
+        versions_started_at = time.perf_counter()
+        versions = await self.versions.get(tables)
+        db_time_ms = (time.perf_counter() - versions_started_at) * 1000
+
+        entry = cache.get(cache_key(url_root, endpoint, view_args, scope['query_string'], versions))
+        if entry is None:
+            return None
+
+        body, cached_headers = entry
+        etag, _ = unquote_etag(cached_headers.get('ETag'))
+        if etag and parse_etags(headers.get('if-none-match')).contains_weak(etag):
+            response = status.HTTP_304_NOT_MODIFIED, {'ETag': cached_headers['ETag']}, b''
+        else:
+            response = status.HTTP_200_OK, dict(cached_headers), body
+
+        if self.app.config['REQUEST_METRICS']:
+            # The after_request hooks of the Flask application do not run
+            elapsed_ms = (time.perf_counter() - started_at) * 1000
+            response[1].update(metrics_headers(1, db_time_ms, elapsed_ms))
+
+        return response
+
+    @staticmethod
+    async def send_response(send, status_code, headers, body):
+        raw_headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+        if status_code != status.HTTP_304_NOT_MODIFIED:
+            raw_headers.append((b'content-length', str(len(body)).encode()))
+
+        await send({'type': 'http.response.start', 'status': status_code, 'headers': raw_headers})
+        await send({'type': 'http.response.body', 'body': body})
@@ -13,3 +13,4 @@ auth_api.add_resource(resources.UserLogin, '/login')
 auth_api.add_resource(resources.UserLogoutAccess, '/logout/access')
 auth_api.add_resource(resources.UserLogoutRefresh, '/logout/refresh')
 auth_api.add_resource(resources.TokenRefresh, '/token/refresh')
+auth_api.add_resource(resources.BlacklistStatsResource, '/blacklist/stats')
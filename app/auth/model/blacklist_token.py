@@ -9,17 +9,46 @@ class BlacklistToken(db.Model):
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     jti = db.Column(db.String(120), unique=True, nullable=False)
-    blacklisted_on = db.Column(db.DateTime, nullable=False)
+    blacklisted_on = db.Column(db.DateTime, nullable=False, index=True)
+    expires = db.Column(db.DateTime, nullable=True, index=True)
 
-    def __init__(self, jti):
+    def __init__(self, jti, expires=None):
         self.jti = jti
         self.blacklisted_on = datetime.datetime.now()
+        self.expires = expires
 
     @classmethod
     def is_jti_blacklisted(cls, jti):
         query = cls.query.filter_by(jti=jti).first()
         return bool(query)
 
+    @classmethod
+    def prune_expired(cls, batch_size=1000, max_lifetime=None):
+        """Deletes the tokens which have expired anyway, returns the number of deleted rows.
+
+        Rows are deleted and committed in batches of `batch_size`,
+        so the table is never locked for long. The rows revoked before the
+        expiration time was stored have no `expires`: they are deleted
+        `max_lifetime` (a timedelta, the longest lifetime of the tokens)
+        after their revocation, kept if it is None.
+        """
+        deleted = 0
+        while True:
+            now = datetime.datetime.now()
+            expired = cls.expires < now
+            if max_lifetime is not None:
+                expired = db.or_(expired, db.and_(cls.expires.is_(None),
+                                                  cls.blacklisted_on < now - max_lifetime))
+            ids = [row_id for row_id, in db.session.query(cls.id)
+                   .filter(expired)
+                   .limit(batch_size)]
+            if not ids:
+                return deleted
+
+            cls.query.filter(cls.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            deleted += len(ids)
+
     def __repr__(self):
         return '<id: jti: {}'.format(self.jti)
 
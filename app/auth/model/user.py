@@ -1,6 +1,6 @@
 import datetime
 from marshmallow import fields, validate
-from app import db, ma, bcrypt
+from app import db, ma, hasher
 
 
 class User(db.Model):
@@ -15,7 +15,7 @@ class User(db.Model):
 
     def __init__(self, username, password, admin=False):
         self.username = username
-        self.password = bcrypt.generate_password_hash(password).decode()
+        self.password = hasher.generate_password_hash(password)
         self.registered_on = datetime.datetime.now()
         self.admin = admin
 
@@ -29,7 +29,16 @@ class User(db.Model):
 
     @staticmethod
     def check_password(pw_hash, password):
-        return bcrypt.check_password_hash(pw_hash, password)
+        return hasher.check_password_hash(pw_hash, password)
+
+    def rehash_password_if_needed(self, password):
+        """Re-hashes the password if BCRYPT_LOG_ROUNDS has changed since it was hashed,
+        returns True if the hash was replaced"""
+        if not hasher.needs_rehash(self.password):
+            return False
+
+        self.password = hasher.generate_password_hash(password)
+        return True
 
     @classmethod
     def is_unique(cls, id, username):
@@ -1,5 +1,6 @@
+import datetime
 from functools import wraps
-from flask import request
+from flask import request, current_app
 from flask_restful import Resource
 from sqlalchemy.exc import SQLAlchemyError
 from flask_jwt_extended import (
@@ -14,10 +15,16 @@ from flask_jwt_extended import (
 )
 from .model.user import User, UserSchema
 from .model.blacklist_token import BlacklistToken
-from app import db, jwt
+from app import db, jwt, revoked_tokens
+from app.api.model.table_version import TableVersion
 from app.util import status
+from app.util.cache import TTLCache
+from app.util.database import replica_reads
+from app.util.hashing import HasherBusy
+from app.util.serializer import CompiledSerializer
 
 user_schema = UserSchema()
+user_serializer = CompiledSerializer(user_schema, User)
 
 
 def admin_required(func):
@@ -35,16 +42,54 @@ def admin_required(func):
     return wrapper
 
 
+def token_expires(raw_jwt):
+    """Returns the expiration time of a token, None if it never expires"""
+    if 'exp' not in raw_jwt:
+        return None
+    return datetime.datetime.fromtimestamp(raw_jwt['exp'])
+
+
+def get_claims_cache():
+    """Returns the cache of the admin flags of users (username -> (users version, is_admin)).
+
+    The cache is per process, an entry is used only while the version of
+    the users table is the one it was read at, so the registrations and the
+    deletions of every process invalidate it.
+    """
+    cache = current_app.extensions.get('user_claims_cache')
+    if cache is None:
+        cache = TTLCache(
+            maxsize=current_app.config['USER_CLAIMS_CACHE_SIZE'],
+            ttl=current_app.config['USER_CLAIMS_CACHE_TTL'],
+        )
+        current_app.extensions['user_claims_cache'] = cache
+
+    return cache
+
+
+def busy_response():
+    response = {'message': 'Server is busy, try again later'}
+    return response, status.HTTP_503_SERVICE_UNAVAILABLE, {'Retry-After': '1'}
+
+
 @jwt.user_claims_loader
 def add_claims_to_access_token(identity):
     """Store data in JWT: username and admin rights"""
+    cache = get_claims_cache()
+    version, = TableVersion.get_versions('users')
+    cached = cache.get(identity)
+
+    if cached is not None and cached[0] == version:
+        is_admin = cached[1]
+    else:
+        user = User.find_by_username(identity)
+        is_admin = bool(user and user.is_admin)
+        cache.set(identity, (version, is_admin))
+
     claims = {
         'username': identity,
-        'admin': False
+        'admin': is_admin
     }
-    user = User.find_by_username(identity)
-    if user:
-        claims['admin'] = user.is_admin
 
     return claims
 
@@ -72,8 +117,12 @@ class UserRegistration(Resource):
                 username=username,
                 password=request_dict['password'],
             )
+        except HasherBusy:
+            return busy_response()
 
+        try:
             db.session.add(user)
+            TableVersion.bump('users')
             db.session.commit()
 
             access_token = create_access_token(identity=username)
@@ -115,7 +164,25 @@ class UserLogin(Resource):
             response = {'message': 'User {} does not exist'.format(username)}
             return response, status.HTTP_404_NOT_FOUND
 
-        if User.check_password(current_user.password, password):
+        try:
+            password_is_valid = User.check_password(current_user.password, password)
+        except HasherBusy:
+            return busy_response()
+
+        try:
+            rehashed = password_is_valid and current_user.rehash_password_if_needed(password)
+        except HasherBusy:
+            # The rehash is retried on the next login
+            rehashed = False
+
+        if rehashed:
+            try:
+                db.session.commit()
+            except SQLAlchemyError:
+                # The old hash is still valid
+                db.session.rollback()
+
+        if password_is_valid:
             access_token = create_access_token(identity=username)
             refresh_token = create_refresh_token(identity=username)
             return {
@@ -131,12 +198,15 @@ class UserLogin(Resource):
 class UserLogoutAccess(Resource):
     @jwt_required
     def post(self):
-        jti = get_raw_jwt()['jti']
+        raw_jwt = get_raw_jwt()
+        jti = raw_jwt['jti']
+        expires = token_expires(raw_jwt)
         try:
-            revoked_token = BlacklistToken(jti=jti)
+            revoked_token = BlacklistToken(jti=jti, expires=expires)
 
             db.session.add(revoked_token)
             db.session.commit()
+            revoked_tokens.add(jti, expires)
 
             response = {'message': 'Access token has been revoked'}
             return response
@@ -150,12 +220,15 @@ class UserLogoutAccess(Resource):
 class UserLogoutRefresh(Resource):
     @jwt_refresh_token_required
     def post(self):
-        jti = get_raw_jwt()['jti']
+        raw_jwt = get_raw_jwt()
+        jti = raw_jwt['jti']
+        expires = token_expires(raw_jwt)
         try:
-            revoked_token = BlacklistToken(jti=jti)
+            revoked_token = BlacklistToken(jti=jti, expires=expires)
 
             db.session.add(revoked_token)
             db.session.commit()
+            revoked_tokens.add(jti, expires)
 
             response = {'message': 'Refresh token has been revoked'}
             return response
@@ -183,8 +256,8 @@ class TokenRefresh(Resource):
 class UserResource(Resource):
     @admin_required
     def get(self, id):
-        user = User.query.get_or_404(id)
-        result = user_schema.dump(user).data
+        user = user_serializer.query().filter(User.id == id).first_or_404()
+        result = user_serializer.serialize([user], {})[0]
         return result
 
     @admin_required
@@ -192,6 +265,7 @@ class UserResource(Resource):
         user = User.query.get_or_404(id)
         try:
             db.session.delete(user)
+            TableVersion.bump('users')
             db.session.commit()
 
             response = {}
@@ -207,8 +281,15 @@ class UserResource(Resource):
 
 class UserListResource(Resource):
     @admin_required
+    @replica_reads
     def get(self):
-        users = User.query.all()
-        result = user_schema.dump(users, many=True).data
+        users = user_serializer.query().all()
+        result = user_serializer.dump(users)
 
         return result
+
+
+class BlacklistStatsResource(Resource):
+    @admin_required
+    def get(self):
+        return revoked_tokens.stats()
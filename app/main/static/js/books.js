@@ -35,12 +35,23 @@ booksApp.controller('BodyCtrl', function($scope) {
 
 });
 
-booksApp.controller('BookTableCtrl', function($scope, $http) {
-
-    $http.get(booksListUrl).
+// Lists are returned a page at a time, follows X-Next-Cursor until the last page
+getAllPages = function($http, url, items) {
+    $http.get(url).
         then(function(response) {
-            $scope.books = response.data;
+            Array.prototype.push.apply(items, response.data);
+
+            var cursor = response.headers('X-Next-Cursor');
+            if (cursor) {
+                getAllPages($http, url.split('?')[0] + '?cursor=' + encodeURIComponent(cursor), items);
+            }
         });
+}
+
+booksApp.controller('BookTableCtrl', function($scope, $http) {
+
+    $scope.books = [];
+    getAllPages($http, booksListUrl, $scope.books);
 
     $scope.showAuthors = function(authors) {
         authors_list = '';
@@ -58,10 +69,8 @@ booksApp.controller('BookTableCtrl', function($scope, $http) {
 
 booksApp.controller('AuthorTableCtrl', function($scope, $http) {
 
-    $http.get(authorsListUrl).
-        then(function(response) {
-            $scope.authors = response.data;
-        });
+    $scope.authors = [];
+    getAllPages($http, authorsListUrl, $scope.authors);
 
     $scope.showBooks = function(books) {
         books_list = '';
@@ -0,0 +1,154 @@
+import datetime
+import random
+from sqlalchemy import func
+from app import db, hasher
+from app.api.model.author import Author
+from app.api.model.book import Book, book_author
+from app.api.model.book_search import BookSearch
+from app.api.model.table_version import TableVersion
+from app.auth.model.user import User
+from app.util.chunks import iter_chunked
+
+# Rows per executemany INSERT
+SEED_CHUNK_SIZE = 10000
+
+# Set on the SQLite connection of the load, which is discarded after it
+SEED_SQLITE_PRAGMAS = {
+    'synchronous': 'OFF',
+    'cache_size': -262144,
+    'temp_store': 'MEMORY',
+}
+
+FIRST_ISBN = 9780000000000
+
+WORDS = (
+    'art', 'blue', 'city', 'code', 'dark', 'data', 'deep', 'dream', 'earth', 'empire', 'fire', 'flask',
+    'garden', 'ghost', 'glass', 'gold', 'guide', 'heart', 'history', 'house', 'iron', 'island', 'king',
+    'last', 'light', 'lost', 'machine', 'moon', 'mountain', 'night', 'ocean', 'python', 'queen', 'river',
+    'road', 'sea', 'secret', 'shadow', 'silver', 'sky', 'song', 'star', 'stone', 'storm', 'story', 'sun',
+    'theory', 'time', 'tower', 'war', 'water', 'web', 'wind', 'winter', 'wolf', 'world',
+)
+FIRSTNAMES = (
+    'Anna', 'Boris', 'Clara', 'David', 'Elena', 'Fedor', 'Grace', 'Hans', 'Irina', 'James', 'Kenneth',
+    'Laura', 'Mark', 'Nina', 'Oleg', 'Paula', 'Robert', 'Sofia', 'Thomas', 'Vera',
+)
+LASTNAMES = (
+    'Adams', 'Brown', 'Clark', 'Davis', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ivanov', 'Jones',
+    'Klein', 'Lopez', 'Miller', 'Novak', 'Orlov', 'Petrov', 'Reitz', 'Smith', 'Taylor', 'Weber',
+)
+
+
+def _max(column, default=0):
+    return db.session.query(func.max(column)).scalar() or default
+
+
+def _generate_books(rng, first_id, books, first_isbn, first_author_id, authors,
+                    authors_per_book, author_skew, year_min, year_max):
+    """Yields the rows of the books with the rows of their links to the authors"""
+    sizes = range(1, len(authors_per_book) + 1)
+    for book_id in range(first_id, first_id + books):
+        book = {
+            'id': book_id,
+            'title': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).capitalize(),
+            'isbn': first_isbn + book_id - first_id,
+            'year': rng.randint(year_min, year_max),
+            'version': 1,
+        }
+
+        # The first authors get the most books, the more the higher the skew
+        count = rng.choices(sizes, authors_per_book)[0]
+        author_ids = {first_author_id + int(authors * rng.random() ** author_skew) for _ in range(count)}
+        yield book, [{'book_id': book_id, 'author_id': author_id} for author_id in author_ids]
+
+
+def generate_dataset(books, authors, users, authors_per_book=(70, 20, 7, 3), author_skew=2.0,
+                     year_min=1950, year_max=2020, password='password', random_seed=None):
+    """Adds generated books, authors and users to the database, in a single transaction.
+
+    The rows are inserted with executemany Core INSERTs of SEED_CHUNK_SIZE
+    rows, with ids following the existing ones, so the database must not be
+    written to meanwhile: on PostgreSQL the tables are locked against
+    writes, elsewhere the concurrent writes make either side fail. A book
+    has 1, 2, ... authors with the weights `authors_per_book`, picked among
+    the new authors with a power law: with an `author_skew` of 1 the books
+    are spread evenly, above it the first authors write most of them. The
+    users, named user<id>, share a single hash of `password`.
+
+    Returns the number of rows inserted per table. The session must not
+    have pending writes, it is committed (rolled back on errors) and removed.
+    """
+    if books and not authors:
+        raise ValueError('The books require authors')
+
+    rng = random.Random(random_seed)
+    connection = db.session.connection()
+
+    is_sqlite = connection.dialect.name == 'sqlite'
+    if is_sqlite:
+        # Before the first INSERT: SQLite refuses to change `synchronous` in a transaction
+        for name, value in SEED_SQLITE_PRAGMAS.items():
+            connection.execute('PRAGMA {} = {}'.format(name, value))
+
+    is_postgresql = connection.dialect.name == 'postgresql'
+    if is_postgresql:
+        # Until the commit, so that no other id is taken after the max() below
+        connection.execute('LOCK TABLE {} IN EXCLUSIVE MODE'.format(', '.join(
+            table.name for table in (Author.__table__, Book.__table__, book_author, User.__table__))))
+
+    try:
+        first_author_id = _max(Author.id) + 1
+        rows = ({
+            'id': author_id,
+            'firstname': rng.choice(FIRSTNAMES),
+            # The ids keep the names unique
+            'lastname': '{}{}'.format(rng.choice(LASTNAMES), author_id),
+            'version': 1,
+        } for author_id in range(first_author_id, first_author_id + authors))
+        for chunk in iter_chunked(rows, SEED_CHUNK_SIZE):
+            connection.execute(Author.__table__.insert(), chunk)
+
+        first_book_id = _max(Book.id) + 1
+        first_isbn = max(_max(Book.isbn) + 1, FIRST_ISBN)
+        links = 0
+        generated = _generate_books(rng, first_book_id, books, first_isbn, first_author_id, authors,
+                                    authors_per_book, author_skew, year_min, year_max)
+        for chunk in iter_chunked(generated, SEED_CHUNK_SIZE):
+            connection.execute(Book.__table__.insert(), [book for book, _ in chunk])
+            book_links = [link for _, links_of_book in chunk for link in links_of_book]
+            connection.execute(book_author.insert(), book_links)
+            links += len(book_links)
+
+        if users:
+            # Hashing every password would take longer than the books
+            password_hash = hasher.generate_password_hash(password)
+            registered_on = datetime.datetime.now()
+            first_user_id = _max(User.id) + 1
+            rows = ({
+                'id': user_id,
+                'username': 'user{}'.format(user_id),
+                'password': password_hash,
+                'registered_on': registered_on,
+                'admin': False,
+            } for user_id in range(first_user_id, first_user_id + users))
+            for chunk in iter_chunked(rows, SEED_CHUNK_SIZE):
+                connection.execute(User.__table__.insert(), chunk)
+
+        if is_postgresql:
+            # The explicit ids do not advance the SERIAL sequences of the next INSERTs
+            for model, count in ((Author, authors), (Book, books), (User, users)):
+                if count:
+                    connection.execute(
+                        "SELECT setval(pg_get_serial_sequence('{0}', 'id'), (SELECT max(id) FROM {0}))".format(
+                            model.__tablename__))
+
+        if books:
+            BookSearch.index_range(first_book_id, first_book_id + books - 1)
+        TableVersion.bump('authors', 'books', 'users')
+        db.session.commit()
+    finally:
+        db.session.remove()
+        if is_sqlite:
+            # The pooled connections with the pragmas of the load are closed
+            db.engine.dispose()
+
+    return {'books': books, 'authors': authors, 'book_authors': links, 'users': users}
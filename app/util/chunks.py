@@ -0,0 +1,21 @@
+import itertools
+
+
+def chunked(items, size):
+    """Splits a sequence into lists of at most `size` items.
+
+    Used to keep `IN (...)` lists and executemany batches below
+    the bound parameter limits of the database drivers.
+    """
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def iter_chunked(items, size):
+    """Like `chunked`, but consumes an iterable lazily, one list at a time"""
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
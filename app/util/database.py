@@ -0,0 +1,266 @@
+import collections
+import itertools
+import math
+import threading
+import time
+import weakref
+from functools import wraps
+import flask_sqlalchemy
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SignallingSession, get_state
+from sqlalchemy import column, event, orm, select, table
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+from werkzeug.urls import url_decode, url_encode
+
+# The versions bumped by every write, see app/api/model/table_version.py
+_table_versions = table('table_versions', column('name'), column('version'))
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+    """Flask-SQLAlchemy with the engine profile of the configuration.
+
+    SQLALCHEMY_POOL_PRE_PING checks the pooled connections before using
+    them, like the other SQLALCHEMY_POOL_* settings it is passed to
+    `create_engine`. On SQLite, the SQLALCHEMY_SQLITE_PRAGMAS are run on
+    every new connection and a pool size keeps the connections open (in a
+    QueuePool, shared between threads) instead of opening one per request.
+
+    The sessions read from the replica the `replica_reads` handlers are
+    routed to, see ReplicaRouter.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.replicas = ReplicaRouter(self)
+        self._configured_engines = weakref.WeakSet()
+        self._configure_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_POOL_PRE_PING', False)
+        app.config.setdefault('SQLALCHEMY_SQLITE_PRAGMAS', None)
+        super().init_app(app)
+        self.replicas.init_app(app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_pool_defaults(self, app, options):
+        super().apply_pool_defaults(app, options)
+        if app.config['SQLALCHEMY_POOL_PRE_PING']:
+            options['pool_pre_ping'] = True
+
+    def apply_driver_hacks(self, app, info, options):
+        super().apply_driver_hacks(app, info, options)
+
+        if info.drivername == 'sqlite' and options.get('pool_size') and 'poolclass' not in options:
+            # The SQLite dialect of SQLAlchemy 1.2 does not pool file databases
+            options['poolclass'] = QueuePool
+            options.setdefault('connect_args', {})['check_same_thread'] = False
+
+    def get_engine(self, app=None, bind=None):
+        engine = super().get_engine(app, bind)
+
+        # Engines are created lazily, so this runs before their first connection
+        if engine not in self._configured_engines:
+            with self._configure_lock:
+                if engine not in self._configured_engines:
+                    self._configure_engine(engine, self.get_app(app))
+                    self._configured_engines.add(engine)
+
+        return engine
+
+    def _configure_engine(self, engine, app):
+        pragmas = app.config['SQLALCHEMY_SQLITE_PRAGMAS']
+        if pragmas and engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', _pragmas_setter(pragmas))
+
+
+def _pragmas_setter(pragmas):
+    statements = ['PRAGMA {} = {}'.format(name, value) for name, value in pragmas.items()]
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+    return set_pragmas
+
+
+class RoutingSession(SignallingSession):
+    """Runs the queries on the `replica` bind when one is set, the flushes
+    and the commits stay on the primary"""
+
+    replica = None
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.replica is not None and not self._flushing:
+            return get_state(self.app).db.get_engine(self.app, bind=self.replica)
+        return super().get_bind(mapper, clause)
+
+    def commit(self):
+        super().commit()
+        get_state(self.app).db.replicas.committed()
+
+
+class ReplicaRouter:
+    """Picks the replica of the read-only requests among the SQLALCHEMY_BINDS
+    named by SQLALCHEMY_REPLICA_BINDS, in turn.
+
+    The table versions of the primary and of the replicas are read at most
+    every SQLALCHEMY_REPLICA_CHECK_INTERVAL seconds, by the request running
+    when the check is due. The lag of a replica is the age of the latest
+    primary versions it has. A replica serves reads if its lag is at most
+    SQLALCHEMY_REPLICA_MAX_LAG seconds, the primary serves them otherwise,
+    failing replicas included.
+
+    So that clients read their own writes, whichever process serves them,
+    the responses to the requests which committed carry the table versions
+    of the primary in the SQLALCHEMY_REPLICA_COOKIE cookie. The reads of
+    these clients only go to the replicas last seen with these versions.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.binds = ()
+        self.check_interval = 1
+        self.max_lag = 5
+        self.cookie_name = 'read_after'
+        self._lock = threading.Lock()
+        self._turns = itertools.count()
+        self._checked_at = 0.0
+        # (checked_at, versions) of the primary, the last max_lag seconds
+        self._history = collections.deque()
+        self._synced_at = {}
+        self._replica_versions = {}
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICA_BINDS', ())
+        app.config.setdefault('SQLALCHEMY_REPLICA_CHECK_INTERVAL', 1)
+        app.config.setdefault('SQLALCHEMY_REPLICA_MAX_LAG', 5)
+        app.config.setdefault('SQLALCHEMY_REPLICA_COOKIE', 'read_after')
+
+        self.binds = tuple(app.config['SQLALCHEMY_REPLICA_BINDS'])
+        self.check_interval = app.config['SQLALCHEMY_REPLICA_CHECK_INTERVAL']
+        self.max_lag = app.config['SQLALCHEMY_REPLICA_MAX_LAG']
+        self.cookie_name = app.config['SQLALCHEMY_REPLICA_COOKIE']
+        self._checked_at = 0.0
+        self._history.clear()
+        self._synced_at = {}
+        self._replica_versions = {}
+
+        if self.binds:
+            app.after_request(self._set_read_after)
+
+    def committed(self):
+        """Marks the request, its response carries the versions of the primary"""
+        if self.binds and has_request_context():
+            g.replica_committed = True
+
+    def _set_read_after(self, response):
+        if not g.pop('replica_committed', False):
+            return response
+
+        try:
+            versions = self._versions(current_app, None)
+        except SQLAlchemyError:
+            return response
+
+        # After max_lag seconds, every replica in use has the commit anyway
+        response.set_cookie(self.cookie_name, url_encode(versions, sort=True),
+                            max_age=math.ceil(self.max_lag), httponly=True)
+        return response
+
+    def read_after(self):
+        """The table versions the client of the request has written, from its cookie"""
+        versions = {}
+        for name, value in url_decode(request.cookies.get(self.cookie_name, '')).items():
+            try:
+                versions[name] = int(value)
+            except ValueError:
+                pass
+        return versions
+
+    def lags(self):
+        """Seconds since each replica was last seen in sync, None if never"""
+        now = time.time()
+        return {bind: now - self._synced_at[bind] if bind in self._synced_at else None
+                for bind in self.binds}
+
+    def choose(self, app, read_after=None):
+        """The bind to read from, None for the primary.
+
+        `read_after` maps the names of tables to the versions the replica must have.
+        """
+        if not self.binds:
+            return None
+
+        now = time.time()
+        if now - self._checked_at >= self.check_interval:
+            self.check(app)
+
+        read_after = read_after or {}
+        replicas = [bind for bind, synced_at in list(self._synced_at.items())
+                    if now - synced_at <= self.max_lag and _has_versions(self._replica_versions[bind], read_after)]
+        if not replicas:
+            return None
+
+        return sorted(replicas)[next(self._turns) % len(replicas)]
+
+    def check(self, app):
+        """Compares the table versions of the replicas with the ones of the primary"""
+        # One request checks, the others keep the previous state
+        if not self._lock.acquire(blocking=False):
+            return
+
+        try:
+            self._checked_at = checked_at = time.time()
+            try:
+                primary = self._versions(app, None)
+            except SQLAlchemyError:
+                return
+
+            self._history.append((checked_at, primary))
+            while self._history[0][0] < checked_at - self.max_lag:
+                self._history.popleft()
+
+            for bind in self.binds:
+                try:
+                    replica = self._versions(app, bind)
+                except SQLAlchemyError:
+                    # Not used until it answers again
+                    self._synced_at.pop(bind, None)
+                    self._replica_versions.pop(bind, None)
+                    continue
+
+                # It has every commit made before the primary was read then
+                synced = [seen_at for seen_at, versions in self._history if _has_versions(replica, versions)]
+                if synced:
+                    self._synced_at[bind] = max(synced[-1], self._synced_at.get(bind, 0.0))
+                self._replica_versions[bind] = replica
+        finally:
+            self._lock.release()
+
+    def _versions(self, app, bind):
+        engine = self.db.get_engine(app, bind=bind)
+        return dict(engine.execute(select([_table_versions.c.name, _table_versions.c.version])).fetchall())
+
+
+def _has_versions(versions, required):
+    return all(versions.get(name, -1) >= version for name, version in required.items())
+
+
+def replica_reads(func):
+    """Routes the queries of a read-only handler to a replica, if one is in sync.
+
+    Put it under the authentication decorators, so that the tokens are
+    checked against the primary.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        db = get_state(current_app).db
+        db.session().replica = db.replicas.choose(current_app._get_current_object(), db.replicas.read_after())
+        return func(*args, **kwargs)
+
+    return wrapper
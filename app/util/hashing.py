@@ -0,0 +1,84 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """Raised when too many passwords are already waiting to be hashed"""
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+
+def _check_password(pw_hash, password):
+    return bcrypt.checkpw(password.encode(), pw_hash.encode())
+
+
+class PasswordHasher:
+    """bcrypt hashing in a pool of BCRYPT_POOL_SIZE processes.
+
+    Hashing is CPU bound by design, running it in separate processes keeps
+    the request threads free for cheap requests. At most BCRYPT_MAX_PENDING
+    jobs may be queued, beyond that HasherBusy is raised. With a pool size
+    of 0 hashing runs in the calling thread.
+
+    Like Flask-Bcrypt, the settings are kept on the extension itself,
+    so it can be used outside of an application context.
+    """
+
+    def __init__(self, app=None):
+        self.log_rounds = 12
+        self.pool_size = 0
+        self._slots = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.log_rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.pool_size = app.config['BCRYPT_POOL_SIZE']
+
+        max_pending = app.config['BCRYPT_MAX_PENDING']
+        self._slots = threading.BoundedSemaphore(max_pending) if max_pending else None
+
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _get_executor(self):
+        # Created on first use, so the worker processes are forked
+        # by the server worker that uses them
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.pool_size)
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self.pool_size:
+            return func(*args)
+
+        slots = self._slots
+        if slots is not None and not slots.acquire(blocking=False):
+            raise HasherBusy()
+
+        try:
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def generate_password_hash(self, password):
+        return self._run(_hash_password, password, self.log_rounds)
+
+    def check_password_hash(self, pw_hash, password):
+        return self._run(_check_password, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """Checks whether the hash was made with another cost than BCRYPT_LOG_ROUNDS"""
+        # $2b$12$<salt and hash>
+        rounds = int(pw_hash.split('$')[2])
+        return rounds != self.log_rounds
@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_listen_lock = threading.Lock()
+_listening = False
+
+
+class _RequestStats:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+
+
+def _current_stats():
+    # Statements run outside of the requests (commands, threads) are not counted
+    return g.get('request_stats') if has_app_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault('request_stats_started_at', []).append(time.perf_counter())
+
+
+def _statement_done(conn):
+    stats = _current_stats()
+    started_at = conn.info.get('request_stats_started_at')
+    if stats is not None and started_at:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started_at.pop()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _statement_done(conn)
+
+
+def _handle_error(exception_context):
+    # The failed statements count too
+    if exception_context.connection is not None:
+        _statement_done(exception_context.connection)
+
+
+def _listen_to_engines():
+    """Hooks the statements of every engine, once per process"""
+    global _listening
+
+    with _listen_lock:
+        if not _listening:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+            _listening = True
+
+
+def metrics_headers(queries, db_time_ms, elapsed_ms):
+    """The X-DB-Queries, X-DB-Time-Ms and Server-Timing headers of a response"""
+    return {
+        'X-DB-Queries': str(queries),
+        'X-DB-Time-Ms': '{:.1f}'.format(db_time_ms),
+        'Server-Timing': 'db;dur={:.1f};desc="{} queries", app;dur={:.1f}'.format(db_time_ms, queries, elapsed_ms),
+    }
+
+
+class RequestMetrics:
+    """Counts the SQL statements of every request and the time spent running them.
+
+    Enabled by REQUEST_METRICS. The responses then carry the X-DB-Queries,
+    X-DB-Time-Ms and Server-Timing headers, and the requests running more
+    statements than REQUEST_METRICS_QUERY_BUDGET or taking longer than
+    REQUEST_METRICS_TIME_BUDGET_MS are logged as warnings. The statements
+    of the streamed bodies run after the headers are sent, they are not
+    counted.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('REQUEST_METRICS', False)
+        app.config.setdefault('REQUEST_METRICS_QUERY_BUDGET', None)
+        app.config.setdefault('REQUEST_METRICS_TIME_BUDGET_MS', None)
+
+        if not app.config['REQUEST_METRICS']:
+            return
+
+        _listen_to_engines()
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    @staticmethod
+    def _start():
+        g.request_stats = _RequestStats()
+
+    @staticmethod
+    def _finish(response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+
+        elapsed_ms = (time.perf_counter() - stats.started_at) * 1000
+        db_time_ms = stats.db_time * 1000
+
+        for name, value in metrics_headers(stats.queries, db_time_ms, elapsed_ms).items():
+            response.headers.add(name, value)
+
+        query_budget = current_app.config['REQUEST_METRICS_QUERY_BUDGET']
+        time_budget = current_app.config['REQUEST_METRICS_TIME_BUDGET_MS']
+        if (query_budget is not None and stats.queries > query_budget) or \
+                (time_budget is not None and elapsed_ms > time_budget):
+            logger.warning('%s %s (%s): %d queries, %.1f ms, %.1f ms in the database',
+                           request.method, request.full_path.rstrip('?'), request.endpoint,
+                           stats.queries, elapsed_ms, db_time_ms)
+
+        return response
@@ -0,0 +1,199 @@
+import datetime
+import hashlib
+import logging
+import math
+import threading
+import time
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed size Bloom filter of strings.
+
+    `key in bloom` is False for every key that was never added and True
+    for the added ones plus roughly `error_rate` of the others.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class _RevokedTokensState:
+    def __init__(self, capacity, error_rate):
+        self.error_rate = error_rate
+        self.bloom = BloomFilter(capacity, error_rate)
+        # jti -> expiration time of the token (None if it never expires)
+        self.jtis = {}
+        # Latest blacklisted_on loaded, None until the first refresh
+        self.loaded_until = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+        self.counters = {
+            'negatives': 0,
+            'hits': 0,
+            'false_positives': 0,
+            'refreshes': 0,
+        }
+
+    def add(self, jti, expires):
+        if jti in self.jtis:
+            return
+
+        self.jtis[jti] = expires
+        if len(self.jtis) > self.bloom.capacity:
+            # Too many keys for the error rate, rebuild the filter twice as large
+            self.rebuild(self.bloom.capacity * 2)
+        else:
+            self.bloom.add(jti)
+
+    def rebuild(self, capacity):
+        bloom = BloomFilter(capacity, self.error_rate)
+        for jti in self.jtis:
+            bloom.add(jti)
+        self.bloom = bloom
+
+    def drop_expired(self, now):
+        """Forgets the tokens which can not be used anyway"""
+        expired = [jti for jti, expires in self.jtis.items() if expires is not None and expires < now]
+        if expired:
+            for jti in expired:
+                del self.jtis[jti]
+            # A Bloom filter can not delete keys
+            self.rebuild(self.bloom.capacity)
+
+
+class RevokedTokens:
+    """In-process copy of the blacklist_tokens table.
+
+    Token ids are kept in an exact set behind a Bloom filter. The rows
+    revoked by other workers are pulled every JWT_BLACKLIST_REFRESH_INTERVAL
+    seconds, so checking a token normally does not touch the database.
+    Every refresh reads again the last JWT_BLACKLIST_REFRESH_OVERLAP seconds
+    of rows: the ids and times are allocated before the commit, a row may
+    become visible after later ones.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['revoked_tokens'] = _RevokedTokensState(
+            capacity=app.config['JWT_BLACKLIST_BLOOM_CAPACITY'],
+            error_rate=app.config['JWT_BLACKLIST_BLOOM_ERROR_RATE'],
+        )
+
+        if app.config['JWT_BLACKLIST_PRUNE_INTERVAL']:
+            # Only in the processes serving requests, not in the commands
+            app.before_first_request(lambda: BlacklistSweeper(app).start())
+
+    @property
+    def _state(self):
+        return current_app.extensions['revoked_tokens']
+
+    def refresh(self, force=False):
+        """Loads the tokens revoked since the previous refresh"""
+        from app.auth.model.blacklist_token import BlacklistToken
+
+        state = self._state
+        interval = current_app.config['JWT_BLACKLIST_REFRESH_INTERVAL']
+        if not force and state.loaded_at is not None and time.monotonic() - state.loaded_at < interval:
+            return
+
+        with state.lock:
+            query = BlacklistToken.query \
+                .with_entities(BlacklistToken.jti, BlacklistToken.expires, BlacklistToken.blacklisted_on)
+            if state.loaded_until is not None:
+                overlap = datetime.timedelta(seconds=current_app.config['JWT_BLACKLIST_REFRESH_OVERLAP'])
+                query = query.filter(BlacklistToken.blacklisted_on >= state.loaded_until - overlap)
+
+            for jti, expires, blacklisted_on in query:
+                state.add(jti, expires)
+                if state.loaded_until is None or blacklisted_on > state.loaded_until:
+                    state.loaded_until = blacklisted_on
+
+            state.drop_expired(datetime.datetime.now())
+            state.loaded_at = time.monotonic()
+            state.counters['refreshes'] += 1
+
+    def add(self, jti, expires=None):
+        """Registers a token revoked by this worker"""
+        state = self._state
+        with state.lock:
+            state.add(jti, expires)
+
+    def is_revoked(self, jti):
+        self.refresh()
+
+        state = self._state
+        if jti not in state.bloom:
+            state.counters['negatives'] += 1
+            return False
+
+        if jti in state.jtis:
+            state.counters['hits'] += 1
+            return True
+
+        state.counters['false_positives'] += 1
+        return False
+
+    def stats(self):
+        state = self._state
+        stats = dict(state.counters)
+        stats['size'] = len(state.jtis)
+        return stats
+
+
+def max_token_lifetime(config):
+    """The longest lifetime of the access and refresh tokens, None if some never expire"""
+    lifetimes = (config['JWT_ACCESS_TOKEN_EXPIRES'], config['JWT_REFRESH_TOKEN_EXPIRES'])
+    if not all(lifetimes):
+        return None
+    return max(lifetimes)
+
+
+class BlacklistSweeper(threading.Thread):
+    """Background thread deleting the expired rows of blacklist_tokens
+    every JWT_BLACKLIST_PRUNE_INTERVAL seconds"""
+
+    def __init__(self, app):
+        super().__init__(name='blacklist-sweeper', daemon=True)
+        self.app = app
+        self.interval = app.config['JWT_BLACKLIST_PRUNE_INTERVAL']
+        self.batch_size = app.config['JWT_BLACKLIST_PRUNE_BATCH_SIZE']
+        self.max_lifetime = max_token_lifetime(app.config)
+
+    def run(self):
+        from app import db
+        from app.auth.model.blacklist_token import BlacklistToken
+
+        while True:
+            time.sleep(self.interval)
+            with self.app.app_context():
+                try:
+                    deleted = BlacklistToken.prune_expired(self.batch_size, self.max_lifetime)
+                    if deleted:
+                        logger.info('Pruned %d expired revoked tokens', deleted)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Failed to prune expired revoked tokens')
+                finally:
+                    db.session.remove()
@@ -0,0 +1,250 @@
+import re
+from collections import namedtuple
+from flask import url_for
+from flask_marshmallow.fields import URLFor
+from marshmallow import fields
+from sqlalchemy import func, inspect
+from sqlalchemy.orm import configure_mappers
+from app import db
+from .chunks import chunked
+
+# Parent ids per IN clause of the relationship queries
+IDS_CHUNK_SIZE = 500
+
+# Fields serializing the value of their column as is
+PASSTHROUGH_FIELDS = (fields.Integer, fields.String, fields.Boolean)
+
+# Stands for the row value in the URL built once per dump
+_URL_PLACEHOLDER = 7239418560237
+_tpl_pattern = re.compile(r'\s*<\s*(\S*)\s*>\s*')
+
+Related = namedtuple('Related', 'groups nested')
+
+_Compiled = namedtuple('_Compiled', 'columns factory urls relationships')
+
+
+class CompiledSerializer:
+    """Serializes row tuples the way `schema.dump(..., many=True)` serializes
+    model instances, with the same keys in the same order and the same values.
+
+    The fields of the schema are compiled once into a function building the
+    dict of a row with a single dict display: column fields are read by
+    index, the URLs are built by concatenating a prefix resolved once per
+    dump with the id, and nested many-to-many relationships are loaded with
+    one query per page of parents.
+
+    Only the fields the API schemas use are supported: columns, URLFor
+    fields with a single `<attribute>` parameter and nested relationships
+    with a secondary table. The rows are the tuples of `query()`.
+
+    `embed` names the relationships serialized as nested records (all of
+    them by default), the others are serialized as lists of ids. `limit`
+    caps the number of related rows loaded per parent.
+    """
+
+    def __init__(self, schema, model=None, extra_columns=(), embed=None, limit=None):
+        self.schema = schema
+        self.model = model or schema.opts.model
+        # Columns selected but not serialized, e.g. for the ETags
+        self.extra_columns = tuple(extra_columns)
+        self.embed = embed
+        self.limit = limit
+        self._compiled = None
+        self._variants = {}
+
+    @property
+    def compiled(self):
+        # Compiled on first use, once all the mappers are configured
+        if self._compiled is None:
+            self._compiled = self._compile()
+        return self._compiled
+
+    @property
+    def columns(self):
+        return [getattr(self.model, name) for name in self.compiled.columns]
+
+    def query(self):
+        """Selects the columns of the rows to serialize"""
+        return db.session.query(*self.columns)
+
+    def select(self, only=None, embed=None, limit=None):
+        """A variant of the serializer, compiled once per set of arguments.
+
+        `only` is the argument of the marshmallow schemas (nested fields
+        included, as `authors.lastname`), only the columns, URLs and
+        relationships of these fields are selected and built.
+        """
+        key = (only, embed, limit)
+        serializer = self._variants.get(key)
+        if serializer is None:
+            schema = type(self.schema)(only=only) if only is not None else self.schema
+            serializer = CompiledSerializer(schema, self.model, self.extra_columns, embed, limit)
+            self._variants[key] = serializer
+
+        return serializer
+
+    def load_related(self, rows):
+        """Loads the rows of the nested relationships of `rows`, grouped by parent id"""
+        related = {}
+        if not rows:
+            return related
+
+        pk = self.compiled.columns.index(self._pk_name())
+        parent_ids = sorted({row[pk] for row in rows})
+
+        for name, relationship, serializer in self.compiled.relationships:
+            groups = {}
+            for chunk in chunked(parent_ids, IDS_CHUNK_SIZE):
+                for row in serializer._related_query(relationship, chunk, self.limit):
+                    groups.setdefault(row[-1], []).append(row)
+
+            children = [row for group in groups.values() for row in group]
+            related[name] = Related(groups, serializer.load_related(children))
+
+        return related
+
+    @staticmethod
+    def related_rows(related, name, parent_id):
+        """The rows of the relationship loaded for a parent, none if it was not loaded"""
+        if name not in related:
+            return ()
+        return related[name].groups.get(parent_id, ())
+
+    def serialize(self, rows, related):
+        serialize_row = self._row_serializer(related)
+        return [serialize_row(row) for row in rows]
+
+    def dump(self, rows):
+        return self.serialize(rows, self.load_related(rows))
+
+    def _pk_name(self):
+        return inspect(self.model).primary_key[0].key
+
+    def _related_query(self, relationship, parent_ids, limit=None):
+        # The parent id is selected last, so the indexes of the columns
+        # are the ones of query()
+        parent_column = relationship.synchronize_pairs[0][1]
+        target_column, secondary_column = relationship.secondary_synchronize_pairs[0]
+
+        query = self.query() \
+            .select_from(self.model) \
+            .join(relationship.secondary, target_column == secondary_column) \
+            .filter(parent_column.in_(parent_ids))
+
+        if limit is None:
+            return query.add_columns(parent_column).order_by(parent_column, target_column)
+
+        # The first `limit` rows of every parent, numbered by a window function
+        # (SQLite 3.25+, MySQL 8.0+)
+        position = func.row_number().over(partition_by=parent_column, order_by=target_column)
+        subquery = query.add_columns(position.label('position'), parent_column.label('parent_id')).subquery()
+
+        return db.session.query(*subquery.c) \
+            .filter(subquery.c.position <= limit) \
+            .order_by(subquery.c.parent_id, subquery.c.position)
+
+    def _row_serializer(self, related):
+        compiled = self.compiled
+
+        urls = []
+        for endpoint, params in compiled.urls:
+            url = url_for(endpoint, **params)
+            prefix, suffix = url.split(str(_URL_PLACEHOLDER))
+            urls.append((prefix, suffix))
+
+        groups = []
+        nested = []
+        for name, _, serializer in compiled.relationships:
+            group = related.get(name, Related({}, {}))
+            groups.append(group.groups)
+            nested.append(serializer._row_serializer(group.nested))
+
+        return compiled.factory(urls, groups, nested)
+
+    def _compile(self):
+        configure_mappers()
+        mapper = inspect(self.model)
+
+        columns = []
+
+        def column_index(name):
+            if name not in columns:
+                columns.append(name)
+            return columns.index(name)
+
+        pk = column_index(self._pk_name())
+        namespace = {}
+        items = []
+        urls = []
+        relationships = []
+
+        for name, field in self.schema.fields.items():
+            if field.load_only:
+                continue
+
+            if isinstance(field, URLFor):
+                params = {}
+                placeholders = []
+                for param, value in field.params.items():
+                    match = _tpl_pattern.match(str(value))
+                    if match:
+                        placeholders.append(match.group(1))
+                        value = _URL_PLACEHOLDER
+                    params[param] = value
+
+                if len(placeholders) != 1 or placeholders[0] not in mapper.columns:
+                    raise TypeError('Unable to compile the URL field {!r}'.format(name))
+
+                index = len(urls)
+                urls.append((field.endpoint, params))
+                value = 'url{0}[0] + str(row[{1}]) + url{0}[1]'.format(index, column_index(placeholders[0]))
+
+            elif isinstance(field, fields.Nested):
+                relationship = mapper.relationships.get(field.attribute or name)
+                if relationship is None or relationship.secondary is None or not field.many:
+                    raise TypeError('Unable to compile the nested field {!r}'.format(name))
+
+                index = len(relationships)
+                target = relationship.mapper.class_
+                if self.embed is None or name in self.embed:
+                    nested_schema = field.schema
+                    value = '[nested{0}(child) for child in groups{0}.get(row[{1}], ())]'
+                else:
+                    # Only the primary key, the first column of the nested rows
+                    nested_schema = type(field.schema)(only=(inspect(target).primary_key[0].key,))
+                    value = '[child[0] for child in groups{0}.get(row[{1}], ())]'
+
+                serializer = CompiledSerializer(nested_schema, target, self.extra_columns, limit=self.limit)
+                relationships.append((name, relationship, serializer))
+                value = value.format(index, pk)
+
+            else:
+                attribute = field.attribute or name
+                if attribute not in mapper.columns:
+                    raise TypeError('Unable to compile the field {!r}'.format(name))
+
+                value = 'row[{}]'.format(column_index(attribute))
+                if type(field) not in PASSTHROUGH_FIELDS:
+                    field_name = 'field{}'.format(len(namespace))
+                    namespace[field_name] = field
+                    value = '{}._serialize({}, {!r}, None)'.format(field_name, value, name)
+
+            items.append('{!r}: {}'.format(name, value))
+
+        for name in self.extra_columns:
+            if name in mapper.columns:
+                column_index(name)
+
+        lines = ['def factory(urls, groups, nested):']
+        lines += ['    url{0} = urls[{0}]'.format(index) for index in range(len(urls))]
+        for index in range(len(relationships)):
+            lines.append('    groups{0} = groups[{0}]'.format(index))
+            lines.append('    nested{0} = nested[{0}]'.format(index))
+        lines.append('    def serialize_row(row):')
+        lines.append('        return {{{}}}'.format(', '.join(items)))
+        lines.append('    return serialize_row')
+
+        code = compile('\n'.join(lines), '<{} serializer>'.format(type(self.schema).__name__), 'exec')
+        exec(code, namespace)
+
+        return _Compiled(columns, namespace['factory'], urls, relationships)
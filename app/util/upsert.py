@@ -0,0 +1,60 @@
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from app import db
+
+
+class UpsertNotSupported(NotImplementedError):
+    """Raised on the databases without INSERT ... ON CONFLICT"""
+
+
+def excluded(table):
+    """The row proposed for insertion, for the SET expressions of `upsert`"""
+    return table.alias('excluded')
+
+
+def upsert(table, columns, index_elements, set_=None, returning=()):
+    """Makes an `INSERT ... ON CONFLICT` statement of `table` for the SQLite and
+    PostgreSQL dialects, the values are bound by column name at execution.
+
+    On a conflict on the unique `index_elements` the row is updated with
+    `set_` (a dict of column name: expression over `table` and `excluded(table)`),
+    nothing is done without it. The `returning` columns are selected from
+    the inserted or updated row.
+    """
+    dialect = db.engine.dialect
+
+    if dialect.name == 'postgresql':
+        statement = postgresql.insert(table)
+        if set_:
+            statement = statement.on_conflict_do_update(index_elements=index_elements, set_=set_)
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=index_elements)
+        return statement.returning(*returning) if returning else statement
+
+    if dialect.name != 'sqlite':
+        raise UpsertNotSupported('Upserts require SQLite or PostgreSQL')
+
+    # The SQLite dialect of SQLAlchemy 1.2 renders neither ON CONFLICT
+    # nor RETURNING (SQLite 3.35+), the statement is written out
+    quote = dialect.identifier_preparer.quote
+    sql = 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT ({}) '.format(
+        quote(table.name),
+        ', '.join(quote(name) for name in columns),
+        ', '.join(':{}'.format(name) for name in columns),
+        ', '.join(quote(name) for name in index_elements),
+    )
+
+    if set_:
+        assignments = [
+            '{} = {}'.format(quote(name), expression.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+            for name, expression in set_.items()
+        ]
+        sql += 'DO UPDATE SET ' + ', '.join(assignments)
+    else:
+        sql += 'DO NOTHING'
+
+    if returning:
+        sql += ' RETURNING ' + ', '.join(quote(column.name) for column in returning)
+        return text(sql).columns(*returning)
+
+    return text(sql)
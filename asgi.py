@@ -0,0 +1,13 @@
+"""ASGI entry point, next to run.py for the WSGI servers and the commands.
+
+    uvicorn asgi:app
+
+Requires the packages of requirements-asgi.txt.
+"""
+import os
+from app import create_app
+from app.asgi import CatalogApp
+
+flask_app = create_app(os.environ.get('FLASK_CONFIG') or 'development')
+
+app = CatalogApp(flask_app)
@@ -0,0 +1,165 @@
+"""Compares the WSGI application with the ASGI mode at 1k concurrent keep-alive connections.
+
+    python benchmarks/asgi.py --connections 1000 --seconds 10
+
+Seeds a temporary SQLite database with books, then serves it with uvicorn,
+once as the WSGI application (`--interface wsgi asgi:flask_app`) and once
+in the ASGI mode (`asgi:app`). uvicorn runs WSGI applications in 10
+threads, the ASGI mode gets as many ASGI_WSGI_THREADS (--threads) for its
+cache misses. The clients keep their connections open and GET the books
+and the pages of the catalog in turn. Requires the packages of
+requirements-asgi.txt.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, basedir)
+
+from app import create_app, db  # noqa: E402
+
+MODES = [
+    ('wsgi', ['--interface', 'wsgi', 'asgi:flask_app']),
+    ('asgi', ['asgi:app']),
+]
+
+
+def seed(path, books):
+    from app.api.writes import create_book
+
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    with app.app_context():
+        db.create_all()
+        for i in range(books):
+            create_book({
+                'title': 'Book {}'.format(i),
+                'isbn': 9780000000000 + i,
+                'year': 2000 + i % 20,
+                'authors': [{'firstname': 'Author', 'lastname': str(i % 10)}],
+            })
+        db.session.commit()
+        db.session.remove()
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(port, paths, start, deadline, latencies, errors):
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        errors.append('connect')
+        return
+
+    try:
+        await asyncio.sleep(max(0, start - time.time()))
+        while time.time() < deadline:
+            path = random.choice(paths)
+            request_start = time.perf_counter()
+            writer.write('GET {} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(path).encode())
+            status = await read_response(reader)
+            if status == 200:
+                latencies.append(time.perf_counter() - request_start)
+            else:
+                errors.append(status)
+    except (OSError, asyncio.IncompleteReadError):
+        errors.append('disconnected')
+    finally:
+        writer.close()
+
+
+async def load(port, paths, connections, seconds):
+    latencies, errors = [], []
+    # The connections are opened before the clock starts
+    start = time.time() + max(2, connections / 500)
+    deadline = start + seconds
+    await asyncio.gather(*(client(port, paths, start, deadline, latencies, errors)
+                           for _ in range(connections)))
+    return latencies, errors
+
+
+def percentile(latencies, p):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+
+def wait_for_server(server, port, timeout=30):
+    deadline = time.time() + timeout
+    loop = asyncio.get_event_loop()
+    while time.time() < deadline and server.poll() is None:
+        try:
+            reader, writer = loop.run_until_complete(asyncio.open_connection('127.0.0.1', port))
+            writer.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('The server did not start')
+
+
+def run(name, interface, path, args):
+    env = dict(os.environ, FLASK_CONFIG='production', DATABASE_URI='sqlite:///' + path,
+               ASGI_WSGI_THREADS=str(args.threads))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', '--port', str(args.port), '--log-level', 'warning',
+         '--backlog', str(args.connections * 2)] + interface,
+        cwd=basedir, env=env,
+    )
+
+    try:
+        wait_for_server(server, args.port)
+        paths = ['/api/v1/books/{}'.format(i) for i in range(1, args.books + 1)]
+        paths += ['/api/v1/books/?page={}'.format(i) for i in range(1, 6)]
+
+        loop = asyncio.get_event_loop()
+        # Warms up the response cache of the server
+        loop.run_until_complete(load(args.port, paths, 10, 2))
+        latencies, errors = loop.run_until_complete(load(args.port, paths, args.connections, args.seconds))
+
+        print('{:<5} {:>8.0f} req/s  p50 {:>7.1f} ms  p99 {:>7.1f} ms  {:>5} errors'.format(
+            name, len(latencies) / args.seconds,
+            percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000, len(errors)))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--books', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=10)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+
+    try:
+        seed(path, args.books)
+        for name, interface in MODES:
+            run(name, interface, path, args)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Compares the default SQLite engine with the production engine profile under concurrent writers.
+
+    python benchmarks/concurrent_writes.py --writers 8 --readers 8 --seconds 10
+
+Writer processes create books (with the search index and the table versions,
+like POST /api/v1/books/) while reader processes serialize the latest page of
+books, on a temporary SQLite database. The default profile opens a connection
+per session with a rollback journal, the production one uses the pool and the
+SQLALCHEMY_SQLITE_PRAGMAS of ProductionConfig.
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from app import create_app, db  # noqa: E402
+from config import ProductionConfig  # noqa: E402
+
+AUTHORS = 50
+
+PROFILES = {
+    'default': {},
+    'production': {
+        'SQLALCHEMY_POOL_SIZE': ProductionConfig.SQLALCHEMY_POOL_SIZE,
+        'SQLALCHEMY_MAX_OVERFLOW': ProductionConfig.SQLALCHEMY_MAX_OVERFLOW,
+        'SQLALCHEMY_POOL_RECYCLE': ProductionConfig.SQLALCHEMY_POOL_RECYCLE,
+        'SQLALCHEMY_POOL_PRE_PING': ProductionConfig.SQLALCHEMY_POOL_PRE_PING,
+        'SQLALCHEMY_SQLITE_PRAGMAS': ProductionConfig.SQLALCHEMY_SQLITE_PRAGMAS,
+    },
+}
+
+
+def timed(latencies, operation):
+    """Runs the operation, returns False when it failed with `database is locked`"""
+    start = time.perf_counter()
+    try:
+        operation()
+    except OperationalError:
+        # The busy timeout is over
+        db.session.rollback()
+        return False
+
+    latencies.append(time.perf_counter() - start)
+    return True
+
+
+def make_app(path, settings):
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    app.config.update(settings)
+    return app
+
+
+def writer(path, settings, first_isbn, start, deadline):
+    from app.api.writes import create_book
+
+    app = make_app(path, settings)
+    latencies, errors = [], 0
+    time.sleep(max(0, start - time.time()))
+
+    with app.app_context():
+        for isbn in itertools.count(first_isbn):
+            if time.time() >= deadline:
+                break
+
+            def write():
+                create_book({
+                    'title': 'Book {}'.format(isbn),
+                    'isbn': isbn,
+                    'year': 2000 + isbn % 20,
+                    'authors': [{'firstname': 'Author', 'lastname': str(isbn % AUTHORS)}],
+                })
+                db.session.commit()
+
+            errors += not timed(latencies, write)
+            db.session.remove()
+
+    return 'writes', latencies, errors
+
+
+def reader(path, settings, page_size, start, deadline):
+    from app.api.model.book import Book
+    from app.api.resources.books import book_serializer
+
+    app = make_app(path, settings)
+    latencies, errors = [], 0
+    time.sleep(max(0, start - time.time()))
+
+    with app.test_request_context():
+        while time.time() < deadline:
+            def read():
+                rows = book_serializer.query().order_by(Book.id.desc()).limit(page_size).all()
+                book_serializer.dump(rows)
+
+            errors += not timed(latencies, read)
+            db.session.remove()
+
+    return 'reads', latencies, errors
+
+
+def run_worker(task):
+    function, args = task
+    return function(*args)
+
+
+def percentile(latencies, p):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+
+def run(name, settings, args):
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+
+    try:
+        app = make_app(path, settings)
+        with app.app_context():
+            from app.api.model.author import Author
+
+            db.create_all()
+            # The writers only link existing authors, so that they wait for locks
+            # rather than fail on the name of an author created concurrently
+            db.session.execute(Author.__table__.insert(),
+                               [{'firstname': 'Author', 'lastname': str(i)} for i in range(AUTHORS)])
+            db.session.commit()
+            db.session.remove()
+            db.engine.dispose()
+
+        # Processes, like the workers of a WSGI server: threads would wait
+        # for the GIL while holding the database locks. They all start
+        # once they are ready
+        start = time.time() + 2
+        deadline = start + args.seconds
+        tasks = [(writer, (path, settings, 9780000000000 + i * 10 ** 6, start, deadline))
+                 for i in range(args.writers)]
+        tasks += [(reader, (path, settings, args.page_size, start, deadline)) for _ in range(args.readers)]
+
+        results = {'writes': ([], 0), 'reads': ([], 0)}
+        with multiprocessing.Pool(len(tasks)) as pool:
+            for kind, latencies, errors in pool.map(run_worker, tasks):
+                results[kind] = (results[kind][0] + latencies, results[kind][1] + errors)
+
+        for kind in ('writes', 'reads'):
+            latencies, errors = results[kind]
+            print('{:<11} {:<6} {:>8.0f} ops/s  p50 {:>7.1f} ms  p99 {:>7.1f} ms  {:>5} locked'.format(
+                name, kind, len(latencies) / args.seconds,
+                percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000, errors))
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+
+    for name, settings in sorted(PROFILES.items()):
+        run(name, settings, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,534 @@
+"""HTTP load test of every endpoint of /api/v1 and /auth on a seeded SQLite database.
+
+    python benchmarks/load.py --books 100000 --concurrency 16 --seconds 30 --output run.json
+    python benchmarks/load.py --database /tmp/books-1m.db --books 1000000 --baseline run.json
+
+Seeds a dataset of `--books` books (10k to 5M, see `flask seed`) with a long tail of authors:
+most books have one author, some up to four, and a few prolific authors
+write a large share of the books. `--database` keeps the file, so that the
+large datasets are seeded once.
+
+The application (production configuration) is served by the threaded
+Werkzeug server in a separate process, `--concurrency` client threads then
+send a mixed read/write workload over keep-alive connections for
+`--seconds`, after `--warmup` seconds that are not measured. The operations
+are picked by weight, `--weight NAME=WEIGHT` changes one (0 disables it).
+
+The report is a JSON document with the throughput, the p50/p95/p99
+latencies, the SQL statements and the database time per request (the
+X-DB-Queries and X-DB-Time-Ms headers of REQUEST_METRICS, without the
+streamed exports), overall and per operation. `--baseline` compares the
+run with a previous report.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, basedir)
+
+from sqlalchemy import func  # noqa: E402
+from app import create_app, db, hasher, request_metrics  # noqa: E402
+from app.seed import FIRSTNAMES, WORDS, generate_dataset  # noqa: E402
+
+PASSWORD = 'password'
+ADMIN_USERNAME = 'admin'
+
+# Authors per book: weight, and the concentration of the books on the first authors
+AUTHORS_PER_BOOK = (70, 20, 7, 3)
+AUTHOR_SKEW = 3.0
+
+
+def make_app(path):
+    app = create_app('production')
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///' + path,
+        SQLALCHEMY_BINDS=None,
+        SQLALCHEMY_REPLICA_BINDS=(),
+        ADMIN_USERNAME=None,
+        ADMIN_PASSWORD=None,
+    )
+    return app
+
+
+def seed(app, books, users, random_seed):
+    """Creates the dataset unless the database already has books, returns its size"""
+    from app.api.model.author import Author
+    from app.api.model.book import Book, book_author
+    from app.auth.model.user import User
+
+    with app.app_context():
+        db.create_all()
+
+        if db.session.query(Book.id).first() is None:
+            print('Seeding {} books...'.format(books), file=sys.stderr)
+            start = time.time()
+            # Hashed in this thread, a pool would be inherited by the server process
+            app.config['BCRYPT_POOL_SIZE'] = 0
+            hasher.init_app(app)
+
+            generate_dataset(books, max(1, books // 4), users, AUTHORS_PER_BOOK, AUTHOR_SKEW,
+                             password=PASSWORD, random_seed=random_seed)
+            db.session.add(User(ADMIN_USERNAME, PASSWORD, admin=True))
+            db.session.commit()
+            print('Seeded in {:.0f} s'.format(time.time() - start), file=sys.stderr)
+
+        size = {
+            'books': db.session.query(func.max(Book.id)).scalar(),
+            'authors': db.session.query(func.max(Author.id)).scalar(),
+            # The seeded users, before the admin
+            'users': db.session.query(User.id).filter_by(username=ADMIN_USERNAME).scalar() - 1,
+            'book_authors': db.session.query(func.count()).select_from(book_author).scalar(),
+        }
+        db.session.remove()
+        db.engine.dispose()
+
+    return size
+
+
+def serve(path, port, ready):
+    """Runs the application, the responses carry their SQL statements and database time"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class KeepAliveRequestHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # The headers and the body are separate writes
+        disable_nagle_algorithm = True
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    app = make_app(path)
+    app.config['REQUEST_METRICS'] = True
+    request_metrics.init_app(app)
+
+    server = make_server('127.0.0.1', port, app, threaded=True, request_handler=KeepAliveRequestHandler)
+    # A process group, stopped with the processes of the password hasher
+    os.setpgrp()
+    ready.set()
+    server.serve_forever()
+
+
+class Client:
+    """A connection sending the operations of the workload, one at a time"""
+
+    def __init__(self, index, concurrency, port, size, results, rng):
+        self.index = index
+        self.port = port
+        self.size = size
+        self.results = results
+        self.rng = rng
+        self.connection = None
+        self.recording = False
+        self.created_books = []
+        self.created_authors = []
+        self.login_tokens = []
+        self.numbers = itertools.count()
+
+        # The first half of the seeded users (user<id>) log in, every
+        # client deletes its own share of the second half
+        self.login_users = max(1, size['users'] // 2)
+        share = (size['users'] - self.login_users) // concurrency
+        first = self.login_users + 1 + index * share
+        self.deletable_users = list(range(first, first + share))
+
+        self.user_tokens = self.login('user{}'.format(1 + index % self.login_users))
+        self.admin_tokens = self.login(ADMIN_USERNAME)
+
+    def request(self, name, method, path, body=None, token=None, expect=(200,), content_type='application/json'):
+        headers = {'Accept': 'application/json'}
+        if body is not None:
+            body = body if isinstance(body, bytes) else json.dumps(body).encode()
+            headers['Content-Type'] = content_type
+        if token is not None:
+            headers['Authorization'] = 'Bearer {}'.format(token)
+
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=300)
+            start = time.perf_counter()
+            try:
+                self.connection.request(method, path, body, headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # The server closed the connection, it is opened again once
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+        elapsed = time.perf_counter() - start
+
+        if self.recording:
+            queries, db_time = response.getheader('X-DB-Queries'), response.getheader('X-DB-Time-Ms')
+            self.results[name].append((elapsed, response.status in expect,
+                                       int(queries) if queries else None, float(db_time) if db_time else None))
+
+        if response.status in (200, 201) and data and response.getheader('Content-Type') == 'application/json':
+            return response.status, json.loads(data.decode())
+        return response.status, None
+
+    def login(self, username):
+        status, data = self.request('login', 'POST', '/auth/login', {'username': username, 'password': PASSWORD})
+        if status != 200:
+            raise RuntimeError('Unable to log in as {}: {}'.format(username, status))
+        return data['access_token'], data['refresh_token']
+
+    # Identifiers
+
+    def book_id(self):
+        # A hot set of the recent books gets half of the reads
+        if self.rng.random() < 0.5:
+            return max(1, self.size['books'] - self.rng.randrange(100))
+        return self.rng.randint(1, self.size['books'])
+
+    def author_id(self):
+        return self.rng.randint(1, self.size['authors'])
+
+    def unique(self):
+        return self.index * 10 ** 8 + next(self.numbers)
+
+    def new_isbn(self):
+        return 9790000000000 + self.unique()
+
+    def new_book(self):
+        return {
+            'title': ' '.join(self.rng.choice(WORDS) for _ in range(3)).capitalize(),
+            'isbn': self.new_isbn(),
+            'year': self.rng.randint(1950, 2020),
+            # A few authors per client, created by their first book
+            'authors': [{'firstname': FIRSTNAMES[self.index % len(FIRSTNAMES)],
+                         'lastname': 'Load{}'.format(self.index * 100 + self.rng.randrange(20))}],
+        }
+
+    def new_author(self):
+        return {'firstname': self.rng.choice(FIRSTNAMES), 'lastname': 'Load{}'.format(self.unique())}
+
+    # Reads
+
+    def list_books(self):
+        params = 'limit=20&sort={}&year_min={}'.format(self.rng.choice(['id', '-year', 'title']),
+                                                       self.rng.randint(1950, 2020))
+        self.request('list_books', 'GET', '/api/v1/books/?' + params)
+
+    def search_books(self):
+        self.request('search_books', 'GET', '/api/v1/books/?limit=20&q=' + self.rng.choice(WORDS))
+
+    def get_books_by_ids(self):
+        ids = ','.join(str(self.book_id()) for _ in range(10))
+        self.request('get_books_by_ids', 'GET', '/api/v1/books/?ids=' + ids)
+
+    def get_book(self):
+        self.request('get_book', 'GET', '/api/v1/books/{}'.format(self.book_id()), expect=(200, 404))
+
+    def get_book_authors(self):
+        self.request('get_book_authors', 'GET', '/api/v1/books/{}/authors/'.format(self.book_id()), expect=(200, 404))
+
+    def export_books(self):
+        self.request('export_books', 'GET', '/api/v1/books/export?fields=id,title')
+
+    def list_authors(self):
+        params = 'limit=20&sort={}'.format(self.rng.choice(['id', 'lastname']))
+        self.request('list_authors', 'GET', '/api/v1/authors/?' + params)
+
+    def get_author(self):
+        self.request('get_author', 'GET', '/api/v1/authors/{}'.format(self.author_id()), expect=(200, 404))
+
+    def get_author_books(self):
+        # The prolific authors have the most books
+        author_id = 1 + int(self.size['authors'] * self.rng.random() ** 3)
+        self.request('get_author_books', 'GET', '/api/v1/authors/{}/books/?limit=20'.format(author_id),
+                     expect=(200, 404))
+
+    def export_authors(self):
+        self.request('export_authors', 'GET', '/api/v1/authors/export?fields=id,lastname')
+
+    # Writes
+
+    def create_book(self):
+        status, data = self.request('create_book', 'POST', '/api/v1/books/', self.new_book(),
+                                    token=self.user_tokens[0], expect=(201,))
+        if status == 201:
+            self.created_books.append(data['id'])
+
+    def update_book(self):
+        self.request('update_book', 'PATCH', '/api/v1/books/{}'.format(self.book_id()),
+                     {'title': ' '.join(self.rng.choice(WORDS) for _ in range(3))},
+                     token=self.user_tokens[0], expect=(200, 404))
+
+    def put_book(self):
+        # Creates a book, or replaces one of the seeded books
+        isbn = self.new_isbn() if self.rng.random() < 0.5 else 9780000000000 + self.book_id()
+        book = self.new_book()
+        del book['isbn']
+        self.request('put_book', 'PUT', '/api/v1/books/isbn/{}'.format(isbn), book,
+                     token=self.user_tokens[0], expect=(200, 201))
+
+    def delete_book(self):
+        if not self.created_books:
+            return False
+        self.request('delete_book', 'DELETE', '/api/v1/books/{}'.format(self.created_books.pop()),
+                     token=self.user_tokens[0], expect=(204,))
+
+    def bulk_books(self):
+        body = ''.join(json.dumps(self.new_book()) + '\n' for _ in range(10)).encode()
+        self.request('bulk_books', 'POST', '/api/v1/books/bulk', body, token=self.user_tokens[0],
+                     expect=(201,), content_type='application/x-ndjson')
+
+    def batch(self):
+        operations = [
+            {'method': 'create', 'resource': 'books', 'data': self.new_book()},
+            {'method': 'create', 'resource': 'authors', 'data': self.new_author()},
+            {'method': 'patch', 'resource': 'books', 'id': self.book_id(), 'data': {'year': 2000}},
+        ]
+        self.request('batch', 'POST', '/api/v1/batch', operations, token=self.user_tokens[0], expect=(200, 400))
+
+    def create_author(self):
+        status, data = self.request('create_author', 'POST', '/api/v1/authors/', self.new_author(),
+                                    token=self.user_tokens[0], expect=(201,))
+        if status == 201:
+            self.created_authors.append(data['id'])
+
+    def update_author(self):
+        self.request('update_author', 'PATCH', '/api/v1/authors/{}'.format(self.author_id()),
+                     {'firstname': 'F{}'.format(self.unique())}, token=self.user_tokens[0], expect=(200, 404))
+
+    def delete_author(self):
+        if not self.created_authors:
+            return False
+        self.request('delete_author', 'DELETE', '/api/v1/authors/{}'.format(self.created_authors.pop()),
+                     token=self.user_tokens[0], expect=(204,))
+
+    # Authentication
+
+    def register(self):
+        self.request('register', 'POST', '/auth/registration',
+                     {'username': 'load{}'.format(self.unique()), 'password': PASSWORD}, expect=(201,))
+
+    def login_user(self):
+        username = 'user{}'.format(self.rng.randint(1, self.login_users))
+        status, data = self.request('login', 'POST', '/auth/login', {'username': username, 'password': PASSWORD})
+        if status == 200:
+            self.login_tokens.append((data['access_token'], data['refresh_token']))
+
+    def refresh_token(self):
+        self.request('refresh_token', 'POST', '/auth/token/refresh', token=self.user_tokens[1])
+
+    def logout_access(self):
+        # Revokes the tokens of a previous login
+        if not self.login_tokens:
+            return False
+        self.request('logout_access', 'POST', '/auth/logout/access', token=self.login_tokens[-1][0])
+        self.login_tokens[-1] = (None, self.login_tokens[-1][1])
+
+    def logout_refresh(self):
+        if not self.login_tokens:
+            return False
+        self.request('logout_refresh', 'POST', '/auth/logout/refresh', token=self.login_tokens.pop()[1])
+
+    def list_users(self):
+        self.request('list_users', 'GET', '/auth/users/', token=self.admin_tokens[0])
+
+    def get_user(self):
+        user_id = self.rng.randint(1, self.size['users'] + 1)
+        self.request('get_user', 'GET', '/auth/users/{}'.format(user_id), token=self.admin_tokens[0],
+                     expect=(200, 404))
+
+    def delete_user(self):
+        if not self.deletable_users:
+            return False
+        # Deleted already when the database is used again
+        self.request('delete_user', 'DELETE', '/auth/users/{}'.format(self.deletable_users.pop()),
+                     token=self.admin_tokens[0], expect=(204, 404))
+
+    def blacklist_stats(self):
+        self.request('blacklist_stats', 'GET', '/auth/blacklist/stats', token=self.admin_tokens[0])
+
+
+# Operation: weight, about 80% reads
+WORKLOAD = {
+    'list_books': 120,
+    'search_books': 40,
+    'get_books_by_ids': 20,
+    'get_book': 200,
+    'get_book_authors': 30,
+    'export_books': 1,
+    'list_authors': 40,
+    'get_author': 100,
+    'get_author_books': 30,
+    'export_authors': 1,
+    'create_book': 30,
+    'update_book': 30,
+    'put_book': 15,
+    'delete_book': 10,
+    'bulk_books': 5,
+    'batch': 5,
+    'create_author': 10,
+    'update_author': 10,
+    'delete_author': 5,
+    'register': 2,
+    'login_user': 4,
+    'refresh_token': 5,
+    'logout_access': 2,
+    'logout_refresh': 2,
+    'list_users': 1,
+    'get_user': 3,
+    'delete_user': 1,
+    'blacklist_stats': 2,
+}
+
+
+def run_client(client, workload, warmup_end, deadline):
+    names, weights = zip(*[(name, weight) for name, weight in sorted(workload.items()) if weight > 0])
+    while True:
+        now = time.time()
+        if now >= deadline:
+            return
+        client.recording = now >= warmup_end
+
+        name = client.rng.choices(names, weights)[0]
+        # False when the operation has nothing to work on yet
+        if getattr(client, name)() is False:
+            continue
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def summarize(samples, seconds):
+    latencies = [elapsed for elapsed, _, _, _ in samples]
+    queries = [count for _, _, count, _ in samples if count is not None]
+    db_times = [db_time for _, _, _, db_time in samples if db_time is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, ok, _, _ in samples if not ok),
+        'throughput': round(len(samples) / seconds, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'db_ms_per_request': round(sum(db_times) / len(db_times), 2) if db_times else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=basedir,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    """Prints the changes of the p95 latency and of the queries per request"""
+    print('{:<18} {:>12} {:>12} {:>8} {:>10} {:>10}'.format(
+        'operation', 'base p95 ms', 'p95 ms', 'change', 'base qpr', 'qpr'), file=sys.stderr)
+    rows = [('total', baseline['total'], report['total'])]
+    rows += [(name, baseline['operations'][name], stats) for name, stats in sorted(report['operations'].items())
+             if name in baseline['operations']]
+    for name, before, after in rows:
+        change = (after['p95_ms'] / before['p95_ms'] - 1) * 100 if before['p95_ms'] else 0.0
+        print('{:<18} {:>12.1f} {:>12.1f} {:>+7.0f}% {:>10} {:>10}'.format(
+            name, before['p95_ms'], after['p95_ms'], change,
+            before['queries_per_request'], after['queries_per_request']), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--database', help='SQLite file of the dataset, seeded if it has no books')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--weight', action='append', default=[], metavar='NAME=WEIGHT')
+    parser.add_argument('--output', help='File of the JSON report, stdout by default')
+    parser.add_argument('--baseline', help='JSON report of a previous run to compare with')
+    args = parser.parse_args()
+
+    workload = dict(WORKLOAD)
+    for override in args.weight:
+        name, _, weight = override.partition('=')
+        if name not in workload:
+            parser.error('Unknown operation {!r}, one of: {}'.format(name, ', '.join(sorted(workload))))
+        workload[name] = int(weight)
+
+    path = os.path.abspath(args.database or 'benchmarks-load-{}.db'.format(os.getpid()))
+
+    try:
+        size = seed(make_app(path), args.books, args.users, args.seed)
+
+        ready = multiprocessing.Event()
+        # Not a daemon, the password hasher starts processes
+        server = multiprocessing.Process(target=serve, args=(path, args.port, ready))
+        server.start()
+        while not ready.wait(0.5):
+            if not server.is_alive():
+                raise RuntimeError('The server did not start')
+
+        try:
+            results = defaultdict(list)
+            clients = [Client(i, args.concurrency, args.port, size, results, random.Random(args.seed * 1000 + i))
+                       for i in range(args.concurrency)]
+
+            warmup_end = time.time() + args.warmup
+            deadline = warmup_end + args.seconds
+            threads = [threading.Thread(target=run_client, args=(client, workload, warmup_end, deadline))
+                       for client in clients]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            if ready.is_set():
+                os.killpg(server.pid, signal.SIGTERM)
+            server.join()
+    finally:
+        if args.database is None:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    report = {
+        'commit': git_commit(),
+        'dataset': size,
+        'settings': {
+            'concurrency': args.concurrency,
+            'seconds': args.seconds,
+            'warmup': args.warmup,
+            'seed': args.seed,
+            'workload': workload,
+        },
+        'total': summarize([sample for samples in results.values() for sample in samples], args.seconds),
+        'operations': {name: summarize(samples, args.seconds) for name, samples in sorted(results.items())},
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Compares the time of a shallow and of a deep page of the book list, per sort order.
+
+    python benchmarks/pagination.py --books 300000
+
+Seeds a temporary SQLite database with --books books, then runs the keyset
+query of a page of --page-size books after the cursor of the rows at the
+--depths positions, as paginate() builds it. The time of a page must not
+grow with its depth.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+
+SORTS = ('id', 'isbn', '-isbn', 'year', '-year', 'title', '-title,year')
+
+
+def page_time(query, order, values, page_size, repeat):
+    from app.api.pagination import keyset_filter, order_by_clauses, trails_nulls
+
+    dialect = db.engine.dialect.name
+    query = query.order_by(*[clause for _, column, descending in order
+                             for clause in order_by_clauses(column, descending, dialect)])
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = query.filter(keyset_filter(order, values)).limit(page_size + 1).all()
+        if len(items) <= page_size and trails_nulls(order, values):
+            query.filter(order[0][1].is_(None)).limit(page_size + 1 - len(items)).all()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=300000)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--depths', default='1000,150000,290000',
+                        help='Comma separated positions of the cursors.')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    depths = [int(depth) for depth in args.depths.split(',')]
+    if max(depths) >= args.books:
+        parser.error('--depths must be below --books')
+
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+
+    try:
+        with app.app_context():
+            from app.api.pagination import order_by_clauses, parse_sort
+            from app.api.resources.books import BOOK_SORT_COLUMNS
+            from app.seed import generate_dataset
+
+            db.create_all()
+            generate_dataset(args.books, max(1, args.books // 4), 0, random_seed=1)
+
+            print('{:<12}'.format('sort') + ''.join('{:>12}'.format(depth) for depth in depths))
+            for sort in SORTS:
+                order = parse_sort(sort, BOOK_SORT_COLUMNS)
+                query = db.session.query(*[column for _, column, _ in order])
+                ordered = query.order_by(*[clause for _, column, descending in order
+                                           for clause in order_by_clauses(column, descending, 'sqlite')])
+
+                cells = []
+                for depth in depths:
+                    # The keys of the last row of the previous page
+                    values = list(ordered.offset(depth - 1).limit(1).one())
+                    milliseconds = page_time(query, order, values, args.page_size, args.repeat) * 1000
+                    cells.append('{:>9.2f} ms'.format(milliseconds))
+
+                print('{:<12}'.format(sort) + ''.join(cells))
+            db.session.remove()
+    finally:
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
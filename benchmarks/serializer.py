@@ -0,0 +1,97 @@
+"""Compares the compiled serializer with the marshmallow schema on the book list.
+
+    python benchmarks/serializer.py --books 100000
+
+Both paths serialize every book with its authors, a page of --page-size books
+at a time, from a temporary SQLite database filled with --books books.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import selectinload  # noqa: E402
+from app import create_app, db  # noqa: E402
+
+
+def seed(books, authors_count):
+    from app.api.model.book import Book, book_author
+    from app.api.model.author import Author
+
+    authors = [{'firstname': 'Author', 'lastname': str(i)} for i in range(authors_count)]
+    db.session.execute(Author.__table__.insert(), authors)
+
+    rows = [{'title': 'Book {}'.format(i), 'isbn': 9780000000000 + i, 'year': 1950 + i % 70}
+            for i in range(books)]
+    db.session.execute(Book.__table__.insert(), rows)
+
+    # one to three authors per book
+    links = [{'book_id': i + 1, 'author_id': (i + offset) % authors_count + 1}
+             for i in range(books) for offset in range(i % 3 + 1)]
+    db.session.execute(book_author.insert(), links)
+    db.session.commit()
+
+
+def iter_pages(query, column, page_size):
+    last = 0
+    while True:
+        page = query.filter(column > last).order_by(column).limit(page_size).all()
+        if not page:
+            return
+        last = getattr(page[-1], column.key)
+        yield page
+
+
+def run(name, serialize_pages):
+    start = time.perf_counter()
+    rows = sum(len(items) for items in serialize_pages())
+    elapsed = time.perf_counter() - start
+    print('{:<12} {:>8} rows {:>8.2f} s {:>10.0f} rows/s'.format(name, rows, elapsed, rows / elapsed))
+    return rows / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--authors', type=int, default=5000)
+    parser.add_argument('--page-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+
+    app = create_app('testing')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+
+    try:
+        with app.test_request_context():
+            from app.api.model.book import Book
+            from app.api.resources.books import book_schema, book_serializer
+
+            db.create_all()
+            seed(args.books, args.authors)
+
+            def marshmallow_pages():
+                query = Book.query.options(selectinload(Book.authors))
+                for page in iter_pages(query, Book.id, args.page_size):
+                    yield book_schema.dump(page, many=True).data
+                    db.session.expunge_all()
+
+            def compiled_pages():
+                for page in iter_pages(book_serializer.query(), Book.id, args.page_size):
+                    yield book_serializer.dump(page)
+
+            baseline = run('marshmallow', marshmallow_pages)
+            compiled = run('compiled', compiled_pages)
+            print('speedup      {:.1f}x'.format(compiled / baseline))
+
+            db.session.remove()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,8 +11,33 @@ class Config:
     JWT_BLACKLIST_ENABLED = True
     JWT_BLACKLIST_TOKEN_CHECKS = ['access', 'refresh']
     JWT_ERROR_MESSAGE_KEY = 'message'
+    JWT_BLACKLIST_REFRESH_INTERVAL = 5
+    JWT_BLACKLIST_REFRESH_OVERLAP = 60
+    JWT_BLACKLIST_BLOOM_CAPACITY = 100000
+    JWT_BLACKLIST_BLOOM_ERROR_RATE = 0.001
+    JWT_BLACKLIST_PRUNE_INTERVAL = None
+    JWT_BLACKLIST_PRUNE_BATCH_SIZE = 1000
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    BCRYPT_POOL_SIZE = int(os.environ.get('BCRYPT_POOL_SIZE', 2))
+    BCRYPT_MAX_PENDING = int(os.environ.get('BCRYPT_MAX_PENDING', 32))
+    USER_CLAIMS_CACHE_SIZE = 10000
+    USER_CLAIMS_CACHE_TTL = 300
     ADMIN_USERNAME = None
     ADMIN_PASSWORD = None
+    API_DEFAULT_PAGE_SIZE = 100
+    API_MAX_PAGE_SIZE = 1000
+    API_EXPORT_BATCH_SIZE = 1000
+    API_BULK_MAX_ITEMS = 10000
+    API_BATCH_MAX_OPERATIONS = 1000
+    API_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    # Related records returned per book or author
+    API_EMBED_LIMIT = 20
+    # Threads running the Flask application in the ASGI mode, see app/asgi.py
+    ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 16))
+    # SQL statements and database time of the requests, see app/util/metrics.py
+    REQUEST_METRICS = os.environ.get('REQUEST_METRICS', '').lower() in ('1', 'true', 'yes', 'on')
+    REQUEST_METRICS_QUERY_BUDGET = int(os.environ.get('REQUEST_METRICS_QUERY_BUDGET', 0)) or None
+    REQUEST_METRICS_TIME_BUDGET_MS = int(os.environ.get('REQUEST_METRICS_TIME_BUDGET_MS', 0)) or None
 
     @classmethod
     def init_app(cls, app):
@@ -37,15 +62,40 @@ class TestingConfig(Config):
     PRESERVE_CONTEXT_ON_EXCEPTION = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(seconds=5)
+    BCRYPT_LOG_ROUNDS = 4
+    BCRYPT_POOL_SIZE = 0
 
 
 class ProductionConfig(Config):
     DEBUG = False
+    JWT_BLACKLIST_PRUNE_INTERVAL = int(os.environ.get('JWT_BLACKLIST_PRUNE_INTERVAL', 0)) or None
     ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', None)
     ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', None)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URI',
                                              'sqlite:///' + os.path.join(basedir, 'books.db'))
+    # Connections kept open per worker process, and beyond them under load
+    SQLALCHEMY_POOL_SIZE = int(os.environ.get('SQLALCHEMY_POOL_SIZE', 10))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.environ.get('SQLALCHEMY_MAX_OVERFLOW', 20))
+    SQLALCHEMY_POOL_RECYCLE = int(os.environ.get('SQLALCHEMY_POOL_RECYCLE', 1800))
+    SQLALCHEMY_POOL_PRE_PING = True
+    # Readers do not block the writer, which waits for the lock instead of
+    # failing with `database is locked`
+    SQLALCHEMY_SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,
+    }
+    # Read replicas serving the GET requests, comma-separated URIs
+    SQLALCHEMY_BINDS = {
+        'replica{}'.format(i): uri
+        for i, uri in enumerate(filter(None, os.environ.get('REPLICA_DATABASE_URIS', '').split(',')))
+    }
+    SQLALCHEMY_REPLICA_BINDS = sorted(SQLALCHEMY_BINDS)
+    SQLALCHEMY_REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 1))
+    SQLALCHEMY_REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
 
 
 config = dict(
@@ -0,0 +1,28 @@
+"""store the expiration time of revoked tokens
+
+Revision ID: 8c1f4b2d9e37
+Revises: 5a7a10df9a91
+Create Date: 2026-10-18 10:12:41.508233
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1f4b2d9e37'
+down_revision = '5a7a10df9a91'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('blacklist_tokens') as batch_op:
+        batch_op.add_column(sa.Column('expires', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_blacklist_tokens_expires'), ['expires'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('blacklist_tokens') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_blacklist_tokens_expires'))
+        batch_op.drop_column('expires')
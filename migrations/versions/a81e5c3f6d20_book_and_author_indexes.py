@@ -0,0 +1,29 @@
+"""indexes for the book filters and sort orders
+
+Revision ID: a81e5c3f6d20
+Revises: f3b9c1d27a48
+Create Date: 2026-10-18 17:22:48.915306
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a81e5c3f6d20'
+down_revision = 'f3b9c1d27a48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_books_year'), 'books', ['year'], unique=False)
+    op.create_index(op.f('ix_books_title'), 'books', ['title'], unique=False)
+    op.create_index('ix_book_author_book_id', 'book_author', ['book_id'], unique=False)
+    op.create_index('ix_authors_lastname_firstname', 'authors', ['lastname', 'firstname'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_authors_lastname_firstname', table_name='authors')
+    op.drop_index('ix_book_author_book_id', table_name='book_author')
+    op.drop_index(op.f('ix_books_title'), table_name='books')
+    op.drop_index(op.f('ix_books_year'), table_name='books')
@@ -0,0 +1,23 @@
+"""index of the revocation time, read by the refreshes of the revoked tokens
+
+Revision ID: b7e4d09a2c61
+Revises: d5e08b6a3c17
+Create Date: 2026-10-18 21:10:27.316054
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4d09a2c61'
+down_revision = 'd5e08b6a3c17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_blacklist_tokens_blacklisted_on'), 'blacklist_tokens', ['blacklisted_on'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_blacklist_tokens_blacklisted_on'), table_name='blacklist_tokens')
@@ -0,0 +1,44 @@
+"""row versions of books and authors, table versions
+
+Revision ID: c4d2a7e91f05
+Revises: 8c1f4b2d9e37
+Create Date: 2026-10-18 13:40:02.117465
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d2a7e91f05'
+down_revision = '8c1f4b2d9e37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('authors') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+    with op.batch_alter_table('books') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+    table_versions = op.create_table('table_versions',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(table_versions, [
+        {'name': 'authors', 'version': 0},
+        {'name': 'books', 'version': 0},
+    ])
+
+
+def downgrade():
+    op.drop_table('table_versions')
+
+    with op.batch_alter_table('books') as batch_op:
+        batch_op.drop_column('version')
+
+    with op.batch_alter_table('authors') as batch_op:
+        batch_op.drop_column('version')
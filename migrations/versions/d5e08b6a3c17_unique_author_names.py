@@ -0,0 +1,67 @@
+"""unique author names, the conflict target of the author upserts
+
+Revision ID: d5e08b6a3c17
+Revises: a81e5c3f6d20
+Create Date: 2026-10-18 19:04:12.537820
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e08b6a3c17'
+down_revision = 'a81e5c3f6d20'
+branch_labels = None
+depends_on = None
+
+
+authors = sa.table('authors', sa.column('id'), sa.column('firstname'), sa.column('lastname'), sa.column('version'))
+book_author = sa.table('book_author', sa.column('book_id'), sa.column('author_id'))
+
+
+def merge_duplicate_authors(connection):
+    """Merges the authors sharing a name into the one with the lowest id,
+    their books are linked to it"""
+    names = sa.select([
+        authors.c.firstname, authors.c.lastname, sa.func.min(authors.c.id).label('survivor_id'),
+    ]).group_by(authors.c.firstname, authors.c.lastname).having(sa.func.count() > 1).alias('names')
+    duplicates = connection.execute(
+        sa.select([authors.c.id, names.c.survivor_id])
+        .select_from(authors.join(names, sa.and_(authors.c.firstname == names.c.firstname,
+                                                 authors.c.lastname == names.c.lastname)))
+        .where(authors.c.id != names.c.survivor_id)
+    ).fetchall()
+
+    for duplicate_id, survivor_id in duplicates:
+        linked = {book_id for book_id, in connection.execute(
+            sa.select([book_author.c.book_id]).where(book_author.c.author_id == survivor_id))}
+        links = [{'book_id': book_id, 'author_id': survivor_id} for book_id, in connection.execute(
+            sa.select([book_author.c.book_id]).where(book_author.c.author_id == duplicate_id))
+            if book_id not in linked]
+        if links:
+            connection.execute(book_author.insert(), links)
+        connection.execute(book_author.delete().where(book_author.c.author_id == duplicate_id))
+        connection.execute(authors.delete().where(authors.c.id == duplicate_id))
+
+    survivor_ids = {survivor_id for _, survivor_id in duplicates}
+    if survivor_ids:
+        # Their representations changed, so do their ETags
+        connection.execute(authors.update().where(authors.c.id.in_(survivor_ids))
+                           .values(version=authors.c.version + 1))
+
+
+def upgrade():
+    # The unique index can not be created over duplicate names
+    merge_duplicate_authors(op.get_bind())
+
+    # A unique index rather than a constraint: SQLite adds it without
+    # rebuilding the table, and it still serves the lookups by name
+    op.drop_index('ix_authors_lastname_firstname', table_name='authors')
+    op.create_index('ix_authors_lastname_firstname', 'authors', ['lastname', 'firstname'], unique=True)
+
+
+def downgrade():
+    # The merged authors stay merged
+    op.drop_index('ix_authors_lastname_firstname', table_name='authors')
+    op.create_index('ix_authors_lastname_firstname', 'authors', ['lastname', 'firstname'], unique=False)
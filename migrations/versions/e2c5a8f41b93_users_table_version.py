@@ -0,0 +1,26 @@
+"""table version of users
+
+Revision ID: e2c5a8f41b93
+Revises: b7e4d09a2c61
+Create Date: 2026-10-18 23:02:41.508317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2c5a8f41b93'
+down_revision = 'b7e4d09a2c61'
+branch_labels = None
+depends_on = None
+
+table_versions = sa.table('table_versions', sa.column('name', sa.String), sa.column('version', sa.Integer))
+
+
+def upgrade():
+    op.bulk_insert(table_versions, [{'name': 'users', 'version': 0}])
+
+
+def downgrade():
+    op.execute(table_versions.delete().where(table_versions.c.name == 'users'))
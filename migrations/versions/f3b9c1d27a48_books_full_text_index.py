@@ -0,0 +1,40 @@
+"""full-text index of the book titles and author names
+
+Revision ID: f3b9c1d27a48
+Revises: c4d2a7e91f05
+Create Date: 2026-10-18 16:05:37.402918
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9c1d27a48'
+down_revision = 'c4d2a7e91f05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 is specific to SQLite, other databases go without the index
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute(
+        "CREATE VIRTUAL TABLE books_fts USING fts5(title, authors, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    op.execute(
+        "INSERT INTO books_fts (rowid, title, authors) "
+        "SELECT books.id, books.title, group_concat(authors.firstname || ' ' || authors.lastname, ' ') "
+        "FROM books "
+        "LEFT OUTER JOIN book_author ON books.id = book_author.book_id "
+        "LEFT OUTER JOIN authors ON authors.id = book_author.author_id "
+        "GROUP BY books.id"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute('DROP TABLE books_fts')
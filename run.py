@@ -7,9 +7,15 @@ if os.environ.get('FLASK_COVERAGE'):
     COV.start()
 
 import sys
+import time
 import click
 from flask_migrate import Migrate, upgrade
 from app.auth.model.user import User
+from app.auth.model.blacklist_token import BlacklistToken
+from app.api.model.book_search import BookSearch
+from app.api.model.table_version import TableVersion
+from app.seed import generate_dataset
+from app.util.revocation import max_token_lifetime
 from app import create_app, db
 
 
@@ -63,6 +69,55 @@ def drop_db():
     db.drop_all()
 
 
+@app.cli.command()
+@click.option('--batch-size', default=1000, help='Number of rows deleted per transaction.')
+def prune_blacklist(batch_size):
+    """Deletes the revoked tokens which have expired."""
+    deleted = BlacklistToken.prune_expired(batch_size, max_token_lifetime(app.config))
+    print('{} expired tokens deleted.'.format(deleted))
+
+
+@app.cli.command()
+def rebuild_search_index():
+    """Indexes all the books for the full-text search again."""
+    indexed = BookSearch.rebuild()
+    db.session.commit()
+    print('{} books indexed.'.format(indexed))
+
+
+@app.cli.command()
+@click.option('--books', default=1000, help='Number of books.')
+@click.option('--authors', type=int, help='Number of authors, a quarter of the books by default.')
+@click.option('--users', default=10, help='Number of users.')
+@click.option('--authors-per-book', default='70,20,7,3',
+              help='Weights of the books having 1, 2, ... authors.')
+@click.option('--author-skew', default=2.0,
+              help='Concentration of the books on the first authors, 1 spreads them evenly.')
+@click.option('--year-min', default=1950, help='First publication year.')
+@click.option('--year-max', default=2020, help='Last publication year.')
+@click.option('--password', default='password', help='Password of the users.')
+@click.option('--random-seed', type=int, help='Seed of the generator, to generate the same data again.')
+def seed(books, authors, users, authors_per_book, author_skew, year_min, year_max, password, random_seed):
+    """Generates books, authors and users in bulk."""
+    try:
+        weights = [float(weight) for weight in authors_per_book.split(',')]
+    except ValueError:
+        raise click.BadParameter('must be comma separated numbers', param_hint='--authors-per-book')
+    if year_min > year_max:
+        raise click.BadParameter('must not be after --year-max', param_hint='--year-min')
+    if author_skew <= 0:
+        raise click.BadParameter('must be positive', param_hint='--author-skew')
+
+    if authors is None:
+        authors = max(1, books // 4) if books else 0
+
+    start = time.time()
+    counts = generate_dataset(books, authors, users, weights, author_skew, year_min, year_max,
+                              password, random_seed)
+    print('{books} books, {authors} authors ({book_authors} links) and {users} users created'.format(**counts),
+          'in {:.1f} s.'.format(time.time() - start))
+
+
 @app.cli.command()
 def deploy():
     upgrade()
@@ -76,6 +131,7 @@ def deploy():
         else:
             user = User(admin_username, admin_password, admin=True)
             db.session.add(user)
+            TableVersion.bump('users')
             db.session.commit()
             print("Admin user '{}' created.".format(admin_username))
 
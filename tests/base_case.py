@@ -1,5 +1,7 @@
 import unittest
 import json
+from contextlib import contextmanager
+from sqlalchemy import event
 from app import create_app, db
 
 
@@ -54,3 +56,36 @@ class BaseTestCase(unittest.TestCase):
             data=json.dumps(user)
         )
         return response
+
+    def add_book(self, headers, title, isbn, year=2016, authors=None):
+        book = {
+            'title': title,
+            'isbn': isbn,
+            'year': year,
+            'authors': authors or [{'firstname': 'Kenneth', 'lastname': 'Reitz'}],
+        }
+        response = self.client.post(
+            '/api/v1/books/',
+            headers=headers,
+            data=json.dumps(book)
+        )
+        return response
+
+    @contextmanager
+    def assert_num_queries(self, expected):
+        """Asserts the number of SQL statements executed inside the block"""
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+        self.assertEqual(len(statements), expected, '\n'.join(statements))
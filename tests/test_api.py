@@ -1,5 +1,6 @@
 import unittest
 import json
+from app import db
 from tests.base_case import BaseTestCase
 
 
@@ -48,6 +49,681 @@ class APITestCase(BaseTestCase):
         self.assertIsNotNone(url)
         self.assertEqual(title, "The Hitchhiker's Guide to Python: Best Practices for Development")
 
+    def test_booklist_resource_pagination(self):
+        headers_with_auth = self.get_headers_with_auth()
+        for i in range(3):
+            response = self.add_book(headers_with_auth, 'Book {}'.format(i), 9781491933170 + i)
+            self.assertEqual(response.status_code, 201)
+
+        # first page
+        response = self.client.get(
+            '/api/v1/books/?limit=2&sort=-isbn',
+            headers=self.get_api_headers(),
+        )
+        self.assertEqual(response.status_code, 200)
+        titles = [book['title'] for book in json.loads(response.data)]
+        self.assertEqual(titles, ['Book 2', 'Book 1'])
+        self.assertIn('rel="next"', response.headers['Link'])
+        cursor = response.headers['X-Next-Cursor']
+
+        # last page
+        response = self.client.get(
+            '/api/v1/books/?limit=2&sort=-isbn&cursor={}'.format(cursor),
+            headers=self.get_api_headers(),
+        )
+        self.assertEqual(response.status_code, 200)
+        titles = [book['title'] for book in json.loads(response.data)]
+        self.assertEqual(titles, ['Book 0'])
+        self.assertNotIn('Link', response.headers)
+
+        # the cursor is bound to the sort order
+        response = self.client.get(
+            '/api/v1/books/?limit=2&cursor={}'.format(cursor),
+            headers=self.get_api_headers(),
+        )
+        self.assertEqual(response.status_code, 400)
+        error = json.loads(response.data).get('error')
+        self.assertEqual(error, 'Cursor does not match the sort order')
+
+        # sorting by a column not in the allowlist
+        response = self.client.get(
+            '/api/v1/books/?sort=password',
+            headers=self.get_api_headers(),
+        )
+        self.assertEqual(response.status_code, 400)
+        error = json.loads(response.data).get('error')
+        self.assertEqual(error, "Unable to sort by 'password'")
+
+    def test_booklist_resource_filters_and_year_sort(self):
+        headers_with_auth = self.get_headers_with_auth()
+        years = [2001, None, 2003, 2001, None]
+        for i, year in enumerate(years):
+            authors = [{'firstname': 'Author', 'lastname': str(i % 2)}]
+            response = self.add_book(headers_with_auth, 'Book {}'.format(i), 9781491933170 + i,
+                                     year=year, authors=authors)
+            self.assertEqual(response.status_code, 201)
+
+        def titles(url):
+            return [book['title'] for book in json.loads(self.client.get(url).data)]
+
+        self.assertEqual(titles('/api/v1/books/?year_min=2002'), ['Book 2'])
+        self.assertEqual(titles('/api/v1/books/?year_max=2002&author_id=1'), ['Book 0'])
+        self.assertEqual(titles('/api/v1/books/?isbn=9781491933173'), ['Book 3'])
+
+        # NULL years come last in descending order, pages walk over them
+        pages = []
+        url = '/api/v1/books/?sort=-year,title&limit=2&fields=title'
+        while url:
+            response = self.client.get(url)
+            pages.append([book['title'] for book in json.loads(response.data)])
+            url = response.headers.get('Link', '')[1:].split('>')[0]
+        self.assertEqual(pages, [['Book 2', 'Book 0'], ['Book 3', 'Book 1'], ['Book 4']])
+
+        # a deep page starts the index scan at the cursor instead of skipping the rows before it
+        from app.api.model.book import Book
+        from app.api.pagination import keyset_filter, parse_sort
+        from app.api.resources.books import BOOK_SORT_COLUMNS
+        with self.app.app_context():
+            order = parse_sort('-year,title', BOOK_SORT_COLUMNS)
+            query = db.session.query(Book.id).filter(keyset_filter(order, [2001, 'Book 0', 1]))
+            plan = db.session.execute('EXPLAIN QUERY PLAN ' + str(query.statement.compile(
+                db.engine, compile_kwargs={'literal_binds': True})))
+            self.assertIn('SEARCH', ' '.join(str(row) for row in plan))
+
+        self.assertEqual(titles('/api/v1/books/?sort=year&limit=3'), ['Book 1', 'Book 4', 'Book 0'])
+
+        response = self.client.get('/api/v1/books/?year_min=recent')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['error'], "'year_min' must be an integer")
+
+        # the books of an author are found by index
+        with self.app.app_context():
+            plan = db.session.execute('EXPLAIN QUERY PLAN SELECT author_id FROM book_author WHERE book_id = 1')
+            self.assertIn('ix_book_author_book_id', ' '.join(str(row) for row in plan))
+
+    def test_multi_get_by_ids(self):
+        headers_with_auth = self.get_headers_with_auth()
+        for i in range(3):
+            response = self.add_book(headers_with_auth, 'Book {}'.format(i), 9781491933170 + i)
+            self.assertEqual(response.status_code, 201)
+
+        # the table versions, one IN query for the rows and one for their authors
+        with self.assert_num_queries(3):
+            response = self.client.get('/api/v1/books/?ids=3,99,1,3&fields=title,authors&fields[authors]=lastname')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), [
+            {'title': 'Book 2', 'authors': [{'lastname': 'Reitz'}]},
+            {'id': 99, 'error': 'Not found'},
+            {'title': 'Book 0', 'authors': [{'lastname': 'Reitz'}]},
+            {'title': 'Book 2', 'authors': [{'lastname': 'Reitz'}]},
+        ])
+        self.assertIn('ETag', response.headers)
+
+        response = self.client.get('/api/v1/authors/?ids=1,2&embed=none')
+        authors = json.loads(response.data)
+        self.assertEqual(authors[0]['books'], [1, 2, 3])
+        self.assertEqual(authors[1], {'id': 2, 'error': 'Not found'})
+
+        response = self.client.get('/api/v1/books/?ids=1,two')
+        self.assertEqual(response.status_code, 400)
+
+        # the search, the filters and the sort would be ignored
+        response = self.client.get('/api/v1/books/?ids=1,2&q=book&year_min=2000&sort=year')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['error'],
+                         "'ids' can not be combined with 'sort', 'q', 'year_min'")
+        response = self.client.get('/api/v1/authors/?ids=1&limit=1')
+        self.assertEqual(response.status_code, 400)
+
+        self.app.config['API_MAX_PAGE_SIZE'] = 2
+        response = self.client.get('/api/v1/books/?ids=1,2,3')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['error'], "'ids' can list at most 2 ids")
+
+    def test_book_export(self):
+        self.app.config['API_EXPORT_BATCH_SIZE'] = 2
+        headers_with_auth = self.get_headers_with_auth()
+        for i in range(3):
+            response = self.add_book(headers_with_auth, 'Book {}'.format(i), 9781491933170 + i)
+            self.assertEqual(response.status_code, 201)
+
+        # NDJSON: one book per line
+        response = self.client.get('/api/v1/books/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = response.data.decode().splitlines()
+        titles = [json.loads(line)['title'] for line in lines]
+        self.assertEqual(titles, ['Book 0', 'Book 1', 'Book 2'])
+        self.assertEqual(json.loads(lines[0])['authors'][0]['lastname'], 'Reitz')
+
+        # JSON array
+        response = self.client.get('/api/v1/books/export?format=json')
+        self.assertEqual(response.status_code, 200)
+        titles = [book['title'] for book in json.loads(response.data)]
+        self.assertEqual(titles, ['Book 0', 'Book 1', 'Book 2'])
+
+        # authors with their books
+        response = self.client.get('/api/v1/authors/export?format=json')
+        self.assertEqual(response.status_code, 200)
+        authors = json.loads(response.data)
+        self.assertEqual(len(authors), 1)
+        self.assertEqual(len(authors[0]['books']), 3)
+
+        response = self.client.get('/api/v1/books/export?format=xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_does_not_depend_on_rows(self):
+        headers_with_auth = self.get_headers_with_auth()
+        for i in range(3):
+            authors = [
+                {'firstname': 'Kenneth', 'lastname': 'Reitz'},
+                {'firstname': 'Author', 'lastname': str(i)},
+            ]
+            response = self.add_book(headers_with_auth, 'Book {}'.format(i), 9781491933170 + i, authors=authors)
+            self.assertEqual(response.status_code, 201)
+
+        # the table versions, the rows and one SELECT ... IN for the nested relationship
+        with self.assert_num_queries(3):
+            response = self.client.get('/api/v1/books/')
+        self.assertEqual(len(json.loads(response.data)), 3)
+
+        with self.assert_num_queries(3):
+            response = self.client.get('/api/v1/authors/')
+        self.assertEqual(len(json.loads(response.data)), 4)
+
+        # the table versions, the row and its relationship
+        with self.assert_num_queries(3):
+            response = self.client.get('/api/v1/books/1')
+        self.assertEqual(len(json.loads(response.data)['authors']), 2)
+
+        with self.assert_num_queries(3):
+            response = self.client.get('/api/v1/authors/1')
+        self.assertEqual(len(json.loads(response.data)['books']), 3)
+
+    def test_patch_query_count(self):
+        headers_with_auth = self.get_headers_with_auth()
+        authors = [{'firstname': 'Kenneth', 'lastname': 'Reitz'}]
+        response = self.add_book(headers_with_auth, 'Book', 9781491933176, authors=authors)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(response.data)['authors'][0]['lastname'], 'Reitz')
+        self.assertIn('ETag', response.headers)
+
+        # the book with its authors, the table versions, the row, and the
+        # DELETE and INSERT of its search index row; the response is
+        # serialized from the updated book
+        with self.assert_num_queries(5):
+            response = self.client.patch(
+                '/api/v1/books/1',
+                headers=headers_with_auth,
+                data=json.dumps({'title': 'New Title'})
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['title'], 'New Title')
+
+        # the PATCH response is the representation the GET returns
+        book = self.client.get('/api/v1/books/1')
+        self.assertEqual(json.loads(book.data), json.loads(response.data))
+        self.assertEqual(book.headers['ETag'], response.headers['ETag'])
+
+        # one more SELECT finds all the authors, the missing one is added
+        authors.append({'firstname': 'Tanya', 'lastname': 'Schlusser'})
+        with self.assert_num_queries(8) as statements:
+            response = self.client.patch(
+                '/api/v1/books/1',
+                headers=headers_with_auth,
+                data=json.dumps({'authors': authors})
+            )
+        self.assertEqual(response.status_code, 200, '\n'.join(statements))
+        self.assertEqual([author['lastname'] for author in json.loads(response.data)['authors']],
+                         ['Reitz', 'Schlusser'])
+
+        # the author response is built the same way
+        with self.assert_num_queries(6):
+            response = self.client.patch(
+                '/api/v1/authors/2',
+                headers=headers_with_auth,
+                data=json.dumps({'firstname': 'Tania'})
+            )
+        self.assertEqual(response.status_code, 200)
+        author = self.client.get('/api/v1/authors/2')
+        self.assertEqual(json.loads(author.data), json.loads(response.data))
+        self.assertEqual(author.headers['ETag'], response.headers['ETag'])
+
+    def test_concurrent_patch_is_rejected(self):
+        from app.api.model.book import Book
+        from app.api.writes import update_book, WriteError
+
+        headers_with_auth = self.get_headers_with_auth()
+        response = self.add_book(headers_with_auth, 'Book', 9781491933176)
+        self.assertEqual(response.status_code, 201)
+
+        with self.app.app_context():
+            book = Book.query.get(1)
+            # another request updates the book after it was read
+            with db.engine.begin() as connection:
+                connection.execute(Book.__table__.update().values(title='Other', version=Book.version + 1))
+
+            with self.assertRaises(WriteError) as raised:
+                update_book(book, {'title': 'New Title'})
+            self.assertEqual(raised.exception.status_code, 409)
+            db.session.rollback()
+
+        response = self.client.get('/api/v1/books/1')
+        self.assertEqual(json.loads(response.data)['title'], 'Other')
+
+    def test_put_book_by_isbn(self):
+        headers_with_auth = self.get_headers_with_auth()
+        book = {
+            'title': 'Book',
+            'year': 2016,
+            'authors': [{'firstname': 'Kenneth', 'lastname': 'Reitz'},
+                        {'firstname': 'Tanya', 'lastname': 'Schlusser'}],
+        }
+
+        response = self.client.put(
+            '/api/v1/books/isbn/9781491933176',
+            headers=headers_with_auth,
+            data=json.dumps(book)
+        )
+        self.assertEqual(response.status_code, 201)
+        created = json.loads(response.data)
+        self.assertEqual(created['isbn'], 9781491933176)
+        self.assertEqual([author['lastname'] for author in created['authors']], ['Reitz', 'Schlusser'])
+
+        response = self.client.get('/api/v1/books/{}'.format(created['id']))
+        self.assertEqual(json.loads(response.data), created)
+
+        # the same request again updates the book, no duplicate is created:
+        # one INSERT ... ON CONFLICT per author and for the book, the DELETE
+        # of the removed links and the INSERT of the others, the table versions
+        # and the DELETE and INSERT of the search index row
+        book['title'] = 'New Title'
+        book['authors'] = book['authors'][1:]
+        with self.assert_num_queries(7):
+            response = self.client.put(
+                '/api/v1/books/isbn/9781491933176',
+                headers=headers_with_auth,
+                data=json.dumps(book)
+            )
+        self.assertEqual(response.status_code, 200)
+        updated = json.loads(response.data)
+        self.assertEqual(updated['id'], created['id'])
+        self.assertEqual(updated['title'], 'New Title')
+        self.assertEqual([author['id'] for author in updated['authors']], [created['authors'][1]['id']])
+
+        response = self.client.get('/api/v1/books/{}'.format(created['id']))
+        self.assertEqual(json.loads(response.data), updated)
+
+        response = self.client.get('/api/v1/authors/')
+        self.assertEqual(len(json.loads(response.data)), 2)
+
+        # the ISBN of the body must be the one of the URL
+        response = self.client.put(
+            '/api/v1/books/isbn/9781491933176',
+            headers=headers_with_auth,
+            data=json.dumps(dict(book, isbn=9781491933177))
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['error'], "'isbn' does not match the ISBN of the URL")
+
+        response = self.client.put(
+            '/api/v1/books/isbn/9781491933177',
+            headers=headers_with_auth,
+            data=json.dumps({'year': 2016})
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['title'][0], 'Missing data for required field.')
+
+    def test_book_bulk_import(self):
+        headers_with_auth = self.get_headers_with_auth()
+        response = self.add_book(headers_with_auth, 'Existing', 9781491933170)
+        self.assertEqual(response.status_code, 201)
+
+        books = [
+            {"title": "Book 1", "isbn": 9781491933171, "year": 2016,
+             "authors": [{"firstname": "Kenneth", "lastname": "Reitz"},
+                         {"firstname": "Tanya", "lastname": "Schlusser"}]},
+            {"title": "Book 2"},
+            {"title": "Book 3", "isbn": 9781491933170, "authors": []},
+            {"title": "Book 4", "isbn": 9781491933171, "authors": []},
+            {"title": "Book 5", "isbn": 9781491933175, "authors": [{"firstname": "Tanya", "lastname": "Schlusser"}]},
+        ]
+        response = self.client.post(
+            '/api/v1/books/bulk',
+            headers=headers_with_auth,
+            data=json.dumps(books)
+        )
+        self.assertEqual(response.status_code, 207)
+        response_data = json.loads(response.data)
+        self.assertEqual(response_data['created'], 2)
+        self.assertEqual(response_data['failed'], 3)
+        results = response_data['results']
+        self.assertEqual([result['status'] for result in results], [201, 400, 400, 400, 201])
+        self.assertEqual(results[1]['errors']['isbn'][0], 'Missing data for required field.')
+        self.assertEqual(results[2]['errors']['error'], 'A book with the same ISBN already exists')
+        self.assertEqual(results[3]['errors']['error'], 'A book with the same ISBN already exists')
+
+        response = self.client.get(results[0]['url'])
+        authors = sorted(author['lastname'] for author in json.loads(response.data)['authors'])
+        self.assertEqual(authors, ['Reitz', 'Schlusser'])
+
+        # existing authors are reused
+        response = self.client.get('/api/v1/authors/')
+        self.assertEqual(len(json.loads(response.data)), 2)
+
+        # NDJSON body
+        headers_with_auth['Content-Type'] = 'application/x-ndjson'
+        body = '\n'.join(json.dumps({"title": "Book {}".format(i), "isbn": i, "authors": []}) for i in range(3))
+        response = self.client.post(
+            '/api/v1/books/bulk',
+            headers=headers_with_auth,
+            data=body
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(response.data)['created'], 3)
+
+    def test_book_bulk_import_races_an_author(self):
+        from unittest import mock
+        from app.api.model.author import Author
+
+        find_ids = Author.find_ids
+
+        def find_ids_racing(names):
+            # another request creates the author after it was looked up
+            ids = find_ids(names)
+            if not racing:
+                with db.engine.begin() as connection:
+                    connection.execute(Author.__table__.insert(), {'firstname': 'Kenneth', 'lastname': 'Reitz'})
+                racing.append(True)
+            return ids
+
+        racing = []
+        books = [{"title": "Book", "isbn": 9781491933171,
+                  "authors": [{"firstname": "Kenneth", "lastname": "Reitz"}]}]
+        with mock.patch.object(Author, 'find_ids', side_effect=find_ids_racing):
+            response = self.client.post(
+                '/api/v1/books/bulk',
+                headers=self.get_headers_with_auth(),
+                data=json.dumps(books)
+            )
+        self.assertEqual(response.status_code, 201)
+
+        # the import ran again and linked the author of the other request
+        response = self.client.get('/api/v1/books/1')
+        self.assertEqual([author['id'] for author in json.loads(response.data)['authors']], [1])
+
+    def test_batch_operations(self):
+        headers_with_auth = self.get_headers_with_auth()
+        self.add_book(headers_with_auth, 'Book 0', 9781491933170)
+        self.add_book(headers_with_auth, 'Book 1', 9781491933171)
+
+        operations = [
+            {'method': 'create', 'resource': 'books', 'data': {
+                'title': 'Book 2', 'isbn': 9781491933172, 'year': 2018,
+                'authors': [{'firstname': 'New', 'lastname': 'Author'}],
+            }},
+            {'method': 'patch', 'resource': 'books', 'id': 1, 'data': {'title': 'Book Zero'}},
+            {'method': 'patch', 'resource': 'authors', 'id': 1, 'data': {'firstname': 'Ken'}},
+            {'method': 'delete', 'resource': 'books', 'id': 2},
+        ]
+        response = self.client.post('/api/v1/batch', headers=headers_with_auth, data=json.dumps(operations))
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.data)['results']
+        self.assertEqual([result['status'] for result in results], [201, 200, 200, 204])
+        self.assertEqual(results[0]['id'], 3)
+
+        response = self.client.get('/api/v1/books/?fields=title,authors&fields[authors]=firstname')
+        self.assertEqual(json.loads(response.data), [
+            {'title': 'Book Zero', 'authors': [{'firstname': 'Ken'}]},
+            {'title': 'Book 2', 'authors': [{'firstname': 'New'}]},
+        ])
+
+        # a failing operation rolls the whole batch back
+        operations = [
+            {'method': 'patch', 'resource': 'books', 'id': 1, 'data': {'title': 'Rolled Back'}},
+            {'method': 'create', 'resource': 'authors', 'data': {'firstname': 'New', 'lastname': 'Author'}},
+            {'method': 'delete', 'resource': 'books', 'id': 3},
+        ]
+        response = self.client.post('/api/v1/batch', headers=headers_with_auth, data=json.dumps(operations))
+        self.assertEqual(response.status_code, 400)
+        body = json.loads(response.data)
+        self.assertEqual(body['error'], 'Operation 1 failed, no operation was applied')
+        self.assertEqual(body['results'][1], {
+            'index': 1,
+            'status': 400,
+            'errors': {'error': 'An author with the same name already exists'},
+        })
+        response = self.client.get('/api/v1/books/1')
+        self.assertEqual(json.loads(response.data)['title'], 'Book Zero')
+
+        operations = [{'method': 'delete', 'resource': 'authors', 'id': 99}]
+        response = self.client.post('/api/v1/batch', headers=headers_with_auth, data=json.dumps(operations))
+        self.assertEqual(json.loads(response.data)['results'][0]['status'], 404)
+
+        # true is not the id 1
+        response = self.client.post('/api/v1/batch', headers=headers_with_auth, data=json.dumps([
+            {'method': 'delete', 'resource': 'books', 'id': True},
+        ]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['results'][0]['errors'], {'error': "'id' must be an integer"})
+        response = self.client.get('/api/v1/books/1')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post('/api/v1/batch', headers=self.get_api_headers(), data=json.dumps(operations))
+        self.assertEqual(response.status_code, 401)
+
+    def test_conditional_get(self):
+        headers_with_auth = self.get_headers_with_auth()
+        response = self.add_book(headers_with_auth, 'Book', 9781491933176)
+        self.assertEqual(response.status_code, 201)
+
+        # detail: strong ETag
+        response = self.client.get('/api/v1/books/1')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        response = self.client.get('/api/v1/books/1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        # list: weak ETag
+        response = self.client.get('/api/v1/authors/')
+        self.assertEqual(response.status_code, 200)
+        list_etag = response.headers['ETag']
+        self.assertTrue(list_etag.startswith('W/'))
+
+        with self.assert_num_queries(1):
+            response = self.client.get('/api/v1/authors/', headers={'If-None-Match': list_etag})
+        self.assertEqual(response.status_code, 304)
+
+        # renaming the author changes both representations
+        response = self.client.patch(
+            '/api/v1/authors/1',
+            headers=headers_with_auth,
+            data=json.dumps({'firstname': 'Ken'})
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/api/v1/books/1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(json.loads(response.data)['authors'][0]['firstname'], 'Ken')
+
+        response = self.client.get('/api/v1/authors/', headers={'If-None-Match': list_etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_response_cache(self):
+        headers_with_auth = self.get_headers_with_auth()
+        response = self.add_book(headers_with_auth, 'Book', 9781491933176)
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get('/api/v1/authors/1')
+        self.assertEqual(response.status_code, 200)
+
+        # only the table versions are read
+        with self.assert_num_queries(1):
+            cached_response = self.client.get('/api/v1/authors/1')
+        self.assertEqual(cached_response.data, response.data)
+        self.assertEqual(cached_response.headers['ETag'], response.headers['ETag'])
+
+        # a book write invalidates the authors embedding it
+        response = self.client.patch(
+            '/api/v1/books/1',
+            headers=headers_with_auth,
+            data=json.dumps({'title': 'New Title'})
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/api/v1/authors/1')
+        self.assertEqual(json.loads(response.data)['books'][0]['title'], 'New Title')
+
+        # the URLs of the body are built from the host of the request
+        self.client.get('/api/v1/authors/1', base_url='http://evil.example')
+        response = self.client.get('/api/v1/authors/1', base_url='https://api.good.com')
+        self.assertEqual(json.loads(response.data)['url'], 'https://api.good.com/api/v1/authors/1')
+
+        # the cache can be disabled
+        self.app.config['API_CACHE_MAX_BYTES'] = 0
+        with self.assert_num_queries(2):
+            response = self.client.get('/api/v1/authors/1')
+        self.assertEqual(response.status_code, 200)
+
+    def test_compiled_serializers_match_schemas(self):
+        # imported once the app has bound the session of the schemas
+        from app.api.model.book import Book
+        from app.api.model.author import Author
+        from app.api.resources.books import book_schema, book_serializer
+        from app.api.resources.authors import author_schema, author_serializer
+
+        headers_with_auth = self.get_headers_with_auth()
+        for i in range(3):
+            authors = [
+                {'firstname': 'Kenneth', 'lastname': 'Reitz'},
+                {'firstname': 'Author', 'lastname': str(i)},
+            ]
+            response = self.add_book(headers_with_auth, 'Book {}'.format(i), 9781491933170 + i, authors=authors)
+            self.assertEqual(response.status_code, 201)
+        self.add_book(headers_with_auth, 'No Year', 9781491933180, year=None)
+
+        with self.app.test_request_context():
+            for model, schema, serializer in ((Book, book_schema, book_serializer),
+                                              (Author, author_schema, author_serializer)):
+                expected = schema.dump(model.query.order_by(model.id).all(), many=True).data
+                result = serializer.dump(serializer.query().order_by(model.id).all())
+                self.assertEqual(json.dumps(result), json.dumps(expected))
+
+    def test_sparse_fieldsets(self):
+        headers_with_auth = self.get_headers_with_auth()
+        for i in range(3):
+            response = self.add_book(headers_with_auth, 'Book {}'.format(i), 9781491933170 + i)
+            self.assertEqual(response.status_code, 201)
+
+        # the table versions and the selected columns, the authors are not loaded
+        with self.assert_num_queries(2) as statements:
+            response = self.client.get('/api/v1/books/?fields=title,isbn&sort=-isbn&limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('book_author', statements[1])
+        self.assertNotIn('books.year', statements[1])
+        books = json.loads(response.data)
+        self.assertEqual([sorted(book) for book in books], [['isbn', 'title'], ['isbn', 'title']])
+        self.assertIn('X-Next-Cursor', response.headers)
+
+        response = self.client.get('/api/v1/books/1?fields[authors]=lastname')
+        book = json.loads(response.data)
+        self.assertEqual(book['authors'], [{'lastname': 'Reitz'}])
+        self.assertIn('url', book)
+
+        response = self.client.get('/api/v1/authors/1?fields=lastname,books&fields[books]=title')
+        self.assertEqual(json.loads(response.data), {
+            'lastname': 'Reitz',
+            'books': [{'title': 'Book 0'}, {'title': 'Book 1'}, {'title': 'Book 2'}],
+        })
+
+        response = self.client.get('/api/v1/books/export?fields=isbn')
+        self.assertEqual(json.loads(response.data.splitlines()[0]), {'isbn': 9781491933170})
+
+        response = self.client.get('/api/v1/books/?fields=title,price')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['error'], "Unknown field 'price'")
+
+        response = self.client.get('/api/v1/books/1?fields[title]=x')
+        self.assertEqual(response.status_code, 400)
+
+    def test_embed_relationships(self):
+        headers_with_auth = self.get_headers_with_auth()
+        for i in range(3):
+            response = self.add_book(headers_with_auth, 'Book {}'.format(i), 9781491933170 + i)
+            self.assertEqual(response.status_code, 201)
+
+        response = self.client.get('/api/v1/authors/1?embed=none')
+        author = json.loads(response.data)
+        self.assertEqual(author['books'], [1, 2, 3])
+        self.assertTrue(author['books_url'].endswith('/api/v1/authors/1/books/'))
+
+        response = self.client.get('/api/v1/books/?embed=authors')
+        self.assertEqual(json.loads(response.data)[0]['authors'][0]['lastname'], 'Reitz')
+
+        # the embedded records are capped, the sub-resource lists all of them
+        self.app.config['API_EMBED_LIMIT'] = 2
+        response = self.client.get('/api/v1/authors/1')
+        author = json.loads(response.data)
+        self.assertEqual([book['title'] for book in author['books']], ['Book 0', 'Book 1'])
+
+        response = self.client.get(author['books_url'] + '?fields=title&limit=2')
+        self.assertEqual(json.loads(response.data), [{'title': 'Book 0'}, {'title': 'Book 1'}])
+        response = self.client.get(response.headers['Link'][1:].split('>')[0])
+        self.assertEqual(json.loads(response.data), [{'title': 'Book 2'}])
+
+        response = self.client.get('/api/v1/books/1/authors/?embed=none')
+        self.assertEqual(json.loads(response.data)[0]['books'], [1, 2])
+
+        response = self.client.get('/api/v1/authors/1?embed=authors')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/api/v1/authors/2/books/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_full_text_search(self):
+        headers_with_auth = self.get_headers_with_auth()
+        self.add_book(headers_with_auth, 'Python Testing', 9781491933170,
+                      authors=[{'firstname': 'Brian', 'lastname': 'Okken'}])
+        self.add_book(headers_with_auth, 'Fluent Python', 9781491933171,
+                      authors=[{'firstname': 'Luciano', 'lastname': 'Ramalho'}])
+        self.add_book(headers_with_auth, 'Flask Web Development', 9781491933172,
+                      authors=[{'firstname': 'Miguel', 'lastname': 'Grinberg'}])
+
+        response = self.client.get('/api/v1/books/?q=python&fields=title')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(book['title'] for book in json.loads(response.data)),
+                         ['Fluent Python', 'Python Testing'])
+
+        # author names and prefixes match, results are paginated by rank
+        response = self.client.get('/api/v1/books/?q=ramal&fields=title')
+        self.assertEqual(json.loads(response.data), [{'title': 'Fluent Python'}])
+
+        response = self.client.get('/api/v1/books/?q=python&fields=title&limit=1')
+        first = json.loads(response.data)
+        response = self.client.get(response.headers['Link'][1:].split('>')[0])
+        second = json.loads(response.data)
+        self.assertEqual(len(first + second), 2)
+        self.assertNotEqual(first, second)
+
+        # the index follows the writes
+        self.client.patch('/api/v1/books/3', headers=headers_with_auth,
+                          data=json.dumps({'title': 'Flask and Python'}))
+        self.client.delete('/api/v1/books/1', headers=headers_with_auth)
+        self.client.patch('/api/v1/authors/2', headers=headers_with_auth,
+                          data=json.dumps({'lastname': 'Python'}))
+
+        response = self.client.get('/api/v1/books/?q=python&fields=title&sort=title')
+        self.assertEqual(json.loads(response.data), [{'title': 'Flask and Python'}, {'title': 'Fluent Python'}])
+        response = self.client.get('/api/v1/books/?q=ramalho')
+        self.assertEqual(json.loads(response.data), [])
+
+        response = self.client.get('/api/v1/books/?q=" *')
+        self.assertEqual(response.status_code, 400)
+
     def test_booklist_resource_creation_with_missed_field(self):
         book = {
             "title": "Python for 21 days",
@@ -0,0 +1,150 @@
+import unittest
+import asyncio
+import json
+from tests.base_case import BaseTestCase
+
+try:
+    import a2wsgi
+    import aiosqlite
+except ImportError:
+    a2wsgi = aiosqlite = None
+
+
+@unittest.skipIf(a2wsgi is None or aiosqlite is None, 'requires the packages of requirements-asgi.txt')
+class AsgiTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        from app.asgi import CatalogApp
+
+        self.asgi_app = CatalogApp(self.app)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.asgi_app.close())
+        self.loop.close()
+        super().tearDown()
+
+    def request(self, method, path, headers=None, body=b'', root_path=''):
+        """Sends a request to the ASGI application, returns the status, the headers and the body"""
+        headers = dict(headers or {})
+        if body:
+            headers['Content-Length'] = str(len(body))
+
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'root_path': root_path,
+            'query_string': b'',
+            'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            # The client stays connected until the response is sent
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            sent.append(message)
+
+        self.loop.run_until_complete(self.asgi_app(scope, receive, send))
+
+        start = sent[0]
+        response_headers = {name.decode().lower(): value.decode() for name, value in start['headers']}
+        body = b''.join(message.get('body', b'') for message in sent[1:])
+        return start['status'], response_headers, body
+
+    def test_cached_get_is_served_without_the_handler(self):
+        headers_with_auth = self.get_headers_with_auth()
+        status, _, _ = self.request('POST', '/api/v1/books/', headers_with_auth, json.dumps({
+            'title': 'Book',
+            'isbn': 9781491933176,
+            'year': 2016,
+            'authors': [{'firstname': 'Kenneth', 'lastname': 'Reitz'}],
+        }).encode())
+        self.assertEqual(status, 201)
+
+        # a miss, the Flask application fills the cache
+        status, headers, body = self.request('GET', '/api/v1/books/1')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode())['title'], 'Book')
+
+        with self.assert_num_queries(0):
+            status, cached_headers, cached_body = self.request('GET', '/api/v1/books/1')
+        self.assertEqual(status, 200)
+        self.assertEqual(cached_body, body)
+        self.assertEqual(cached_headers['etag'], headers['etag'])
+        self.assertEqual(cached_headers['content-length'], str(len(body)))
+
+        with self.assert_num_queries(0):
+            status, _, body = self.request('GET', '/api/v1/books/1', {'If-None-Match': headers['etag']})
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+
+        # the host is part of the key
+        status, _, body = self.request('GET', '/api/v1/books/1', {'Host': 'evil.example'})
+        self.assertEqual(json.loads(body.decode())['url'], 'http://evil.example/api/v1/books/1')
+        with self.assert_num_queries(0):
+            status, _, body = self.request('GET', '/api/v1/books/1')
+        self.assertEqual(json.loads(body.decode())['url'], 'http://localhost/api/v1/books/1')
+
+        # the CORS headers are added by the Flask application
+        with self.assert_num_queries(1):
+            status, headers, _ = self.request('GET', '/api/v1/books/1', {'Origin': 'http://example.com'})
+        self.assertEqual(status, 200)
+        self.assertIn('access-control-allow-origin', headers)
+
+        # a write changes the table versions of the key
+        status, _, _ = self.request('PATCH', '/api/v1/books/1', headers_with_auth,
+                                    json.dumps({'title': 'New Title'}).encode())
+        self.assertEqual(status, 200)
+        status, _, body = self.request('GET', '/api/v1/books/1')
+        self.assertEqual(json.loads(body.decode())['title'], 'New Title')
+
+    def test_cached_get_under_a_root_path_with_metrics(self):
+        from app import request_metrics
+
+        self.app.config['REQUEST_METRICS'] = True
+        request_metrics.init_app(self.app)
+
+        status, _, _ = self.request('POST', '/api/v1/books/', self.get_headers_with_auth(), json.dumps({
+            'title': 'Book',
+            'isbn': 9781491933176,
+            'year': 2016,
+            'authors': [],
+        }).encode())
+        self.assertEqual(status, 201)
+
+        status, headers, body = self.request('GET', '/api/v1/books/1', root_path='/catalog')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode())['url'], 'http://localhost/catalog/api/v1/books/1')
+        self.assertIn('x-db-queries', headers)
+
+        # the table versions are read by the async driver
+        with self.assert_num_queries(0):
+            status, cached_headers, cached_body = self.request('GET', '/api/v1/books/1', root_path='/catalog')
+        self.assertEqual(cached_body, body)
+        self.assertEqual(cached_headers['x-db-queries'], '1')
+        self.assertIn('server-timing', cached_headers)
+
+    def test_other_requests_run_the_flask_application(self):
+        status, _, _ = self.request('GET', '/api/v1/books/1')
+        self.assertEqual(status, 404)
+
+        status, _, body = self.request('POST', '/auth/registration', self.get_api_headers(),
+                                       json.dumps({'username': 'user1', 'password': 'user1'}).encode())
+        self.assertEqual(status, 201)
+        self.assertIn('access_token', json.loads(body.decode()))
+
+
+if __name__ == '__main__':
+    unittest.main()
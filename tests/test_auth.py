@@ -1,8 +1,15 @@
 import unittest
 import json
 import time
-from app import db
+import datetime
+from unittest import mock
+from flask_jwt_extended import decode_token
+from app import create_app, db, hasher, revoked_tokens
+from app.api.model.table_version import TableVersion
 from app.auth.model.user import User
+from app.auth.model.blacklist_token import BlacklistToken
+from app.auth.resources import get_claims_cache, user_schema, user_serializer
+from app.util.hashing import HasherBusy
 from tests.base_case import BaseTestCase
 
 
@@ -258,6 +265,229 @@ class TestAuthCase(BaseTestCase):
         )
         self.assertEqual(response.status_code, 204)
 
+    def test_token_revoked_by_another_worker(self):
+        self.app.config['JWT_BLACKLIST_REFRESH_INTERVAL'] = 0
+
+        # create admin user
+        user = User('admin', 'pass1', admin=True)
+        with self.app.app_context():
+            db.session.add(user)
+            db.session.commit()
+
+        response = self.login_user('admin', 'pass1')
+        data = json.loads(response.data.decode())
+        headers = self.get_api_headers()
+        headers.update({
+            'Authorization': 'Bearer {}'.format(data['access_token']),
+        })
+
+        response = self.client.get(
+            '/auth/blacklist/stats',
+            headers=headers,
+        )
+        data = json.loads(response.data.decode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['negatives'], 1)
+        self.assertEqual(data['hits'], 0)
+
+        # the token is revoked directly in the database, as another worker would do
+        access_token = headers['Authorization'].split()[1]
+        with self.app.app_context():
+            jti = decode_token(access_token)['jti']
+            db.session.add(BlacklistToken(jti=jti))
+            db.session.commit()
+
+        response = self.client.get(
+            '/auth/blacklist/stats',
+            headers=headers,
+        )
+        data = json.loads(response.data.decode())
+        self.assertTrue(data['message'] == 'Token has been revoked')
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_revoked_out_of_id_order(self):
+        now = datetime.datetime.now()
+        with self.app.app_context():
+            # the transaction of the first row commits after the second one
+            late = BlacklistToken(jti='late')
+            late.id = 1
+            early = BlacklistToken(jti='early')
+            early.id = 2
+            db.session.add(early)
+            db.session.commit()
+
+            revoked_tokens.refresh(force=True)
+            self.assertTrue(revoked_tokens.is_revoked('early'))
+            self.assertFalse(revoked_tokens.is_revoked('late'))
+
+            late.blacklisted_on = now - datetime.timedelta(seconds=1)
+            db.session.add(late)
+            db.session.commit()
+
+            revoked_tokens.refresh(force=True)
+            self.assertTrue(revoked_tokens.is_revoked('late'))
+
+    def test_prune_expired_blacklist_tokens(self):
+        now = datetime.datetime.now()
+        with self.app.app_context():
+            db.session.add(BlacklistToken(jti='expired-1', expires=now - datetime.timedelta(minutes=1)))
+            db.session.add(BlacklistToken(jti='expired-2', expires=now - datetime.timedelta(days=1)))
+            db.session.add(BlacklistToken(jti='valid', expires=now + datetime.timedelta(days=1)))
+            db.session.add(BlacklistToken(jti='forever'))
+            db.session.commit()
+
+            deleted = BlacklistToken.prune_expired(batch_size=1)
+            self.assertEqual(deleted, 2)
+            jtis = sorted(token.jti for token in BlacklistToken.query.all())
+            self.assertEqual(jtis, ['forever', 'valid'])
+
+    def test_prune_legacy_blacklist_tokens(self):
+        now = datetime.datetime.now()
+        with self.app.app_context():
+            # revoked before the expiration time was stored
+            legacy = BlacklistToken(jti='legacy')
+            legacy.blacklisted_on = now - datetime.timedelta(days=31)
+            db.session.add(legacy)
+            db.session.add(BlacklistToken(jti='recent'))
+            db.session.commit()
+
+            self.assertEqual(BlacklistToken.prune_expired(), 0)
+            deleted = BlacklistToken.prune_expired(max_lifetime=datetime.timedelta(days=30))
+            self.assertEqual(deleted, 1)
+            jtis = [token.jti for token in BlacklistToken.query.all()]
+            self.assertEqual(jtis, ['recent'])
+
+    def test_logout_stores_token_expiration(self):
+        response = self.register_user('user1', 'pass1')
+        data = json.loads(response.data.decode())
+        headers = self.get_api_headers()
+        headers.update({
+            'Authorization': 'Bearer {}'.format(data['access_token']),
+        })
+        response = self.client.post(
+            '/auth/logout/access',
+            headers=headers,
+        )
+        self.assertEqual(response.status_code, 200)
+
+        with self.app.app_context():
+            token = BlacklistToken.query.one()
+            self.assertGreater(token.expires, datetime.datetime.now())
+            self.assertLess(token.expires, datetime.datetime.now() + datetime.timedelta(seconds=6))
+
+    def test_token_issuance_uses_cached_claims(self):
+        response = self.register_user('user1', 'pass1')
+        data = json.loads(response.data.decode())
+        headers = self.get_api_headers()
+        headers.update({
+            'Authorization': 'Bearer {}'.format(data['refresh_token']),
+        })
+
+        # the first check loads the revoked tokens
+        response = self.client.post(
+            '/auth/token/refresh',
+            headers=headers,
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # the admin flag was cached when the first access token was issued,
+        # only the version of the users table is read
+        with self.assert_num_queries(1):
+            response = self.client.post(
+                '/auth/token/refresh',
+                headers=headers,
+            )
+        self.assertEqual(response.status_code, 200)
+
+        with self.app.app_context():
+            self.assertEqual(get_claims_cache().get('user1'), (1, False))
+
+        # another process, with its own cache, deletes the user and registers
+        # an admin with the same name
+        other = create_app('testing')
+        user = User('admin', 'pass1', admin=True)
+        with other.app_context():
+            db.session.add(user)
+            db.session.commit()
+        response = other.test_client().post(
+            '/auth/login',
+            headers=self.get_api_headers(),
+            data=json.dumps({'username': 'admin', 'password': 'pass1'})
+        )
+        admin_headers = self.get_api_headers()
+        admin_headers.update({
+            'Authorization': 'Bearer {}'.format(json.loads(response.data.decode())['access_token']),
+        })
+        response = other.test_client().delete(
+            '/auth/users/1',
+            headers=admin_headers,
+        )
+        self.assertEqual(response.status_code, 204)
+        with other.app_context():
+            db.session.add(User('user1', 'pass1', admin=True))
+            TableVersion.bump('users')
+            db.session.commit()
+
+        # the cached flag of this process is not used anymore
+        response = self.login_user('user1', 'pass1')
+        access_token = json.loads(response.data.decode())['access_token']
+        with self.app.test_request_context():
+            self.assertIs(decode_token(access_token)['user_claims']['admin'], True)
+
+    def test_password_rehashed_on_login_when_cost_changes(self):
+        self.register_user('user1', 'pass1')
+        with self.app.app_context():
+            self.assertTrue(User.find_by_username('user1').password.startswith('$2b$04$'))
+
+        hasher.log_rounds = 5
+        response = self.login_user('user1', 'pass1')
+        self.assertEqual(response.status_code, 200)
+        with self.app.app_context():
+            self.assertTrue(User.find_by_username('user1').password.startswith('$2b$05$'))
+
+        # the new hash is valid
+        response = self.login_user('user1', 'pass1')
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_when_rehash_is_busy(self):
+        self.register_user('user1', 'pass1')
+
+        # the rehash is skipped, the tokens are still issued
+        hasher.log_rounds = 5
+        with mock.patch.object(hasher, 'generate_password_hash', side_effect=HasherBusy):
+            response = self.login_user('user1', 'pass1')
+        data = json.loads(response.data.decode())
+        self.assertTrue(data['access_token'])
+        self.assertEqual(response.status_code, 200)
+        with self.app.app_context():
+            self.assertTrue(User.find_by_username('user1').password.startswith('$2b$04$'))
+
+    def test_password_hashing_in_process_pool(self):
+        hasher.pool_size = 1
+        response = self.register_user('user1', 'pass1')
+        self.assertEqual(response.status_code, 201)
+        response = self.login_user('user1', 'pass1')
+        self.assertEqual(response.status_code, 200)
+        response = self.login_user('user1', 'pass2')
+        self.assertEqual(response.status_code, 403)
+
+        # no free slot in the queue
+        while hasher._slots.acquire(blocking=False):
+            pass
+        response = self.login_user('user1', 'pass1')
+        data = json.loads(response.data.decode())
+        self.assertEqual(data['message'], 'Server is busy, try again later')
+        self.assertEqual(response.status_code, 503)
+
+    def test_compiled_user_serializer_matches_schema(self):
+        self.register_user('user1', 'user1')
+        self.register_user('user2', 'user2')
+
+        with self.app.test_request_context():
+            expected = user_schema.dump(User.query.order_by(User.id).all(), many=True).data
+            result = user_serializer.dump(user_serializer.query().order_by(User.id).all())
+            self.assertEqual(json.dumps(result), json.dumps(expected))
+
     def test_valid_blacklisted_token_logout(self):
         # user registration
         username = 'user1'
@@ -1,8 +1,10 @@
 import os
+import tempfile
 import unittest
 from datetime import timedelta
-from app import create_app
-from config import basedir
+from sqlalchemy.pool import QueuePool
+from app import create_app, db
+from config import basedir, ProductionConfig
 
 
 class TestDevelopmentConfig(unittest.TestCase):
@@ -29,6 +31,8 @@ class TestTestingConfig(unittest.TestCase):
         self.assertTrue(self.app.config['SECRET_KEY'] == 'my_precious_secret_key')
         self.assertTrue(self.app.config['JWT_SECRET_KEY'] == 'jwt-secret-string')
         self.assertTrue(self.app.config['JWT_ACCESS_TOKEN_EXPIRES'] == timedelta(seconds=5))
+        self.assertTrue(self.app.config['BCRYPT_LOG_ROUNDS'] == 4)
+        self.assertTrue(self.app.config['BCRYPT_POOL_SIZE'] == 0)
         self.assertTrue(
             self.app.config['SQLALCHEMY_DATABASE_URI'] == 'sqlite:///' + os.path.join(basedir, 'books_test.db')
         )
@@ -49,5 +53,39 @@ class TestProductionConfig(unittest.TestCase):
         self.assertFalse(self.app.config['ADMIN_PASSWORD'] == 'password')
 
 
+class TestEngineProfile(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+
+        self.app = create_app('testing')
+        self.app.config.update(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + self.path,
+            SQLALCHEMY_POOL_SIZE=2,
+            SQLALCHEMY_POOL_PRE_PING=True,
+            SQLALCHEMY_SQLITE_PRAGMAS=ProductionConfig.SQLALCHEMY_SQLITE_PRAGMAS,
+        )
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_sqlite_engine_profile(self):
+        with self.app.app_context():
+            self.assertIsInstance(db.engine.pool, QueuePool)
+            self.assertTrue(db.engine.pool._pre_ping)
+
+            self.assertEqual(db.session.execute('PRAGMA journal_mode').scalar(), 'wal')
+            self.assertEqual(db.session.execute('PRAGMA busy_timeout').scalar(), 5000)
+            # NORMAL
+            self.assertEqual(db.session.execute('PRAGMA synchronous').scalar(), 1)
+            self.assertEqual(db.session.execute('PRAGMA cache_size').scalar(), -64 * 1024)
+
+
 if __name__ == "__main__":
     unittest.main()
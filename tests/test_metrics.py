@@ -0,0 +1,55 @@
+import unittest
+import json
+from tests.base_case import BaseTestCase
+
+
+class RequestMetricsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['API_CACHE_MAX_BYTES'] = 0
+
+    def enable(self, **budgets):
+        from app import request_metrics
+
+        self.app.config.update(REQUEST_METRICS=True, **budgets)
+        request_metrics.init_app(self.app)
+
+    def test_disabled_by_default(self):
+        response = self.client.get('/api/v1/books/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-DB-Queries', response.headers)
+        self.assertNotIn('Server-Timing', response.headers)
+
+    def test_headers(self):
+        self.enable()
+        headers_with_auth = self.get_headers_with_auth()
+        response = self.add_book(headers_with_auth, 'Book', 9781491933176)
+        self.assertEqual(response.status_code, 201)
+
+        with self.assert_num_queries(2) as statements:
+            response = self.client.get('/api/v1/books/1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-DB-Queries'], str(len(statements)))
+        self.assertGreater(float(response.headers['X-DB-Time-Ms']), 0)
+        self.assertRegex(response.headers['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="2 queries", app;dur=[\d.]+$')
+
+        # the errors are measured too
+        response = self.client.get('/api/v1/books/2')
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('X-DB-Queries', response.headers)
+
+    def test_budgets(self):
+        self.enable(REQUEST_METRICS_QUERY_BUDGET=1)
+        headers_with_auth = self.get_headers_with_auth()
+        self.add_book(headers_with_auth, 'Book', 9781491933176)
+
+        with self.assertLogs('app.util.metrics', 'WARNING') as logs:
+            response = self.client.get('/api/v1/books/1')
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('GET /api/v1/books/1 (api.bookresource): 2 queries', logs.output[0])
+        self.assertEqual(json.loads(response.data.decode())['title'], 'Book')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+import json
+import os
+import shutil
+import sqlite3
+import time
+from sqlalchemy.engine.url import make_url
+from app import db
+from app.auth.model.user import User
+from config import basedir
+from tests.base_case import BaseTestCase
+
+
+class ReplicaTestCase(BaseTestCase):
+    """A second SQLite file stands in for the replica, replicated by copying the primary"""
+
+    def setUp(self):
+        super().setUp()
+        self.primary_path = make_url(self.app.config['SQLALCHEMY_DATABASE_URI']).database
+        self.replica_path = os.path.join(basedir, 'books_replica_test.db')
+
+        self.app.config.update(
+            SQLALCHEMY_BINDS={'replica': 'sqlite:///' + self.replica_path},
+            SQLALCHEMY_REPLICA_BINDS=['replica'],
+            SQLALCHEMY_REPLICA_CHECK_INTERVAL=0,
+            API_CACHE_MAX_BYTES=0,
+        )
+        db.replicas.init_app(self.app)
+
+    def tearDown(self):
+        super().tearDown()
+        if os.path.exists(self.replica_path):
+            os.remove(self.replica_path)
+
+    def replicate(self, title=None):
+        """Copies the primary to the replica, `title` then marks the rows read from the replica"""
+        shutil.copyfile(self.primary_path, self.replica_path)
+
+        if title is not None:
+            connection = sqlite3.connect(self.replica_path)
+            with connection:
+                connection.execute('UPDATE books SET title = ?', (title,))
+            connection.close()
+
+    def get_title(self):
+        response = self.client.get('/api/v1/books/1')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)['title']
+
+    def test_reads_from_a_replica_in_sync(self):
+        headers_with_auth = self.get_headers_with_auth()
+        response = self.add_book(headers_with_auth, 'Book', 9781491933176)
+        self.assertEqual(response.status_code, 201)
+
+        # the replica has no tables yet
+        self.assertEqual(self.get_title(), 'Book')
+        self.assertEqual(db.replicas.lags(), {'replica': None})
+
+        self.replicate(title='Replica')
+        self.assertEqual(self.get_title(), 'Replica')
+        response = self.client.get('/api/v1/books/')
+        self.assertEqual(json.loads(response.data)[0]['title'], 'Replica')
+
+        # a failing replica is not used
+        os.remove(self.replica_path)
+        os.mkdir(self.replica_path)
+        try:
+            self.assertEqual(self.get_title(), 'Book')
+        finally:
+            os.rmdir(self.replica_path)
+
+    def test_read_your_own_writes(self):
+        headers_with_auth = self.get_headers_with_auth()
+        response = self.add_book(headers_with_auth, 'Book', 9781491933176)
+        self.assertEqual(response.status_code, 201)
+
+        self.replicate(title='Replica')
+        self.assertEqual(self.get_title(), 'Replica')
+
+        response = self.client.patch(
+            '/api/v1/books/1',
+            headers=headers_with_auth,
+            data=json.dumps({'title': 'New Title'})
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # the replica lacks the commit
+        self.assertEqual(self.get_title(), 'New Title')
+
+        self.replicate(title='Replica')
+        self.assertEqual(self.get_title(), 'Replica')
+
+    def test_other_clients_keep_reading_from_the_replica(self):
+        headers_with_auth = self.get_headers_with_auth()
+        response = self.add_book(headers_with_auth, 'Book', 9781491933176)
+        self.assertEqual(response.status_code, 201)
+
+        self.replicate(title='Replica')
+        self.assertEqual(self.get_title(), 'Replica')
+
+        response = self.client.patch(
+            '/api/v1/books/1',
+            headers=headers_with_auth,
+            data=json.dumps({'title': 'New Title'})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('read_after=', response.headers['Set-Cookie'])
+
+        # the replica lags less than REPLICA_MAX_LAG behind the primary
+        response = self.app.test_client().get('/api/v1/books/1')
+        self.assertEqual(json.loads(response.data)['title'], 'Replica')
+
+        # the writer sends the versions it wrote
+        self.assertEqual(self.get_title(), 'New Title')
+
+    def test_lagging_replica_falls_back_to_the_primary(self):
+        headers_with_auth = self.get_headers_with_auth()
+        response = self.add_book(headers_with_auth, 'Book', 9781491933176)
+        self.assertEqual(response.status_code, 201)
+
+        self.replicate(title='Replica')
+        self.assertEqual(self.get_title(), 'Replica')
+
+        # no check confirms the replica is still in sync
+        db.replicas.check_interval = 60
+        db.replicas.max_lag = 0.1
+        time.sleep(0.2)
+
+        self.assertGreater(db.replicas.lags()['replica'], 0.1)
+        self.assertEqual(self.get_title(), 'Book')
+
+    def test_registered_user_is_listed_by_the_same_client(self):
+        with self.app.app_context():
+            db.session.add(User('admin', 'admin', admin=True))
+            db.session.commit()
+        response = self.login_user('admin', 'admin')
+        headers = self.get_api_headers()
+        headers['Authorization'] = 'Bearer {}'.format(json.loads(response.data)['access_token'])
+
+        def usernames():
+            response = self.client.get('/auth/users/', headers=headers)
+            self.assertEqual(response.status_code, 200)
+            return [user['username'] for user in json.loads(response.data)]
+
+        self.replicate()
+        self.assertEqual(usernames(), ['admin'])
+
+        response = self.register_user('user2', 'user2')
+        self.assertEqual(response.status_code, 201)
+
+        # the replica lacks the registration
+        self.assertEqual(usernames(), ['admin', 'user2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
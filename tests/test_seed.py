@@ -0,0 +1,47 @@
+import unittest
+import json
+from sqlalchemy import func
+from app import db
+from tests.base_case import BaseTestCase
+
+
+class SeedTestCase(BaseTestCase):
+    def test_generate_dataset(self):
+        from app.api.model.author import Author
+        from app.api.model.book import Book, book_author
+        from app.api.model.table_version import TableVersion
+        from app.seed import generate_dataset
+
+        with self.app.app_context():
+            counts = generate_dataset(200, 20, 3, authors_per_book=(0, 1), year_min=2000, year_max=2001,
+                                      random_seed=1)
+            self.assertEqual(counts['books'], 200)
+            self.assertEqual(counts['users'], 3)
+
+            # books of two authors, or one when both picks are the same author
+            per_book = db.session.query(func.count()).select_from(book_author).group_by(book_author.c.book_id)
+            self.assertLessEqual({count for count, in per_book}, {1, 2})
+            self.assertEqual(db.session.query(func.count()).select_from(book_author).scalar(),
+                             counts['book_authors'])
+            self.assertEqual({year for year, in db.session.query(Book.year).distinct()}, {2000, 2001})
+            self.assertEqual(db.session.query(func.count(Author.id)).scalar(), 20)
+            self.assertEqual(TableVersion.get_versions('authors', 'books'), (1, 1))
+
+            # the new rows follow the existing ones
+            counts = generate_dataset(10, 5, 1, random_seed=1)
+            self.assertEqual(db.session.query(func.max(Book.id)).scalar(), 210)
+            self.assertEqual(db.session.query(func.count(Author.id)).scalar(), 25)
+
+            title = Book.query.get(1).title
+
+        # the books are in the search index, the users log in
+        response = self.client.get('/api/v1/books/?q={}'.format(title.split()[0]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(1, [book['id'] for book in json.loads(response.data.decode())])
+
+        response = self.login_user('user4', 'password')
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()